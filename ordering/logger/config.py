@@ -2,14 +2,14 @@
 Logging config for Ordering Scripts.
 """
 import os, yaml
-from pkg_resources import resource_stream
+from importlib.resources import files
 
 
 def load_config(name = "default"):
     """
     Loads a built-in stock logging configuration based on *name*.
     """
-    with resource_stream(__package__, f"config/{name}.yaml") as file:
+    with files(__package__).joinpath(f"config/{name}.yaml").open("rb") as file:
         return yaml.load(file, Loader = LogConfigLoader)
 
 
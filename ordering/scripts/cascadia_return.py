@@ -1,40 +1,67 @@
 #!/usr/bin/env python3
-import envdir, os, logging, sys, argparse
+import os, logging, sys, argparse
 
 BASE_DIR = os.path.abspath(__file__ + "/../../../")
 sys.path.append(BASE_DIR)
 
-from ordering.utils.redcap import init_project, get_redcap_report, format_longitudinal, import_records_batched
-from ordering.utils.delivery_express import get_de_orders, format_orders_import
-from ordering.utils.cascadia import filter_cascadia_orders
-
-envdir.open(os.path.join(BASE_DIR, '.env/de'))
-envdir.open(os.path.join(BASE_DIR, '.env/redcap'))
+# pandas, PyCap and the order utilities are imported where they are used, so
+# `--help` and runs failing on their arguments start without loading them.
+from ordering.utils.report_cache import ReportCache, DEFAULT_CACHE_TTL
+from ordering.utils.redcap_metadata import MetadataCache
+from ordering.utils.instrumentation import instrument_run, stage
 
 LOG = logging.getLogger('ordering.scripts.cascadia_return')
 PROJECT = "Cascadia"
 
 def main(args):
-    redcap_project = init_project(PROJECT)
-    redcap_orders = get_redcap_report(redcap_project, PROJECT)
-    redcap_enrollments = get_redcap_report(redcap_project, PROJECT, 2401)
+    from ordering.utils.redcap import init_project, get_redcap_report, format_longitudinal, import_records_batched, set_report_cache, set_metadata_cache
+    from ordering.utils.delivery_express import DeliveryExpressClient, format_orders_import
+    from ordering.utils.cascadia import filter_cascadia_orders
+
+    import envdir
+    envdir.open(os.path.join(BASE_DIR, '.env/de'))
+    envdir.open(os.path.join(BASE_DIR, '.env/redcap'))
+
+    # reports are only reused when asked for, since a stale report can place or import an order twice
+    if args.cache:
+        set_report_cache(ReportCache(os.path.join(BASE_DIR, 'data/cache'), ttl=args.cache_ttl, refresh=args.refresh))
+    set_metadata_cache(MetadataCache(os.path.join(BASE_DIR, 'data/cache/metadata'), refresh=args.refresh))
+
+    with stage('export_reports', project=PROJECT) as record:
+        redcap_project = init_project(PROJECT)
+        redcap_orders = get_redcap_report(redcap_project, PROJECT)
+        redcap_enrollments = get_redcap_report(redcap_project, PROJECT, 2401)
+        record.rows_out = len(redcap_orders)
 
     if len(redcap_orders) == 0:
         LOG.info(f'No orders to process, exiting...')
         return
 
-    redcap_orders = format_longitudinal(redcap_orders, PROJECT)
-    redcap_orders = filter_cascadia_orders(redcap_orders, redcap_enrollments)
+    with stage('format_longitudinal', len(redcap_orders), project=PROJECT) as record:
+        redcap_orders = format_longitudinal(redcap_orders, PROJECT)
+        record.rows_out = len(redcap_orders)
+
+    with stage('filter_orders', len(redcap_orders), project=PROJECT) as record:
+        redcap_orders = filter_cascadia_orders(redcap_orders, redcap_enrollments)
+        record.rows_out = len(redcap_orders)
 
     redcap_orders = redcap_orders.astype({'Record Id': int})
-    redcap_orders['orderId'] = redcap_orders.dropna(
-        subset=['Record Id']).apply(get_de_orders, axis=1, max_retries=5
-    )
+    de_client = DeliveryExpressClient(os.environ['AUTHORIZATION'], concurrency=args.de_concurrency, max_retries=5)
+    pending_orders = redcap_orders.dropna(subset=['Record Id'])
+
+    with stage('lookup_de_orders', len(pending_orders), project=PROJECT) as record:
+        if args.de_bulk:
+            redcap_orders['orderId'] = de_client.lookup_orders_bulk(pending_orders)
+        else:
+            redcap_orders['orderId'] = de_client.lookup_orders(pending_orders)
+        record.rows_out = int(redcap_orders['orderId'].notna().sum())
+
     formatted_import = format_orders_import(redcap_orders)
 
     if len(formatted_import):
         if args.import_to_redcap:
-            import_records_batched(redcap_project, formatted_import)
+            with stage('import_records', len(formatted_import), project=PROJECT):
+                import_records_batched(redcap_project, formatted_import)
             LOG.info(f'Imported {len(formatted_import)} new return orders to REDCap.')
         else:
             LOG.info(f'Skipping import to REDCap due to <--import={args.import_to_redcap}>.')
@@ -45,5 +72,13 @@ def main(args):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Update REDCap records with existing orders from the Delivery Express API.')
     parser.add_argument('--import-to-redcap', action='store_true', help='Flag to indicate whether order numbers should be imported into REDCap.')
+    parser.add_argument('--de-concurrency', type=int, default=4, help='Number of concurrent requests to make to the Delivery Express API.')
+    parser.add_argument('--de-bulk', action='store_true', help='Flag to fetch all recent Delivery Express orders at once instead of searching once per order.')
+    parser.add_argument('--cache', action='store_true', help='Flag to reuse REDCap reports exported within the last --cache-ttl seconds instead of always fetching them.')
+    parser.add_argument('--refresh', action='store_true', help='Flag to fetch REDCap reports and project metadata again, overwriting any cached exports.')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL, help='Number of seconds a cached REDCap report may be reused for.')
+    parser.add_argument('--profile', action='store_true', help='Flag to profile the run with cProfile and tracemalloc, writing a report to the data directory.')
 
-    main(parser.parse_args())
+    args = parser.parse_args()
+    with instrument_run('cascadia_return', args.profile, os.path.join(BASE_DIR, 'data')):
+        main(args)
@@ -1,72 +1,41 @@
 #!/usr/bin/env python3
-import sys, logging, os, datetime, envdir, argparse
-import pandas as pd
+import sys, logging, os, datetime, argparse
+from concurrent.futures import ThreadPoolExecutor
 
 # We are limited in that we run these functions as scripts, so have to manually
 # place utilities within our path.
 BASE_DIR = os.path.abspath(__file__ + "/../../../")
 sys.path.append(BASE_DIR)
 
-from ordering.utils.redcap import init_project, get_redcap_report, format_longitudinal
-from ordering.utils.common import DE_EXPORT_COLS, LOGISTICS_S3_BUCKET, LOGISTICS_DE_PATH, format_id, export_orders
-from ordering.utils.cascadia import filter_cascadia_orders
-from ordering.utils.airs import filter_airs_orders
-from ordering.utils.hct import filter_hct_orders
-from etc.ordering_script_config_map import PROJECT_DICT
-
-envdir.open(os.path.join(BASE_DIR, '.env/redcap'))
+# pandas, PyCap and the order utilities are imported where they are used, so
+# `--help` and runs failing on their arguments start without loading them.
+from ordering.utils.report_cache import ReportCache, DEFAULT_CACHE_TTL
+from ordering.utils.redcap_metadata import MetadataCache
+from ordering.utils.instrumentation import instrument_run, stage
 
 LOG = logging.getLogger('ordering.scripts.delivery_express')
 
+# Reports each project's orders are generated from, the order report (`None`)
+# first. Cascadia orders also need its enrollment report.
+PROJECT_REPORTS = {'Cascadia': [None, 2401]}
+
 
 def main(args):
     '''Gets orders from redcap and combine them in a csv file'''
-    order_export = pd.DataFrame(columns=DE_EXPORT_COLS, dtype='string')
-
-    for project in PROJECT_DICT:
-        LOG.info(f'Generating Kit Orders for <{project}>')
-
-        redcap_project = init_project(project)
-        orders = get_redcap_report(redcap_project, project)
-        enrollment_records = get_redcap_report(redcap_project, project, 2401) if project == 'Cascadia' else None
-
-        num_orders = len(orders.index.get_level_values(0))
-        LOG.info(f'Started with <{num_orders}> possible new kit orders in <{project}>.')
-
-        if num_orders:
-            orders = format_longitudinal(orders, project)
-
-            if project == 'HCT':
-                orders = filter_hct_orders(orders)
-
-            elif project == 'AIRS':
-                orders = filter_airs_orders(orders)
-
-            elif project == 'Cascadia':
-                orders = filter_cascadia_orders(orders, enrollment_records)
+    import pandas as pd
+    from ordering.utils.redcap import set_report_cache, set_metadata_cache
+    from ordering.utils.common import LOGISTICS_S3_BUCKET, LOGISTICS_DE_PATH, export_orders
+    from etc.ordering_script_config_map import PROJECT_DICT
 
-            orders = format_id(orders, project)
+    import envdir
+    envdir.open(os.path.join(BASE_DIR, '.env/redcap'))
 
-            # Some columns can be typed as a float64 (X.X) which causes issues with the
-            # import to delivery express. Downcast those columns.
-            orders['Today Tomorrow'] = pd.to_numeric(
-                orders['Today Tomorrow'], downcast='integer'
-            )
-            orders['Zipcode'] = pd.to_numeric(
-                orders['Zipcode'], downcast='integer'
-            )
+    # reports are only reused when asked for, since a stale report can place or import an order twice
+    if args.cache:
+        set_report_cache(ReportCache(os.path.join(BASE_DIR, 'data/cache'), ttl=args.cache_ttl, refresh=args.refresh))
+    set_metadata_cache(MetadataCache(os.path.join(BASE_DIR, 'data/cache/metadata'), refresh=args.refresh))
 
-            # Subset orders by export desired columns
-            orders = orders[
-                orders.columns.intersection(DE_EXPORT_COLS)
-            ]
-
-            LOG.debug(f'Appending <{len(orders)}> from <{project}> to the order sheet.')
-            order_export = pd.concat([order_export, orders], ignore_index=True)
-
-            LOG.info(f'<{len(order_export)}> total orders after concatenation of <{project}> orders.')
-        else:
-            LOG.info(f'Skipping orders for <{project}>, nothing in the report. <{len(order_export)}> total orders.')
+    order_export, failed_projects = generate_orders(PROJECT_DICT)
 
     # format the apt number nicely if it exists
     order_export['Apt Number'] = order_export['Apt Number'].apply(
@@ -79,21 +48,135 @@ def main(args):
     outfile_name = f'DeliveryExpressOrder{datetime.datetime.now().strftime("%Y_%m_%d_%H_%M")}.csv'
 
     if args.save:
-        export_orders(order_export, os.path.join(BASE_DIR, f'data/{outfile_name}'))
+        with stage('save_orders', len(order_export)):
+            export_orders(order_export, os.path.join(BASE_DIR, f'data/{outfile_name}'))
         LOG.info(f'Successfully saved orders to <{os.path.join(BASE_DIR, f"data/{outfile_name}")}>.')
     else:
         LOG.debug(f"Skipping order save to disk with <--save={args.save}.>")
 
     if args.s3_upload:
-        export_orders(order_export, f's3://{LOGISTICS_S3_BUCKET}/{LOGISTICS_DE_PATH}/{outfile_name}', s3=True)
+        with stage('upload_orders', len(order_export)):
+            export_orders(order_export, f's3://{LOGISTICS_S3_BUCKET}/{LOGISTICS_DE_PATH}/{outfile_name}', s3=True)
         LOG.info(f'Successfully uploaded DE orders to <{LOGISTICS_S3_BUCKET}/{LOGISTICS_DE_PATH}/{outfile_name}>')
     else:
         LOG.debug(f'Skipping order upload to S3 with <--s3-upload={args.s3_upload}>.')
 
+    if failed_projects:
+        LOG.error(f'No kit orders were generated for <{failed_projects}>.')
+        sys.exit(1)
+
+
+def generate_orders(projects):
+    '''
+    Generate DE orders for every one of `projects`, returning the combined
+    orders and a list of the projects orders could not be generated for.
+    '''
+    import pandas as pd
+    from ordering.utils.common import DE_EXPORT_COLS
+
+    # Each project lives on its own REDCap server, so every report of every project
+    # is fetched at once and a failure in one project does not hold up the rest.
+    report_ids = {project: PROJECT_REPORTS.get(project, [None]) for project in projects}
+    with ThreadPoolExecutor(max_workers=sum(map(len, report_ids.values()))) as executor:
+        reports = {
+            project: [executor.submit(fetch_project_report, project, report_id) for report_id in report_ids[project]]
+            for project in projects
+        }
+
+    project_orders, failed_projects = [], []
+    for project, project_reports in reports.items():
+        try:
+            orders = generate_project_orders(project, *[report.result() for report in project_reports])
+        except Exception:
+            LOG.exception(f'Failed to generate kit orders for <{project}>, continuing with the remaining projects.')
+            failed_projects.append(project)
+            continue
+
+        if orders is not None:
+            project_orders.append(orders)
+
+    order_export = pd.concat(
+        [pd.DataFrame(columns=DE_EXPORT_COLS, dtype='string'), *project_orders], ignore_index=True
+    )
+    LOG.info(f'<{len(order_export)}> total orders after concatenation of all project orders.')
+
+    return order_export, failed_projects
+
+
+def fetch_project_report(project, report_id = None):
+    '''Fetch report `report_id` of a `project`, its order report by default'''
+    from ordering.utils.redcap import init_project, get_redcap_report
+
+    with stage('export_report', project=project, report_id=report_id) as record:
+        report = get_redcap_report(init_project(project), project, report_id)
+        record.rows_out = len(report)
+
+    return report
+
+
+def generate_project_orders(project, orders, enrollment_records = None):
+    '''Filter and format the order report of a `project` into DE order rows'''
+    import pandas as pd
+    from ordering.utils.redcap import format_longitudinal
+    from ordering.utils.common import DE_EXPORT_COLS, format_id
+    from ordering.utils.cascadia import filter_cascadia_orders
+    from ordering.utils.airs import filter_airs_orders
+    from ordering.utils.hct import filter_hct_orders
+
+    LOG.info(f'Generating Kit Orders for <{project}>')
+
+    num_orders = len(orders.index.get_level_values(0))
+    LOG.info(f'Started with <{num_orders}> possible new kit orders in <{project}>.')
+
+    if not num_orders:
+        LOG.info(f'Skipping orders for <{project}>, nothing in the report.')
+        return None
+
+    with stage('format_longitudinal', len(orders), project=project) as record:
+        orders = format_longitudinal(orders, project)
+        record.rows_out = len(orders)
+
+    with stage('filter_orders', len(orders), project=project) as record:
+        if project == 'HCT':
+            orders = filter_hct_orders(orders)
+
+        elif project == 'AIRS':
+            orders = filter_airs_orders(orders)
+
+        elif project == 'Cascadia':
+            orders = filter_cascadia_orders(orders, enrollment_records)
+
+        record.rows_out = len(orders)
+
+    orders = format_id(orders, project)
+
+    # Some columns can be typed as a float64 (X.X) which causes issues with the
+    # import to delivery express. Downcast those columns.
+    orders['Today Tomorrow'] = pd.to_numeric(
+        orders['Today Tomorrow'], downcast='integer'
+    )
+    orders['Zipcode'] = pd.to_numeric(
+        orders['Zipcode'], downcast='integer'
+    )
+
+    # Subset orders by export desired columns
+    orders = orders[
+        orders.columns.intersection(DE_EXPORT_COLS)
+    ]
+
+    LOG.debug(f'Appending <{len(orders)}> from <{project}> to the order sheet.')
+    return orders
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate and upload a delivery express order form for studies needing kit pickups.')
     parser.add_argument('--save', action='store_true', help='Flag to indicate the order form should be saved to the data directory.')
     parser.add_argument('--s3-upload', action='store_true', help='Flag to indicate the order form should be uploaded to S3.')
-
-    main(parser.parse_args())
+    parser.add_argument('--cache', action='store_true', help='Flag to reuse REDCap reports exported within the last --cache-ttl seconds instead of always fetching them.')
+    parser.add_argument('--refresh', action='store_true', help='Flag to fetch REDCap reports and project metadata again, overwriting any cached exports.')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL, help='Number of seconds a cached REDCap report may be reused for.')
+    parser.add_argument('--profile', action='store_true', help='Flag to profile the run with cProfile and tracemalloc, writing a report to the data directory.')
+
+    args = parser.parse_args()
+    with instrument_run('delivery_express_order', args.profile, os.path.join(BASE_DIR, 'data')):
+        main(args)
@@ -1,18 +1,16 @@
 #!/usr/bin/env python3
-import os, sys, logging, envdir, datetime, argparse
-import pandas as pd
+import os, sys, logging, datetime, argparse
 
 # We are limited in that we run these functions as scripts, so have to manually
 # place utilities within our path.
 BASE_DIR = os.path.abspath(__file__ + "/../../../")
 sys.path.append(BASE_DIR)
 
-from ordering.utils.redcap import init_project, get_redcap_report, get_cascadia_study_pause_reports
-from ordering.utils.common import USPS_EXPORT_COLS, LOGISTICS_S3_BUCKET, LOGISTICS_USPS_PATH, export_orders
-from ordering.utils.cascadia import append_order, get_household_address, participant_under_study_pause, household_needs_resupply, get_participant_kit_count
-
-# Set up envdir
-envdir.open(os.path.join(BASE_DIR, '.env/redcap'))
+# pandas, PyCap and the order utilities are imported where they are used, so
+# `--help` and runs failing on their arguments start without loading them.
+from ordering.utils.report_cache import ReportCache, DEFAULT_CACHE_TTL
+from ordering.utils.redcap_metadata import MetadataCache
+from ordering.utils.instrumentation import instrument_run, stage
 
 LOG = logging.getLogger('ordering.scripts.usps_cascadia')
 PROJECT = 'Cascadia'
@@ -20,111 +18,107 @@ MAX_KITS = 6
 
 
 def main(args):
-    project = init_project(PROJECT)
-    order_report = get_redcap_report(project, PROJECT, '1144')
-    serial_report = get_redcap_report(project, PROJECT, '1711')
-    pause_report = get_cascadia_study_pause_reports(project)
+    from ordering.utils.redcap import init_project, get_redcap_report, get_cascadia_study_pause_reports, set_report_cache, set_metadata_cache
+    from ordering.utils.common import LOGISTICS_S3_BUCKET, LOGISTICS_USPS_PATH, export_orders
+
+    # Set up envdir
+    import envdir
+    envdir.open(os.path.join(BASE_DIR, '.env/redcap'))
+
+    # reports are only reused when asked for, since a stale report can place or import an order twice
+    if args.cache:
+        set_report_cache(ReportCache(os.path.join(BASE_DIR, 'data/cache'), ttl=args.cache_ttl, refresh=args.refresh))
+    set_metadata_cache(MetadataCache(os.path.join(BASE_DIR, 'data/cache/metadata'), refresh=args.refresh))
+
+    with stage('export_reports', project=PROJECT) as record:
+        project = init_project(PROJECT)
+        # order dates are exported to USPS as REDCap formats them
+        order_report = get_redcap_report(project, PROJECT, '1144', parse_order_dates=False)
+        serial_report = get_redcap_report(project, PROJECT, '1711')
+        pause_report = get_cascadia_study_pause_reports(project)
+        record.rows_out = len(order_report)
 
     serial_pts = serial_report['results_ptid'] if len(serial_report) else []
     LOG.debug(f'Operating with <{len(serial_report)}> serial patients.')
 
-    orders = pd.DataFrame(columns=USPS_EXPORT_COLS)
-    household_ids = set(i[0] for i in order_report.index)
-
-    for house_id in household_ids:
-        LOG.debug(f'Working on household <{house_id}>.')
-
-        # Each key in these dictionaries represents a patient_id and each
-        # value represents the number of kits they require. See example below.
-        kits_needed = {
-            'resupply': {},  # {"0": 2, "1": 1, "3": 4}
-            'welcome': {},  # {"2": 1}
-            'serial': {}  # {"6": 1}
-        }
-
-        participants = set(
-            i[1] for i in order_report.index if i[0] == house_id and i[1] != 'household_arm_1'
-        )
-        LOG.debug(f'<{len(participants)}> participants exist within household <{house_id}>')
+    orders = generate_orders(order_report, pause_report, serial_pts)
 
-        # first need to check if any participants in a househould need a resupply. If they do, we will
-        # be resupplying ALL participants in the househould, even if they don't necessarily need it.
-        needs_resupply = household_needs_resupply(house_id, participants, order_report, threshold=3)
-        LOG.debug(f'Resupply is set to <{needs_resupply}> for household <{house_id}>.')
-
-        for participant in participants:
-            LOG.debug(f'Working on participant <{participant}>.')
-            pt_data = order_report.loc[[(house_id, participant)]]
-
-            if any(pt_data['manage_archive'] == 1):
-                LOG.debug(f'Participant <{participant}> is archived and no longer needs orders generated for them.')
-                continue
+    LOG.info(f"Summary of orders generated by this run: \n \
+            {orders.groupby(['Project Name']).size().reset_index(name='counts')}")
 
-            # the participant should be enrolled and consented to get any kits
-            if not (any(pt_data['enrollment_survey_complete'] == 2) and any(pt_data['consent_form_complete'] == 2)):
-                LOG.debug(f'Participant <{participant}> must be consented and enrolled to receive swab kits.')
-                continue
+    file_name = f'USPSOrder{datetime.datetime.now().strftime("%Y_%m_%d_%H_%M")}.csv'
 
-            if participant_under_study_pause(pause_report, house_id, participant):
-                LOG.info(f'Participant <{participant}> from household <{house_id}> is under study pause. Deliveries are stopped until the pause end date.')
-                continue
+    if args.save:
+        with stage('save_orders', len(orders)):
+            export_orders(orders, os.path.join(BASE_DIR, f'data/{file_name}'))
+        LOG.info(f'Successfully saved orders to <{os.path.join(BASE_DIR, f"data/{file_name}")}>.')
+    else:
+        LOG.debug(f"Skipping order save to disk with <--save={args.save}.>")
 
-            # if no swab barcodes have been completed they need a welcome kit and won't need anything else
-            if not any(pt_data['swab_barcodes_complete'] == 2):
-                LOG.debug(f'Participant <{participant}> has no complete swabs. Adding a welcome kit to their inventory.')
-                kits_needed['welcome'][participant] = 1
-                continue
+    if args.s3_upload:
+        with stage('upload_orders', len(orders)):
+            export_orders(orders, f's3://{LOGISTICS_S3_BUCKET}/{LOGISTICS_USPS_PATH}/{file_name}', s3=True)
+        LOG.info(f'Successfully uploaded USPS orders to <{LOGISTICS_S3_BUCKET}/{LOGISTICS_USPS_PATH}/{file_name}>')
+    else:
+        LOG.debug(f'Skipping order upload to S3 with <--s3-upload={args.s3_upload}>.')
 
-            if needs_resupply:
-                num_kits = get_participant_kit_count(pt_data)
-                LOG.debug(f'Participant has total {num_kits} usable kits.')
 
-                kits_needed['resupply'][participant] = max(MAX_KITS - num_kits, 0)
-                LOG.debug(f'Resupplying {kits_needed["resupply"][participant]} kits to participant <{participant}>.')
+def generate_orders(order_report, pause_report, serial_pts):
+    """Generate the USPS orders for every Cascadia household needing kits"""
+    from ordering.utils.common import USPS_EXPORT_COLS
+    from ordering.utils.cascadia import OrderBuilder, StudyPauseIndex, get_household_addresses, get_kit_inventory, plan_household_kits
 
-            if any(pt_data['es_ptid'].isin(serial_pts)):
-                kits_needed['serial'][participant] = 1
-                LOG.debug(f'Participant is starting serial swab program. Adding a serial kit to their inventory.')
+    orders = OrderBuilder(USPS_EXPORT_COLS)
 
-            LOG.debug(f'Finished working on participant <{participant}>.')
+    # Kits for every household are planned up front, so we only need to visit
+    # the households which need something shipped to them.
+    with stage('plan_household_kits', len(order_report), project=PROJECT) as record:
+        inventory = get_kit_inventory(order_report)
+        study_pauses = StudyPauseIndex(pause_report)
+        plan = plan_household_kits(
+            order_report, study_pauses, serial_pts, threshold=3, max_kits=MAX_KITS, inventory=inventory
+        )
+        record.rows_out = len(plan)
 
+    with stage('resolve_addresses', len(plan), project=PROJECT) as record:
+        addresses = get_household_addresses(order_report, plan.index)
+        record.rows_out = len(addresses)
 
-        if kits_needed['welcome'] or kits_needed['resupply'] or kits_needed['serial']:
-            address = get_household_address(order_report, house_id)
+    household_ids = set(order_report.index.get_level_values(0))
 
-        if kits_needed['resupply']:
-            resupply_kits_needed = sum(kits_needed['resupply'].values())
-            orders = append_order(orders, house_id, 1, resupply_kits_needed, address)
+    with stage('build_orders', len(plan), project=PROJECT) as record:
+        for house_id in household_ids:
+            if house_id not in plan.index:
+                continue
 
-        if kits_needed['serial']:
-            for pt, _ in kits_needed['serial'].items():
-                orders = append_order(orders, house_id, 2, 1, address)
+            LOG.debug(f'Working on household <{house_id}>.')
+            kits_needed = plan.loc[house_id]
+            address = addresses.loc[house_id]
 
-        if kits_needed['welcome']:
-            welcome_kits_needed = sum(kits_needed['welcome'].values())
-            orders = append_order(orders, house_id, 3, welcome_kits_needed, address)
+            if kits_needed['resupply_participants']:
+                orders.add(house_id, 1, kits_needed['resupply'], address)
 
-    LOG.info(f"Summary of orders generated by this run: \n \
-            {orders.groupby(['Project Name']).size().reset_index(name='counts')}")
+            for _ in range(kits_needed['serial']):
+                orders.add(house_id, 2, 1, address)
 
-    file_name = f'USPSOrder{datetime.datetime.now().strftime("%Y_%m_%d_%H_%M")}.csv'
+            if kits_needed['welcome']:
+                orders.add(house_id, 3, kits_needed['welcome'], address)
 
-    if args.save:
-        export_orders(orders, os.path.join(BASE_DIR, f'data/{file_name}'))
-        LOG.info(f'Successfully saved orders to <{os.path.join(BASE_DIR, f"data/{file_name}")}>.')
-    else:
-        LOG.debug(f"Skipping order save to disk with <--save={args.save}.>")
+        record.rows_out = len(orders)
 
-    if args.s3_upload:
-        export_orders(orders, f's3://{LOGISTICS_S3_BUCKET}/{LOGISTICS_USPS_PATH}/{file_name}', s3=True)
-        LOG.info(f'Successfully uploaded USPS orders to <{LOGISTICS_S3_BUCKET}/{LOGISTICS_USPS_PATH}/{file_name}>')
-    else:
-        LOG.debug(f'Skipping order upload to S3 with <--s3-upload={args.s3_upload}>.')
+    LOG.debug(f'Generated <{len(orders)}> orders.')
+    return orders.to_frame()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate and upload a USPS order form for Cascadia participants needing kits.')
     parser.add_argument('--save', action='store_true', help='Flag to indicate the order form should be saved to the data directory.')
     parser.add_argument('--s3-upload', action='store_true', help='Flag to indicate the order form should be uploaded to S3.')
-
-    main(parser.parse_args())
+    parser.add_argument('--cache', action='store_true', help='Flag to reuse REDCap reports exported within the last --cache-ttl seconds instead of always fetching them.')
+    parser.add_argument('--refresh', action='store_true', help='Flag to fetch REDCap reports and project metadata again, overwriting any cached exports.')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL, help='Number of seconds a cached REDCap report may be reused for.')
+    parser.add_argument('--profile', action='store_true', help='Flag to profile the run with cProfile and tracemalloc, writing a report to the data directory.')
+
+    args = parser.parse_args()
+    with instrument_run('usps_cascadia_order', args.profile, os.path.join(BASE_DIR, 'data')):
+        main(args)
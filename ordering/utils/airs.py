@@ -1,6 +1,7 @@
 """order utilities for the AIRS project"""
 import logging
-from .common import use_best_address
+import pandas as pd
+from .common import use_best_addresses
 
 AIRS_ORDER_FIELDS = [
     "Order Date", "Today Tomorrow", "Street Address 2", "Apt Number 2",
@@ -33,6 +34,23 @@ def determine_airs_order(row):
     return order
 
 
+def determine_airs_orders(orders):
+    '''
+    Frame level version of `determine_airs_order`. Orders with more than one
+    of the alternate order fields take those fields, the rest keep their
+    original order fields.
+    '''
+    use_alternate = (orders[AIRS_ORDER_FIELDS_2].notnull().sum(axis=1) > 1).to_numpy()
+    LOG.debug(f'Using alternate order fields for <{use_alternate.sum()}> of <{len(orders)}> orders.')
+
+    # choose column by column so each field keeps the type it was loaded with,
+    # rather than having one inferred from a block of objects
+    return pd.concat([
+        orders[alternate].where(use_alternate, orders[field].to_numpy()).rename(field)
+        for field, alternate in zip(AIRS_ORDER_FIELDS, AIRS_ORDER_FIELDS_2)
+    ], axis=1)
+
+
 def filter_airs_orders(orders):
     '''Filters AIRS `orders` to those that we need to create orders for'''
     LOG.debug(f'Filtering <{len(orders)}> AIRS Orders. Setting order `Project Name` to AIRS.')
@@ -41,23 +59,18 @@ def filter_airs_orders(orders):
     # Get original address row from AIRS enrollment arm
     original_address = orders.filter(like='screening_and_enro_arm_1', axis=0)
 
-    # Get weekly records, drop records without an order date,
-    # reset the index on redcap events, only keep the most
-    # recent event in each index and then set the index again.
+    # Get weekly records, drop records without an order date
+    # and only keep the most recent event of each record.
     orders = orders.filter(
         like='week', axis=0
-    ).dropna(subset=['Order Date', 'Order Date 2'], how='all'
-    ).reset_index(level='redcap_event_name'
-    ).query("~index.duplicated(keep='last')"
-    ).set_index('redcap_event_name', append=True)
+    ).dropna(subset=['Order Date', 'Order Date 2'], how='all')
+    orders = orders[~orders.index.droplevel('redcap_event_name').duplicated(keep='last')]
 
     # Determine what AIRS order to use (up to 2 weekly orders are allowed for AIRS)
-    orders.loc[:, AIRS_ORDER_FIELDS] = orders.apply(determine_airs_order, axis=1)
+    orders[AIRS_ORDER_FIELDS] = determine_airs_orders(orders)
 
     # Get the most recent address supplied by the participant
-    orders = orders.apply(
-        lambda row: use_best_address(original_address, row, 'screening_and_enro_arm_1'), axis=1
-    )
+    orders = use_best_addresses(original_address, orders, 'screening_and_enro_arm_1')
 
     LOG.info(f'<{len(orders)}> orders remain for AIRS after filtering.')
     return orders
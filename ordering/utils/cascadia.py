@@ -1,7 +1,9 @@
 """order utilities for the Cascadia project"""
 import logging, datetime
+import numpy as np
 import pandas as pd
-from .common import USPS_EXPORT_COLS, use_best_address
+from .redcap import broadcast_first_event
+from .common import USPS_EXPORT_COLS, CORE_ADDRESS_COLS, REPLACEMENT_ADDRESS_COLS, use_best_addresses
 
 LOG = logging.getLogger(__name__)
 
@@ -32,11 +34,7 @@ def filter_cascadia_orders(orders, enrollments):
 
     # apply the project name mapping to each enrollment record. by default
     # it only appears on the first record.
-    enrollments['Project Name'] = enrollments.apply(
-        lambda x: enrollments.filter(
-            items=[(x.name[0], '0_arm_1')], axis=0
-        )['Project Name'].values[0],axis=1
-    )
+    enrollments = broadcast_first_event(enrollments, 'Project Name', '0_arm_1')
 
     # Orders we must fulfill are symptom surveys without an existing tracking number
     # which have a designated pickup time and have a completed symptom survey.
@@ -46,8 +44,8 @@ def filter_cascadia_orders(orders, enrollments):
         (orders['ss_return_tracking'].isna()) &
         any(orders[['Pickup 1', 'Pickup 2']].notna()) &
         (orders['symptom_survey_complete'] == 2)
-    ].dropna(subset=['Order Date']
-    ).apply(lambda record: use_best_address(enrollments, record), axis=1)
+    ].dropna(subset=['Order Date'])
+    orders = use_best_addresses(enrollments, orders)
 
     # Set today tomorrow variable based on pickup time preference
     orders['Today Tomorrow'] = orders[['Pickup 1']].apply(lambda x: 0 if x['Pickup 1'] == 1 else 1, axis=1)
@@ -85,6 +83,77 @@ def append_order(orders, household, sku, quantity, address):
     return pd.concat([orders, address], join='inner', ignore_index=True)
 
 
+class OrderBuilder:
+    """
+    Accumulates USPS orders and materializes the export frame once at the end.
+
+    Produces the same orders as repeated calls to `append_order`: kits are split
+    into shipments of at most `MAX_SHIPMENT_SIZE` per SKU, the smallest shipment
+    first, and each shipment gets the next unique order number for its household.
+    """
+    # max kits per shipment by SKU, 1 for resupply kits and 3 for welcome kits
+    MAX_SHIPMENT_SIZE = {1: 20, 3: 4}
+
+    def __init__(self, columns=USPS_EXPORT_COLS):
+        self.columns = list(columns)
+        self.orders = []
+        self.order_ids = set()
+        self._last_order_id = {}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, household, sku, quantity, address):
+        """Add orders for `quantity` kits of type `sku` destined for a household `address` row"""
+        # don't append orders lacking a valid address
+        if pd.isna(address['Street Address']) and pd.isna(address['City']) and pd.isna(address['State']):
+            LOG.warning(f'No valid address for household <{household}>. Skipping order.')
+            return
+
+        for shipment in self.split_shipments(sku, quantity):
+            order = address.to_dict()
+            order['SKU'] = sku
+            order['Quantity'] = shipment
+            order['OrderID'] = self.next_order_id(household)
+            order['Household ID'] = household
+            self.orders.append(order)
+
+            LOG.info(f'Appending order with <{shipment}> kits of type <{sku}> destined for household <{household}>.')
+
+        # only columns present on every order make it into the export
+        self.columns = [column for column in self.columns if column in order]
+
+    def split_shipments(self, sku, quantity):
+        """Split `quantity` kits into shipment sizes, the remainder shipment first"""
+        max_size = self.MAX_SHIPMENT_SIZE.get(sku)
+        if not max_size or quantity <= max_size:
+            return [quantity]
+
+        LOG.debug(f'Splitting order of <{quantity}> kits of type <{sku}> because of max shipment size <{max_size}>.')
+        num_shipments = -(-quantity // max_size)
+        return [quantity - max_size * (num_shipments - 1)] + [max_size] * (num_shipments - 1)
+
+    def next_order_id(self, house_id):
+        """
+        Generates a unique order number from the date and house id. Follows the
+        same suffix sequence as `generate_order_number`, but picks up from the
+        last order number issued to the household.
+        """
+        order_id = self._last_order_id.get(house_id) or f'{datetime.datetime.now().strftime("%y%m%d")}_{house_id}'
+        while order_id in self.order_ids:
+            order_id = order_id[:-1] + chr(ord(order_id[-1]) + 1) if order_id[-1].isalpha() else order_id + 'a'
+
+        self.order_ids.add(order_id)
+        self._last_order_id[house_id] = order_id
+
+        LOG.debug(f'Generated unique order_id <{order_id}>.')
+        return order_id
+
+    def to_frame(self):
+        """Materialize the accumulated orders as a USPS export frame"""
+        return pd.DataFrame(self.orders, columns=self.columns, dtype=object)
+
+
 def get_household_address(household_records, house_id):
     """Get the most up to date address from a household"""
     enroll_address = get_enrollment_address(household_records.loc[house_id], house_id).reset_index()
@@ -108,6 +177,74 @@ def get_household_address(household_records, house_id):
     return address[address.columns.intersection(USPS_EXPORT_COLS)]
 
 
+def get_household_addresses(order_report, households=None):
+    """
+    Get the most up to date address for every household in the `order_report`,
+    or only those listed in `households`, in one pass over the report.
+
+    Applies the same rules as `get_household_address`: the most recent complete
+    symptom survey address wins over the head of household's enrollment
+    address, while names, contact details and delivery instructions always come
+    from the enrollment. Returns a frame of the USPS export columns keyed by
+    household ID.
+    """
+    if households is None:
+        households = order_report.index.get_level_values(0).unique()
+    households = pd.Index(households)
+    LOG.debug(f'Resolving addresses for <{len(households)}> households.')
+
+    # the head of household is the first HH Reporter set within a household,
+    # falling back on the first participant when there isn't one.
+    head_of_house = order_report.groupby(level=0)['HH Reporter'].first().reindex(households)
+    LOG.debug(f'<{head_of_house.isna().sum()}> households have no Head of Household, falling back to index <0>.')
+    head_of_house = head_of_house.fillna(0).astype(int)
+
+    enrollments = order_report[order_report['redcap_repeat_instrument'].isna()]
+    enrollments = enrollments[~enrollments.index.duplicated()]
+    enroll_address = enrollments.reindex(
+        pd.MultiIndex.from_arrays([households, head_of_house.map('{}_arm_1'.format)])
+    ).set_axis(households, axis=0)
+
+    # the latest symptom survey holding a 'complete' address, see `get_most_recent_address`
+    symptom_surveys = order_report[
+        (order_report['redcap_repeat_instrument'] == 'symptom_survey') &
+        order_report.index.get_level_values(0).isin(households) &
+        ~(
+            order_report['Street Address 2'].isna() &
+            order_report['City 2'].isna() &
+            order_report['State 2'].isna()
+        )
+    ]
+    # surveys of a participant share an index label, so sort them by position
+    survey_dates = symptom_surveys['ss_date_1'].astype('datetime64').reset_index(drop=True)
+    updated_address = symptom_surveys.iloc[
+        survey_dates.sort_values(ascending=False, kind='mergesort').index
+    ]
+    updated_address = updated_address[~updated_address.index.get_level_values(0).duplicated()].droplevel(1).copy()
+    updated_address[CORE_ADDRESS_COLS] = updated_address[REPLACEMENT_ADDRESS_COLS].to_numpy()
+    LOG.debug(f'<{len(updated_address)}> households have an address within their symptom surveys.')
+
+    address = pd.concat([
+        updated_address, enroll_address.drop(updated_address.index)
+    ]).reindex(households)
+
+    # always use original delivery instructions, email, phone, and last name
+    # since symptom survey occassionally does not have these fields
+    address['Pref First Name']       = enroll_address['Pref First Name'].fillna(enroll_address['First Name'])
+    address['Last Name']             = enroll_address['Last Name']
+    address['Email']                 = enroll_address['Email']
+    address['Phone']                 = enroll_address['Phone']
+    address['Delivery Instructions'] = enroll_address['Delivery Instructions']
+
+    address['Project Name'] = order_report.groupby(level=0)['Project Name'].first().reindex(households).map(PROJECT_NAME_MAP)
+    for house_id in address.index[address['Project Name'].isna()]:
+        LOG.warning(f'No valid project found for household <{house_id}>.')
+
+    address['Zipcode'] = address['Zipcode'].map(lambda zipcode: '' if pd.isna(zipcode) else int(zipcode))
+
+    return address[address.columns.intersection(USPS_EXPORT_COLS)]
+
+
 def get_most_recent_address(household_records, house_id):
     """Get the most recent address provided by a household"""
     LOG.debug(f'Trying to select the most recent symptom survey address within household <{house_id}>.')
@@ -242,6 +379,71 @@ def participant_under_study_pause(study_pauses, household_id, participant_index)
         return False
 
 
+class StudyPauseIndex:
+    """
+    A lookup structure over the Cascadia study pause reports, built once per run.
+
+    Pauses are sorted by participant and start date, alongside the furthest end
+    date reached by each participant's pauses so far. Whether a participant is
+    paused on a date is then a binary search for their latest pause starting on
+    or before that date, which also handles overlapping pauses.
+    """
+    # spacing between participants in the combined (participant, start day) sort key
+    KEY_SPAN = 1 << 32
+
+    def __init__(self, study_pauses):
+        # an empty REDCap report comes back without any columns
+        if study_pauses.empty:
+            study_pauses = pd.DataFrame(columns=['cl_study_pause_start', 'cl_study_pause_end'])
+
+        starts = pd.to_datetime(study_pauses['cl_study_pause_start'], errors='coerce')
+        ends = pd.to_datetime(study_pauses['cl_study_pause_end'], errors='coerce')
+
+        # pauses missing either date can never be active
+        valid = (starts.notna() & ends.notna()).to_numpy()
+        keys = study_pauses.index[valid]
+
+        self.participants = keys.unique()
+        codes = self.participants.get_indexer(keys)
+        start_days = starts[valid].to_numpy().astype('datetime64[D]').astype('int64')
+        end_days = ends[valid].to_numpy().astype('datetime64[D]').astype('int64')
+
+        order = np.lexsort((start_days, codes))
+        self._codes = codes[order]
+        self._keys = self._codes * self.KEY_SPAN + start_days[order]
+        self._reach = pd.Series(end_days[order]).groupby(self._codes).cummax().to_numpy()
+
+        LOG.debug(f'Indexed <{len(self._keys)}> study pauses for <{len(self.participants)}> participants.')
+
+    def is_paused(self, household_id, participant_index, date=None):
+        """Determines whether a given participant has their study paused on `date`, default today"""
+        try:
+            code = self.participants.get_loc((household_id, participant_index))
+        except KeyError:
+            return False
+
+        return bool(self._lookup(np.array([code]), date)[0])
+
+    def paused_mask(self, index, date=None):
+        """
+        Determines which rows of a (household, participant) `index` belong to a
+        participant whose study is paused on `date`, default today.
+        """
+        codes = self.participants.get_indexer(index) if len(self.participants) else np.full(len(index), -1)
+        return pd.Series(self._lookup(codes, date), index=index)
+
+    def _lookup(self, codes, date):
+        day = np.datetime64(date or datetime.date.today(), 'D').astype('int64')
+        position = np.searchsorted(self._keys, codes * self.KEY_SPAN + day, side='right') - 1
+        found = (codes >= 0) & (position >= 0)
+
+        position = position.clip(min=0)
+        if not len(self._keys):
+            return found
+
+        return found & (self._codes[position] == codes) & (self._reach[position] >= day)
+
+
 def household_needs_resupply(house_id, participants, order_report, threshold=3):
     """
     Check if any participant in a household is in need of a resupply. This is true if they
@@ -251,7 +453,7 @@ def household_needs_resupply(house_id, participants, order_report, threshold=3):
     for participant in participants:
         pt_data = order_report.loc[[(house_id, participant)]]
 
-        if not (any(pt_data['enrollment_survey_complete'] == 2) and any(pt_data['consent_form_complete'] == 2)):
+        if not ((pt_data['enrollment_survey_complete'] == 2).any() and (pt_data['consent_form_complete'] == 2).any()):
             LOG.debug(f'Participant <{participant}> must be consented and enrolled to qualify for resupply swab kits.')
             continue
 
@@ -282,6 +484,113 @@ def get_participant_kit_count(pt_data):
     return assigned_barcodes - returned_barcodes
 
 
+def get_participant_flags(order_report, serial_pts, inventory=None):
+    """
+    Collapse the `order_report` into one row of ordering flags per participant,
+    indexed by (household, participant). The household level event is dropped
+    since it does not represent a participant. Kit counts are taken from the
+    `inventory` table when one is passed.
+    """
+    participant_rows = order_report[order_report.index.get_level_values(1) != 'household_arm_1']
+    LOG.debug(f'Computing ordering flags over <{len(participant_rows)}> participant rows.')
+
+    flags = pd.DataFrame({
+        'archived': participant_rows['manage_archive'] == 1,
+        'enrolled': participant_rows['enrollment_survey_complete'] == 2,
+        'consented': participant_rows['consent_form_complete'] == 2,
+        'swabbed': participant_rows['swab_barcodes_complete'] == 2,
+        'serial': participant_rows['es_ptid'].isin(serial_pts),
+    }, index=participant_rows.index).groupby(level=[0, 1]).any()
+
+    if inventory is None:
+        inventory = get_kit_inventory(order_report)
+    flags['kits'] = inventory['on_hand'].reindex(flags.index, fill_value=0)
+
+    return flags
+
+
+def get_kit_inventory(order_report):
+    """
+    Build the kit inventory table for every participant in the `order_report`.
+
+    Returns a frame indexed by (household, participant) holding the number of
+    barcodes `assigned` to each participant, the number of kits `returned`, and
+    the kits they currently have `on_hand`. This is the bulk equivalent of
+    calling `get_participant_kit_count` for each participant, so compute it once
+    per run and pass it along to anything needing kit counts.
+    """
+    participant_rows = order_report[order_report.index.get_level_values(1) != 'household_arm_1']
+    instrument = participant_rows['redcap_repeat_instrument']
+
+    # current barcodes a pt has, counted only on their swab barcode instruments
+    is_swab_barcodes = (instrument == 'swab_barcodes').to_numpy()
+    assigned = participant_rows[BARCODE_COLUMNS].notna().to_numpy().sum(axis=1) * is_swab_barcodes
+
+    # current barcodes a pt has returned
+    is_symptom_survey = (instrument == 'symptom_survey').to_numpy()
+    returned = participant_rows['ss_return_tracking'].notna().to_numpy() & is_symptom_survey
+
+    inventory = pd.DataFrame({
+        'assigned': assigned,
+        'returned': returned.astype(int),
+    }, index=participant_rows.index).groupby(level=[0, 1]).sum()
+    inventory['on_hand'] = inventory['assigned'] - inventory['returned']
+
+    LOG.debug(f'Built kit inventory for <{len(inventory)}> participants.')
+    return inventory
+
+
+def get_participant_kit_counts(order_report):
+    """Gets the number of kits every participant in the `order_report` currently has"""
+    return get_kit_inventory(order_report)['on_hand']
+
+
+def plan_household_kits(order_report, study_pauses, serial_pts, threshold=3, max_kits=6, inventory=None):
+    """
+    Plan the kits needed by every household in the `order_report` at once.
+
+    Mirrors the per-participant rules applied in `usps_cascadia_order.main`:
+    archived, unenrolled or paused participants get nothing, participants
+    without a complete swab barcode get a welcome kit, and every other
+    participant is topped up to `max_kits` when anyone in their household has
+    less than `threshold` kits. Serial swab participants also get a serial kit.
+
+    Study pauses are checked against a `StudyPauseIndex` built from the pause
+    reports. Returns a frame indexed by household ID with the number of
+    participants being resupplied, the total resupply kits, and the number of
+    serial and welcome kits. Households needing nothing are excluded. A
+    precomputed kit `inventory` from `get_kit_inventory` may be passed to avoid
+    recomputing it.
+    """
+    flags = get_participant_flags(order_report, serial_pts, inventory)
+    households = flags.index.get_level_values(0)
+
+    eligible = flags['enrolled'] & flags['consented']
+    needs_resupply = (eligible & (flags['kits'] < threshold)).groupby(level=0).any()
+    LOG.debug(f'<{needs_resupply.sum()}> of <{len(needs_resupply)}> households are in need of a resupply.')
+
+    active = eligible & ~flags['archived']
+
+    paused = study_pauses.paused_mask(flags.index)
+    LOG.debug(f'<{paused.sum()}> participants are currently under a study pause.')
+    active &= ~paused
+
+    welcome = active & ~flags['swabbed']
+    resupplied = active & flags['swabbed'] & needs_resupply.reindex(households).to_numpy()
+    serial = active & flags['swabbed'] & flags['serial']
+
+    plan = pd.DataFrame({
+        'resupply_participants': resupplied.astype(int),
+        'resupply': (max_kits - flags['kits']).clip(lower=0).where(resupplied, 0),
+        'serial': serial.astype(int),
+        'welcome': welcome.astype(int),
+    }).groupby(level=0).sum()
+
+    plan = plan[plan.any(axis=1)]
+    LOG.info(f'<{len(plan)}> households need kits generated for them.')
+    return plan
+
+
 def get_yesterdays_orders(orders):
     """Filter order sheet to only yesterday's orders"""
     yesterday = datetime.date.today() - datetime.timedelta(days=1)
@@ -72,6 +72,48 @@ def use_best_address(enrollment_records, replacement_record, event=''):
     return updated_record
 
 
+def use_best_addresses(enrollment_records, orders, event=''):
+    '''
+    Frame level version of `use_best_address`. Each order is joined to its
+    enrollment record once, orders with any replacement address fields keep
+    their replacement address while the rest fall back on their enrollment
+    address, and empty metadata fields are filled from the enrollment record.
+    A custom enrollment event may be specified.
+    '''
+    LOG.debug(f'Determining best address for <{len(orders)}> records.')
+
+    # grab the enrollment associated with each order. Work on positional rows since
+    # orders may hold several rows for the same record.
+    record_index = orders.index if not event else pd.MultiIndex.from_arrays([
+        orders.index.get_level_values(0), [event] * len(orders)
+    ])
+    enrollment_records = enrollment_records[~enrollment_records.index.duplicated()]
+    enrollments = enrollment_records.reindex(record_index).reset_index(drop=True)
+    updated_records = orders.reset_index(drop=True)
+
+    # If any replacement address columns are not null, use those fields.
+    # Otherwise we should use the address in the enrollment record.
+    enrollment_address = enrollments.reindex(columns=CORE_ADDRESS_COLS)
+    if set(REPLACEMENT_ADDRESS_COLS).issubset(orders.columns):
+        updating = updated_records[REPLACEMENT_ADDRESS_COLS].notnull().any(axis=1)
+        replacement_address = updated_records[REPLACEMENT_ADDRESS_COLS].set_axis(CORE_ADDRESS_COLS, axis=1)
+    else:
+        updating = pd.Series(False, index=updated_records.index)
+        replacement_address = enrollment_address
+    LOG.debug(f'Replacing enrollment address with replacement address on <{updating.sum()}> records.')
+
+    # Replace address with the best one found
+    updated_records[CORE_ADDRESS_COLS] = replacement_address.where(updating, enrollment_address, axis=0)
+
+    # Fill any empty metadata fields with existing values in original enrollment record
+    for replacement in REPLACEMENT_METADATA:
+        enrollment_metadata = enrollments.get(replacement, pd.Series(None, index=enrollments.index, dtype=object))
+        updated_records[replacement] = updated_records[replacement].combine_first(enrollment_metadata) \
+            if replacement in updated_records else enrollment_metadata
+
+    return updated_records.set_axis(orders.index, axis=0)
+
+
 def format_id(orders, project, new_index = None):
     '''
     Format the correct Record Id for project orders. Use `new_index` if passed.
@@ -2,56 +2,173 @@
 import os, logging, json, base64, requests, time
 import pandas as pd
 from datetime import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrumentation import timed
 
 LOG = logging.getLogger(__name__)
 
 
-def get_de_orders(redcap_order: pd.Series, max_retries = 5):
-    """get existing DE orders for Cascadia from DE API Endpoint"""
-    url = "https://deliveryexpresslogistics.dsapp.io/integration/api/v1/orders/search"
-
-    username_pass = bytearray(os.environ['AUTHORIZATION'], 'utf-8')
-    base64_encoded = base64.b64encode(username_pass).decode('ascii')
-    auth = f'Basic {base64_encoded}'
-
-    payload = {
-        "query": redcap_order.loc['Record Id'],
-        "searchFields": ["referenceNumber1"]
-    }
-    headers = {'Authorization': auth, "Content-Type": "application/*+json"}
-
-    # with the cascadia project growing, we sometimes run into issues making requests
-    # to the DE servers. we should retry failed requests up to a point, backing off
-    # with each additional failure.
-    attempts = 0
-    delay = 0.5
-    factor = 2
-    while attempts < max_retries:
-        LOG.debug(f'Making request number <{attempts + 1}> to <{url}> with data <{payload}>')
-
-        try:
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
-            response.raise_for_status()
-            break
-
-        except (requests.exceptions.ConnectionError, requests.exceptions.HTTPError, requests.exceptions.Timeout) as exc:
-            attempts += 1
-            if attempts == max_retries:
-                LOG.error(f'Aborting request to Delivery Express servers for participant <{redcap_order["Record Id"]}> after <{attempts}>.', exc_info=exc)
-                raise
+DE_API_URL = "https://deliveryexpresslogistics.dsapp.io/integration/api/v1"
+
+# Orders are fetched in pages of this size when searching by creation date
+DE_SEARCH_PAGE_SIZE = 100
+
+
+class DeliveryExpressClient:
+    """
+    Client for the Delivery Express API. Requests share one pooled session, so
+    connections and the authorization header are set up once per run, and
+    order lookups may be made concurrently by up to `concurrency` threads.
+    """
+
+    def __init__(self, authorization, concurrency = 1, max_retries = 5, url = DE_API_URL):
+        self.url = url
+        self.concurrency = max(concurrency, 1)
+        self.max_retries = max_retries
+
+        base64_encoded = base64.b64encode(bytearray(authorization, 'utf-8')).decode('ascii')
+
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Basic {base64_encoded}', "Content-Type": "application/*+json"})
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def search_orders(self, payload, record_id = None):
+        """Search DE orders with the given `payload`, retrying failed requests"""
+        url = f'{self.url}/orders/search'
+
+        # with the cascadia project growing, we sometimes run into issues making requests
+        # to the DE servers. we should retry failed requests up to a point, backing off
+        # with each additional failure.
+        attempts = 0
+        delay = 0.5
+        factor = 2
+        while attempts < self.max_retries:
+            LOG.debug(f'Making request number <{attempts + 1}> to <{url}> with data <{payload}>')
+
+            try:
+                response = self.session.post(url, data=json.dumps(payload))
+                response.raise_for_status()
+                break
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.HTTPError, requests.exceptions.Timeout) as exc:
+                attempts += 1
+                if attempts == self.max_retries:
+                    LOG.error(f'Aborting request to Delivery Express servers for participant <{record_id}> after <{attempts}>.', exc_info=exc)
+                    raise
+                else:
+                    LOG.warning(f'Attempt <{attempts}> to reach the Delivery Express servers failed with: {exc} Retrying in <{delay}> seconds.')
+                    time.sleep(delay)
+                    delay = delay * factor
+
+        return json.loads(response.text)
+
+    def get_de_orders(self, redcap_order: pd.Series):
+        """get existing DE orders for a Cascadia REDCap order"""
+        payload = {
+            "query": redcap_order.loc['Record Id'],
+            "searchFields": ["referenceNumber1"]
+        }
+        de_orders = self.search_orders(payload, redcap_order['Record Id'])
+        LOG.info(f'Looking up order for pt: <{redcap_order["Record Id"]}>.')
+
+        if de_orders['totalCount'] == 0:
+            LOG.info(f'No orders found for <{redcap_order["Record Id"]}>.')
+            return None
+
+        return extract_de_orders(redcap_order, de_orders)
+
+    def lookup_orders(self, redcap_orders: pd.DataFrame):
+        """
+        Look up the DE order for every row of `redcap_orders`. Returns a Series of
+        order ids in the same order and with the same index as `redcap_orders`.
+        """
+        LOG.info(f'Looking up <{len(redcap_orders)}> orders with <{self.concurrency}> concurrent requests.')
+        rows = (row for _, row in redcap_orders.iterrows())
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            order_ids = list(executor.map(self.get_de_orders, rows))
+
+        return pd.Series(order_ids, index=redcap_orders.index, dtype=object)
+
+    def search_orders_since(self, created_after, page_size = DE_SEARCH_PAGE_SIZE):
+        """
+        Page through every DE order created since `created_after`. Pages are
+        requested by a 1-based `pageNumber` and a `pageSize`, and each response
+        is expected to hold that page of `items` and the `totalCount` of all
+        orders matched. Orders are deduplicated by `orderId`, so pages which
+        overlap are harmless, but a page adding no new orders means paging is not
+        honoured and raises a RuntimeError rather than returning a partial list.
+        """
+        LOG.info(f'Fetching all Delivery Express orders created since <{created_after}>.')
+        orders = {}
+        page = 1
+
+        while True:
+            payload = {
+                "query": "",
+                "searchFields": ["referenceNumber1"],
+                "createdFrom": created_after.strftime('%Y-%m-%dT%H:%M:%S'),
+                "pageNumber": page,
+                "pageSize": page_size,
+            }
+            de_orders = self.search_orders(payload)
+            new_orders = {o['orderId']: o for o in de_orders['items'] if o['orderId'] not in orders}
+            orders.update(new_orders)
+
+            LOG.debug(f'Fetched page <{page}> with <{len(new_orders)}> new orders, <{len(orders)}> of <{de_orders["totalCount"]}> so far.')
+            if not de_orders['items'] or len(orders) >= de_orders['totalCount']:
+                return list(orders.values())
+
+            if not new_orders:
+                raise RuntimeError(
+                    f'Page <{page}> of Delivery Express orders only repeats earlier pages, so paging does not '
+                    f'appear to be supported. Look up orders one at a time instead.'
+                )
+
+            page += 1
+
+    def lookup_orders_bulk(self, redcap_orders: pd.DataFrame):
+        """
+        Look up the DE order for every row of `redcap_orders` by fetching all DE
+        orders created since the oldest pending `Order Date` in a handful of
+        paged requests, rather than searching once per order. Returns a Series of
+        order ids with the same index as `redcap_orders`.
+        """
+        if not len(redcap_orders):
+            return pd.Series(dtype=object, index=redcap_orders.index)
+
+        order_index = index_de_orders(self.search_orders_since(redcap_orders['Order Date'].min()))
+        LOG.info(f'Looking up <{len(redcap_orders)}> orders against <{len(order_index)}> DE records.')
+
+        order_ids = []
+        for _, redcap_order in redcap_orders.iterrows():
+            de_orders = order_index.get(str(redcap_order['Record Id']), [])
+
+            if not de_orders:
+                LOG.info(f'No orders found for <{redcap_order["Record Id"]}>.')
+                order_ids.append(None)
             else:
-                LOG.warning(f'Attempt <{attempts}> to reach the Delivery Express servers failed with: {exc} Retrying in <{delay}> seconds.')
-                time.sleep(delay)
-                delay = delay * factor
+                order_ids.append(extract_de_orders(redcap_order, {'totalCount': len(de_orders), 'items': de_orders}))
+
+        return pd.Series(order_ids, index=redcap_orders.index, dtype=object)
 
-    de_orders = json.loads(response.text)
-    LOG.info(f'Looking up order for pt: <{redcap_order["Record Id"]}>.')
 
-    if de_orders['totalCount'] == 0:
-        LOG.info(f'No orders found for <{redcap_order["Record Id"]}>.')
-        return None
+def index_de_orders(de_orders):
+    """Index a list of DE orders by their REDCap record id, `referenceNumber1`"""
+    order_index = {}
+    for order in de_orders:
+        order_index.setdefault(str(order['referenceNumber1']), []).append(order)
 
-    return extract_de_orders(redcap_order, de_orders)
+    return order_index
+
+
+def get_de_orders(redcap_order: pd.Series, max_retries = 5):
+    """get existing DE orders for Cascadia from DE API Endpoint"""
+    client = DeliveryExpressClient(os.environ['AUTHORIZATION'], max_retries=max_retries)
+    return client.get_de_orders(redcap_order)
 
 
 def extract_de_orders(redcap_order: pd.Series, de_orders: dict):
@@ -84,6 +201,7 @@ def extract_de_orders(redcap_order: pd.Series, de_orders: dict):
     return None
 
 
+@timed()
 def format_orders_import(orders):
     """Format the DE orders so they may be imported into REDCap"""
     LOG.debug(f'Formatting and verifying <{len(orders)}> records for import to REDCap.')
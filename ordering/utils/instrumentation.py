@@ -0,0 +1,196 @@
+"""Stage timings, row counts and optional profiling of ordering script runs"""
+import os, io, json, time, logging, datetime, threading, functools
+from contextlib import contextmanager
+
+LOG = logging.getLogger(__name__)
+
+# Optional `RunStats` that stages are recorded to, set for a script run by `instrument_run`
+RUN_STATS = None
+
+# Number of functions and allocation sites listed in a profile report
+PROFILE_TOP = 40
+
+
+class StageRecord:
+    """
+    Timing of one stage of a run. `rows_out` may be set within the stage once
+    its result is known, and any `labels` (e.g. the project) are kept as is.
+    """
+
+    def __init__(self, name, rows_in = None, **labels):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.labels = labels
+
+    def to_dict(self):
+        return {
+            'stage': self.name, **self.labels, 'seconds': round(self.seconds, 4),
+            'rows_in': self.rows_in, 'rows_out': self.rows_out,
+        }
+
+
+class RunStats:
+    """
+    Collects the stages of a `script` run, from any thread. With `profile` set,
+    the run is profiled with cProfile and its allocations traced with
+    tracemalloc. cProfile only sees the thread the run was started from.
+    """
+
+    def __init__(self, script, profile = False):
+        self.script = script
+        self.profile = profile
+        self.stages = []
+        self.status = None
+        self.started = None
+        self.seconds = None
+        self.peak_bytes = None
+        self.profile_path = None
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._snapshot = None
+
+    def start(self):
+        self.started = datetime.datetime.now()
+        self._start = time.perf_counter()
+        if self.profile:
+            # profilers are only imported when asked for, keeping plain runs quick to start
+            import cProfile, tracemalloc
+            tracemalloc.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self, status = 'ok'):
+        self.status = status
+        self.seconds = time.perf_counter() - self._start
+        if self.profile:
+            import tracemalloc
+            self._profiler.disable()
+            self._snapshot = tracemalloc.take_snapshot()
+            _, self.peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    def record(self, stage):
+        with self._lock:
+            self.stages.append(stage)
+
+    def summary(self):
+        '''The run and each of its stages as a JSON serializable dict'''
+        summary = {
+            'script': self.script,
+            'started': self.started.isoformat(timespec='seconds') if self.started else None,
+            'status': self.status,
+            'seconds': round(self.seconds, 4) if self.seconds is not None else None,
+            'stages': [stage.to_dict() for stage in self.stages],
+        }
+        if self.peak_bytes is not None:
+            summary['peak_mb'] = round(self.peak_bytes / 1024 ** 2, 2)
+        if self.profile_path:
+            summary['profile'] = self.profile_path
+        return summary
+
+    def write_profile(self, directory):
+        '''Write the cProfile and tracemalloc reports of a stopped run to `directory`'''
+        import pstats
+        path = os.path.join(
+            directory, f'Profile_{self.script}_{self.started.strftime("%Y_%m_%d_%H_%M_%S")}.txt'
+        )
+
+        stats = io.StringIO()
+        pstats.Stats(self._profiler, stream=stats).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+        with open(path, 'w') as f:
+            f.write(f'# {self.script} run of {self.started.isoformat(timespec="seconds")}, '
+                    f'{self.seconds:.3f} seconds, peak traced memory {self.peak_bytes / 1024 ** 2:.1f} MB\n\n')
+            for stage in self.stages:
+                f.write(f'{json.dumps(stage.to_dict())}\n')
+
+            f.write('\n# cProfile, by cumulative time\n')
+            f.write(stats.getvalue())
+
+            f.write('\n# tracemalloc, largest allocations still held at the end of the run\n')
+            for stat in self._snapshot.statistics('lineno')[:PROFILE_TOP]:
+                f.write(f'{stat}\n')
+
+        self.profile_path = path
+        LOG.info(f'Wrote profile of <{self.script}> to <{path}>.')
+        return path
+
+
+def row_count(value):
+    '''Number of rows in a frame, series or list, or the first of a tuple of them'''
+    if isinstance(value, tuple):
+        return row_count(value[0]) if value else None
+    if value is None or isinstance(value, (str, bytes, dict)):
+        return None
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+@contextmanager
+def stage(name, rows_in = None, **labels):
+    '''
+    Time the enclosed block as stage `name` of the current run, if there is
+    one. Yields the `StageRecord`, on which `rows_out` can be set.
+    '''
+    record = StageRecord(name, rows_in, **labels)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        LOG.debug(f'Stage <{name}> {labels or ""} took <{record.seconds:.3f}> seconds, '
+                  f'<{record.rows_in}> rows in and <{record.rows_out}> rows out.')
+        if RUN_STATS is not None:
+            RUN_STATS.record(record)
+
+
+def timed(name = None):
+    '''
+    Decorate a function to time each call as a stage, named after the function
+    by default. Rows are counted from its first argument and its result.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__, row_count(args[0]) if args else None) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = row_count(result)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def instrument_run(script, profile = False, profile_dir = None):
+    '''
+    Record the stages of a `script` run within the enclosed block and log a
+    one line JSON summary once it ends, however it ends. With `profile` set, a
+    cProfile and tracemalloc report is also written to `profile_dir`.
+    '''
+    global RUN_STATS
+    stats = RunStats(script, profile)
+    RUN_STATS = stats
+    stats.start()
+
+    status = 'ok'
+    try:
+        yield stats
+    except SystemExit as e:
+        status = 'failed' if e.code else 'ok'
+        raise
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        stats.stop(status)
+        RUN_STATS = None
+        if profile:
+            try:
+                stats.write_profile(profile_dir or os.getcwd())
+            except OSError as e:
+                LOG.warning(f'Could not write profile of <{script}>: <{e}>')
+        LOG.info(json.dumps(stats.summary()))
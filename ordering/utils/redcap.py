@@ -1,9 +1,7 @@
 """order utilities for interacting with the REDCap projects"""
 import os, logging, sys
 import pandas as pd
-from redcap import Project
 from urllib.parse import urlparse
-from more_itertools import chunked
 
 # Place all modules within this script's path
 # TODO: structure directory better so we don't need this
@@ -11,10 +9,29 @@ base_dir = os.path.abspath(__file__ + "/../../../")
 sys.path.append(base_dir)
 
 from etc.ordering_script_config_map import PROJECT_DICT
+from ordering.utils.redcap_metadata import configure_project
+from ordering.utils.schema import apply_schema
 
 STUDY_PAUSE_REPORT_IDS = [1897, 1900]
 LOG = logging.getLogger(__name__)
 
+# Optional `ReportCache` consulted by `get_redcap_report`, set by scripts via `set_report_cache`
+REPORT_CACHE = None
+# Optional `MetadataCache` consulted by `init_project`, set by scripts via `set_metadata_cache`
+METADATA_CACHE = None
+
+
+def set_report_cache(cache):
+    '''Cache report exports in the given `ReportCache`, or disable caching with None'''
+    global REPORT_CACHE
+    REPORT_CACHE = cache
+
+
+def set_metadata_cache(cache):
+    '''Configure projects from the given `MetadataCache`, or disable caching with None'''
+    global METADATA_CACHE
+    METADATA_CACHE = cache
+
 
 def init_project(project_name):
     '''Fetch content of order reports for a given `project`'''
@@ -32,7 +49,15 @@ def init_project(project_name):
     )
 
     LOG.debug(f'Initializing REDCap project <{project_name}> from API endpoint: <{url.geturl()}>')
-    return Project(url.geturl(), api_key)
+
+    # PyCap pulls in requests and its dependencies, only import it once a project is needed
+    from redcap import Project
+
+    if METADATA_CACHE is None:
+        return Project(url.geturl(), api_key)
+
+    project = Project(url.geturl(), api_key, lazy=True)
+    return configure_project(project, PROJECT_DICT[project_name]['project_id'], METADATA_CACHE)
 
 
 def format_longitudinal(orders, project):
@@ -46,15 +71,38 @@ def format_longitudinal(orders, project):
 
     LOG.info(f'Reformatting <{project}> as a longitudinal project.')
 
-    # Cast order date as a datetime and replace any NA values
-    orders['Order Date'] = pd.to_datetime(orders['Order Date'])
-    orders['Order Date'].replace('', pd.NA, inplace=True)
+    # Cast order date as a datetime and replace any NA values, unless the
+    # report schema already parsed it
+    if not pd.api.types.is_datetime64_any_dtype(orders['Order Date']):
+        orders['Order Date'] = pd.to_datetime(orders['Order Date'])
+        orders['Order Date'].replace('', pd.NA, inplace=True)
 
     return orders
 
 
-def get_redcap_report(redcap_project, project_name, report_id = None):
-    '''Get the order report for a given redcap project'''
+def broadcast_first_event(records, columns, event = '0_arm_1'):
+    '''
+    Copy per-record attributes which REDCap only stores on the first `event` of
+    a record onto every event of that same record. `columns` may be a single
+    column name or a list of them.
+    '''
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    LOG.debug(f'Broadcasting <{columns}> from event <{event}> to all events of each record.')
+
+    first_event = records.loc[records.index.get_level_values(1) == event, columns].droplevel(1)
+    first_event = first_event[~first_event.index.duplicated()]
+
+    first_event = first_event.reindex(records.index.get_level_values(0))
+    for column in columns:
+        records[column] = first_event[column].to_numpy()
+    return records
+
+
+def get_redcap_report(redcap_project, project_name, report_id = None, parse_order_dates = True):
+    '''
+    Get the order report for a given redcap project, typed by its schema.
+    With `parse_order_dates` unset, order dates are kept as exported by REDCap.
+    '''
     if not report_id:
         LOG.debug(f'Fetching `report_id` from config for project <{project_name}>')
         report_id = PROJECT_DICT[project_name]['Report Id']
@@ -63,15 +111,28 @@ def get_redcap_report(redcap_project, project_name, report_id = None):
 
     LOG.info(f'Fetching report <{report_id}> for project <{project_name}>')
 
-    report = redcap_project.export_reports(
-        report_id=report_id,
-        format='df'
-    ).rename(columns=PROJECT_DICT[project_name])
+    report = export_report(redcap_project, project_name, report_id).rename(columns=PROJECT_DICT[project_name])
+    report = apply_schema(report, project_name, parse_order_dates)
 
     LOG.debug(f'Original report <{report_id}> for project <{project_name}> has <{len(report)}> rows.')
     return report.sort_index()
 
 
+def export_report(redcap_project, project_name, report_id):
+    '''Export a report as a frame, reusing a recent export from `REPORT_CACHE` if there is one'''
+    if REPORT_CACHE is None:
+        return redcap_project.export_reports(report_id=report_id, format='df')
+
+    cache_key = (redcap_project.url, PROJECT_DICT[project_name]['project_id'], report_id)
+    report = REPORT_CACHE.get(*cache_key)
+
+    if report is None:
+        report = redcap_project.export_reports(report_id=report_id, format='df')
+        REPORT_CACHE.put(*cache_key, report)
+
+    return report
+
+
 def get_cascadia_study_pause_reports(project):
     """Gets and concatenates Cascadia study pauses into one report"""
     LOG.debug(f'Fetching <{len(STUDY_PAUSE_REPORT_IDS)}> Cascadia study pause reports.')
@@ -88,6 +149,13 @@ def import_records_batched(project, records, batch_size = 50):
     Import *records* to a REDCap *project* with the given *batch_size*, so as not to overload REDCap's servers
     with large import requests.
     """
-    for chunk in chunked(range(len(records)), batch_size):
-        project.import_records(records.iloc[chunk], overwrite='overwrite')
-        LOG.debug(f'Imported records <{chunk[0]}> up to <{chunk[-1]}> to REDCap.')
+    from more_itertools import chunked
+
+    try:
+        for chunk in chunked(range(len(records)), batch_size):
+            project.import_records(records.iloc[chunk], overwrite='overwrite')
+            LOG.debug(f'Imported records <{chunk[0]}> up to <{chunk[-1]}> to REDCap.')
+    finally:
+        # cached reports of the server no longer reflect its records, even after a partial import
+        if REPORT_CACHE is not None:
+            REPORT_CACHE.invalidate(project.url)
@@ -0,0 +1,124 @@
+"""on-disk cache of REDCap project metadata shared by the ordering and dashboard scripts"""
+import os, logging, time, json, hashlib, threading
+
+LOG = logging.getLogger(__name__)
+
+# Events, arms and the data dictionary change rarely and only with a project
+# revision, so a day old copy is almost always current.
+DEFAULT_METADATA_TTL = 24 * 60 * 60
+
+# REDCap API `content` types which are cached, all exported as JSON except `version`
+METADATA_CONTENTS = ('metadata', 'event', 'arm', 'version')
+
+
+def requests_post(url, **kwargs):
+    '''`requests.post`, importing requests on first use rather than on import'''
+    import requests
+    return requests.post(url, **kwargs)
+
+
+class MetadataCache:
+    """
+    Stores REDCap project metadata under `directory`, keyed by the API URL,
+    project id and the `content` type exported. Entries are refetched once they
+    are older than `ttl` seconds, when a caller finds they no longer match the
+    project and asks for them with `refresh`, or always with `refresh` set here.
+    """
+
+    def __init__(self, directory, ttl = DEFAULT_METADATA_TTL, refresh = False, post = None):
+        self.directory = directory
+        self.ttl = ttl
+        self.refresh = refresh
+        self.post = post or requests_post
+
+    def path(self, url, project_id, content):
+        '''Path of the cached `content` for a project'''
+        key = hashlib.sha256(f'{url}|{project_id}'.encode()).hexdigest()[:24]
+        return os.path.join(self.directory, f'{content}_{project_id}_{key}.json')
+
+    def get(self, url, project_id, token, content, refresh = False):
+        '''Return the `content` metadata of a project, fetching it if the cached copy is missing or stale'''
+        if content not in METADATA_CONTENTS:
+            raise ValueError(f'Unsupported REDCap metadata content <{content}>')
+
+        path = self.path(url, project_id, content)
+
+        if not (refresh or self.refresh):
+            cached = self._load(path)
+            if cached is not None:
+                return cached
+
+        LOG.debug(f'Fetching <{content}> metadata for project <{project_id}>.')
+        r = self.post(url, data={'token': token, 'content': content, 'format': 'json', 'returnFormat': 'json'})
+        if is_classic_project_error(r, content):
+            value = []
+        else:
+            r.raise_for_status()
+            value = r.text if content == 'version' else r.json()
+
+        self._save(path, value)
+        return value
+
+    def invalidate(self, url, project_id):
+        '''Forget every cached `content` of a project'''
+        for content in METADATA_CONTENTS:
+            try:
+                os.remove(self.path(url, project_id, content))
+            except OSError:
+                pass
+
+    def _load(self, path):
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.ttl:
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, path, value):
+        os.makedirs(self.directory, exist_ok=True)
+
+        # write to a temporary file first so concurrent runs never read a partial entry
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+
+def is_classic_project_error(response, content):
+    '''
+    Whether `response` is the error REDCap gives when exporting the events or
+    arms of a classic project, which simply has none.
+    '''
+    if content not in ('event', 'arm') or response.status_code != 400:
+        return False
+    try:
+        error = response.json().get('error', '')
+    except (ValueError, AttributeError):
+        return False
+    return 'classic project' in error
+
+
+def configure_project(project, project_id, cache):
+    '''
+    Fill in the attributes of a lazily created PyCap `project` from cached
+    metadata, standing in for the four API calls `Project.configure` makes.
+    '''
+    metadata = cache.get(project.url, project_id, project.token, 'metadata')
+    events = cache.get(project.url, project_id, project.token, 'event')
+    arms = cache.get(project.url, project_id, project.token, 'arm')
+
+    project.metadata = metadata
+    project.redcap_version = cache.get(project.url, project_id, project.token, 'version')
+    project.field_names = project.filter_metadata('field_name')
+    project.def_field = project.field_names[0]
+    project.field_labels = project.filter_metadata('field_label')
+    project.forms = tuple(set(c['form_name'] for c in metadata))
+    project.events = events or ()
+    project.arm_nums = tuple(a['arm_num'] for a in arms)
+    project.arm_names = tuple(a['name'] for a in arms)
+    project.configured = True
+
+    return project
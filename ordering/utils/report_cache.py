@@ -0,0 +1,128 @@
+"""on-disk cache of REDCap report exports"""
+import os, logging, time, hashlib, threading
+
+LOG = logging.getLogger(__name__)
+
+# Reports are reused by runs within the same cron window, but should not
+# outlive it by much since REDCap records change throughout the day.
+DEFAULT_CACHE_TTL = 15 * 60
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ReportCache:
+    """
+    Stores exported REDCap reports under `directory`, keyed by the API URL,
+    project id and report id they were exported from. Entries older than `ttl`
+    seconds are treated as missing, and the least recently written entries are
+    evicted once the cache grows past `max_bytes`. With `refresh` set, every
+    report is fetched again and the cache is only written to.
+    """
+
+    def __init__(self, directory, ttl = DEFAULT_CACHE_TTL, max_bytes = DEFAULT_CACHE_MAX_BYTES, refresh = False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+
+    def path(self, url, project_id, report_id):
+        '''Path of the cached export for the given report'''
+        key = hashlib.sha256(f'{url}|{project_id}|{report_id}'.encode()).hexdigest()[:24]
+        return os.path.join(self.directory, f'report_{server_key(url)}_{project_id}_{report_id}_{key}.pkl')
+
+    def invalidate(self, url, project_id = None):
+        '''Remove the cached reports of a project on the REDCap server at `url`, or of every project on it'''
+        prefix = f'report_{server_key(url)}_' + (f'{project_id}_' if project_id is not None else '')
+        LOG.debug(f'Invalidating cached reports <{prefix}*>.')
+
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.startswith(prefix) and entry.name.endswith('.pkl'):
+                    self._remove(entry.path)
+
+    def get(self, url, project_id, report_id):
+        '''Return the cached export of a report, or None if it is missing or stale'''
+        path = self.path(url, project_id, report_id)
+
+        if self.refresh:
+            LOG.debug(f'Refreshing cached report <{report_id}> for project <{project_id}>.')
+            return None
+
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return None
+
+        if age > self.ttl:
+            LOG.debug(f'Cached report <{report_id}> for project <{project_id}> expired <{int(age)}> seconds ago.')
+            return None
+
+        # imported here so scripts building a cache for their arguments do not load pandas
+        import pandas as pd
+
+        try:
+            report = pd.read_pickle(path)
+        except Exception as e:
+            LOG.warning(f'Ignoring unreadable cached report <{path}>: <{e}>')
+            return None
+
+        LOG.info(f'Using cached report <{report_id}> for project <{project_id}> from <{int(age)}> seconds ago.')
+        return report
+
+    def put(self, url, project_id, report_id, report):
+        '''Cache the export of a report and evict entries beyond the size limit'''
+        path = self.path(url, project_id, report_id)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # write to a temporary file first so concurrent runs never read a partial export
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        report.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+        LOG.debug(f'Cached report <{report_id}> for project <{project_id}> at <{path}>.')
+        self.evict()
+
+    def evict(self):
+        '''Remove expired entries, then the oldest entries until the cache fits `max_bytes`'''
+        now = time.time()
+        entries = []
+
+        for entry in os.scandir(self.directory):
+            if not (entry.is_file() and entry.name.endswith('.pkl')):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                # evicted by another run or thread in the meantime
+                continue
+
+            if now - stat.st_mtime > self.ttl:
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+            total_bytes -= size
+
+    def clear(self):
+        '''Remove every cached report'''
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith('.pkl'):
+                    self._remove(entry.path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            LOG.debug(f'Evicted cached report <{path}>.')
+        except OSError:
+            pass
+
+
+def server_key(url):
+    '''Short key of a REDCap API `url`, naming the cached reports exported from it'''
+    return hashlib.sha256(url.encode()).hexdigest()[:8]
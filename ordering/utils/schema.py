@@ -0,0 +1,81 @@
+"""Column types of REDCap order reports, applied once as reports are loaded"""
+import logging
+import pandas as pd
+
+from etc.ordering_script_config_map import PROJECT_DICT
+
+LOG = logging.getLogger(__name__)
+
+# REDCap bookkeeping columns repeating a handful of values on every row
+CATEGORICAL_COLS = ['redcap_event_name', 'redcap_repeat_instrument']
+
+# Free text address fields, after renaming. Zipcodes stay numeric for export.
+ADDRESS_COLS = [
+    f'{field}{suffix}'
+    for suffix in ['', ' 2', ' 3']
+    for field in ['Street Address', 'Apt Number', 'City', 'State']
+]
+
+DATE_COLS = ['Order Date', 'Order Date 2']
+
+# Instrument status flags: 0 (Incomplete), 1 (Unverified) or 2 (Complete)
+COMPLETE_SUFFIX = '_complete'
+COMPLETE_DTYPE = 'Int8'
+
+
+def report_schema(project, parse_order_dates = True):
+    '''
+    The dtype of each column of the renamed order report of a `project`,
+    derived from its column mapping in `PROJECT_DICT`. Instrument `*_complete`
+    flags are typed by `apply_schema` without being listed here. Order dates
+    are left as exported with `parse_order_dates` unset.
+    '''
+    mapped = set(PROJECT_DICT[project].values())
+
+    schema = {col: 'category' for col in CATEGORICAL_COLS}
+    schema.update({col: 'string' for col in ADDRESS_COLS if col in mapped})
+    if parse_order_dates:
+        schema.update({col: 'datetime64[ns]' for col in DATE_COLS if col in mapped})
+    return schema
+
+
+def apply_schema(report, project, parse_order_dates = True):
+    '''
+    Cast the columns of a renamed order `report` of a `project` to the types of
+    its `report_schema`. Dates are parsed with the project's `Order Date Format`
+    when it has one, falling back on inferring the format of dates not matching it.
+    Reports whose dates are exported as is, like the USPS order report, should
+    be loaded with `parse_order_dates` unset.
+    '''
+    schema = report_schema(project, parse_order_dates)
+    date_format = PROJECT_DICT[project].get('Order Date Format')
+    LOG.debug(f'Applying report schema of <{project}> to <{len(report.columns)}> columns.')
+
+    # reports may hold several columns of the same name, so cast them by position
+    columns = []
+    for position, name in enumerate(report.columns):
+        column = report.iloc[:, position]
+
+        if str(name).endswith(COMPLETE_SUFFIX):
+            column = pd.to_numeric(column, errors='coerce').astype(COMPLETE_DTYPE)
+        elif schema.get(name) == 'datetime64[ns]':
+            column = parse_dates(column, date_format)
+        elif name in schema:
+            column = column.astype(schema[name])
+
+        columns.append(column)
+
+    if not columns:
+        return report
+    return pd.concat(columns, axis=1)
+
+
+def parse_dates(column, date_format=None):
+    '''Parse a `column` of REDCap dates, using `date_format` if every date matches it'''
+    if date_format:
+        try:
+            return pd.to_datetime(column, format=date_format)
+        except (ValueError, TypeError):
+            LOG.debug(f'Dates of <{column.name}> do not match <{date_format}>, inferring their format.')
+
+    return pd.to_datetime(column)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.utils.airs import (AIRS_ORDER_FIELDS, AIRS_ORDER_FIELDS_2, determine_airs_order,
+                                 determine_airs_orders, filter_airs_orders)
+from best_address_test import load_mock_report
+
+
+class TestDetermineAirsOrders(unittest.TestCase):
+
+    def assertMatchesRowwise(self, orders):
+        expected = orders.apply(determine_airs_order, axis=1)
+        actual = determine_airs_orders(orders)
+
+        self.assertEqual(expected.to_csv(), actual.to_csv())
+
+    def test_airs_mock_report(self):
+        self.assertMatchesRowwise(load_mock_report('AIRS', 'subject_id').filter(like='week', axis=0))
+
+    def test_alternate_orders_need_more_than_one_field(self):
+        index = pd.MultiIndex.from_tuples([(1, 'week_1_arm_1'), (2, 'week_1_arm_1'), (3, 'week_2_arm_1')],
+                                          names=['subject_id', 'redcap_event_name'])
+        orders = pd.DataFrame(np.nan, index=index, columns=AIRS_ORDER_FIELDS + AIRS_ORDER_FIELDS_2, dtype=object)
+        orders[AIRS_ORDER_FIELDS] = 'original'
+        orders.loc[(2, 'week_1_arm_1'), 'Order Date 2'] = '2022-05-02'
+        orders.loc[(3, 'week_2_arm_1'), ['Order Date 2', 'Zipcode 3']] = ['2022-05-09', 98105]
+
+        chosen = determine_airs_orders(orders)
+
+        self.assertEqual(chosen['Order Date'].tolist(), ['original', 'original', '2022-05-09'])
+        self.assertTrue(chosen.loc[(3, 'week_2_arm_1'), AIRS_ORDER_FIELDS[2:6]].isna().all())
+        self.assertMatchesRowwise(orders)
+
+
+class TestFilterAirsOrders(unittest.TestCase):
+
+    def test_latest_week_of_each_subject_is_ordered(self):
+        report = load_mock_report('AIRS', 'subject_id')
+        orders = filter_airs_orders(report.copy())
+
+        weeks = report.filter(like='week', axis=0).dropna(subset=['Order Date', 'Order Date 2'], how='all')
+        latest = weeks.groupby(level='subject_id').tail(1).index
+
+        self.assertEqual(orders.index.tolist(), latest.tolist())
+        self.assertTrue((orders['Project Name'] == 'AIRS').all())
+
+
+if __name__ == '__main__':
+    unittest.main()
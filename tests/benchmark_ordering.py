@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmarks each stage of the ordering pipelines over synthetic reports of a
+growing number of participants, reporting the best time of `--repeat` runs
+and the peak memory allocated while running the stage once more.
+
+    python tests/benchmark_ordering.py --participants 1000 10000 100000
+"""
+import argparse
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from pathlib import Path
+
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'tests'))
+
+# pylint: disable=import-error, wrong-import-position
+from synthetic_reports import make_cascadia_reports, make_hct_report, make_airs_report
+from ordering.scripts import delivery_express_order as de_order
+from ordering.scripts import usps_cascadia_order as usps
+from ordering.utils import cascadia
+from ordering.utils.airs import filter_airs_orders
+from ordering.utils.hct import filter_hct_orders
+
+# mean participants per household of the synthetic Cascadia reports
+PARTICIPANTS_PER_HOUSEHOLD = 5.5
+
+# `setup` builds the arguments of `run` from a project's reports, outside of the timings
+Stage = namedtuple('Stage', ['project', 'name', 'setup', 'run'])
+Result = namedtuple('Result', ['participants', 'project', 'stage', 'rows', 'seconds', 'peak_mb'])
+
+STAGES = [
+    Stage('Cascadia', 'get_kit_inventory', lambda r: (r.order_report,), cascadia.get_kit_inventory),
+    Stage('Cascadia', 'StudyPauseIndex', lambda r: (r.pause_report,), cascadia.StudyPauseIndex),
+    Stage('Cascadia', 'plan_household_kits',
+          lambda r: (r.order_report, cascadia.StudyPauseIndex(r.pause_report), r.serial_pts),
+          cascadia.plan_household_kits),
+    Stage('Cascadia', 'get_household_addresses', lambda r: (r.order_report,), cascadia.get_household_addresses),
+    Stage('Cascadia', 'usps_cascadia_order.generate_orders',
+          lambda r: (r.order_report, r.pause_report, r.serial_pts), usps.generate_orders),
+    Stage('Cascadia', 'filter_cascadia_orders',
+          lambda r: (r.order_report.copy(), r.enrollments.copy()), cascadia.filter_cascadia_orders),
+    Stage('HCT', 'filter_hct_orders', lambda r: (r.copy(),), filter_hct_orders),
+    Stage('HCT', 'generate_project_orders', lambda r: ('HCT', r.copy()), de_order.generate_project_orders),
+    Stage('AIRS', 'filter_airs_orders', lambda r: (r.copy(),), filter_airs_orders),
+    Stage('AIRS', 'generate_project_orders', lambda r: ('AIRS', r.copy()), de_order.generate_project_orders),
+]
+
+
+def make_reports(participants, seed=0):
+    '''Synthetic reports of each project holding about `participants` participants'''
+    return {
+        'Cascadia': make_cascadia_reports(max(int(participants / PARTICIPANTS_PER_HOUSEHOLD), 1), seed=seed),
+        'HCT': make_hct_report(participants, seed=seed),
+        'AIRS': make_airs_report(participants, seed=seed),
+    }
+
+
+def report_rows(reports):
+    return len(reports.order_report) if hasattr(reports, 'order_report') else len(reports)
+
+
+def time_stage(stage, reports, repeat=3):
+    '''The best time of `repeat` runs of a `stage` and its peak traced memory in MB'''
+    timings = []
+    for _ in range(repeat):
+        args = stage.setup(reports)
+        gc.collect()
+        start = time.perf_counter()
+        stage.run(*args)
+        timings.append(time.perf_counter() - start)
+
+    # memory is traced on a separate run since tracing slows everything down
+    args = stage.setup(reports)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage.run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(timings), peak / 1024 ** 2
+
+
+def run_benchmarks(sizes, seed=0, repeat=3, projects=None):
+    '''Benchmark every stage of the `projects` at each number of participants in `sizes`'''
+    results = []
+    for participants in sizes:
+        reports = make_reports(participants, seed)
+        for stage in STAGES:
+            if projects and stage.project not in projects:
+                continue
+            seconds, peak_mb = time_stage(stage, reports[stage.project], repeat)
+            results.append(Result(participants, stage.project, stage.name,
+                                  report_rows(reports[stage.project]), seconds, peak_mb))
+            print('{: >8} {: <10}{: <40}{: >10.3f}s{: >10.1f} MB'.format(
+                participants, stage.project, stage.name, seconds, peak_mb), flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ordering pipelines over synthetic REDCap reports.')
+    parser.add_argument('--participants', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Numbers of participants to generate reports of.')
+    parser.add_argument('--projects', nargs='+', choices=['Cascadia', 'HCT', 'AIRS'],
+                        help='Only benchmark the stages of these projects.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs of each stage.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic reports.')
+    parser.add_argument('--output', help='Optional CSV file to save the results to.')
+    args = parser.parse_args()
+
+    # stages log every order they make, keep the output to the timings
+    logging.disable(logging.WARNING)
+
+    results = run_benchmarks(args.participants, args.seed, args.repeat, args.projects)
+    if args.output:
+        pd.DataFrame(results).to_csv(args.output, index=False)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+from os import path
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.utils.common import use_best_address, use_best_addresses
+from etc.ordering_script_config_map import PROJECT_DICT
+
+
+def load_mock_report(project, index_col):
+    """Load a mock REDCap report the same way PyCap exports it as a frame"""
+    proj_name = project.lower()
+    mock_csv = path.join(path_root, f'tests/data/{proj_name}/{proj_name}_mock_report.csv')
+    return pd.read_csv(mock_csv, index_col=[index_col, 'redcap_event_name']).rename(
+        columns=PROJECT_DICT[project]
+    )
+
+
+class TestUseBestAddresses(unittest.TestCase):
+
+    def assertMatchesRowwise(self, enrollments, orders, event=''):
+        expected = orders.apply(lambda row: use_best_address(enrollments, row, event), axis=1)
+        actual = use_best_addresses(enrollments, orders, event)
+
+        self.assertEqual(expected.to_csv(), actual.to_csv())
+
+    def test_hct_mock_report(self):
+        report = load_mock_report('HCT', 'record_id')
+        orders = report.filter(like='encounter_arm_1', axis=0).dropna(subset=['Order Date'])
+        orders = orders[~orders.index.duplicated(keep='last')]
+
+        self.assertMatchesRowwise(report.filter(like='enrollment_arm_1', axis=0), orders, 'enrollment_arm_1')
+
+    def test_airs_mock_report(self):
+        report = load_mock_report('AIRS', 'subject_id')
+        orders = report.filter(like='week', axis=0)
+
+        self.assertMatchesRowwise(
+            report.filter(like='screening_and_enro_arm_1', axis=0), orders, 'screening_and_enro_arm_1'
+        )
+
+    def test_repeated_records_without_event(self):
+        index = pd.MultiIndex.from_tuples(
+            [(1, '0_arm_1'), (1, '0_arm_1'), (2, '0_arm_1'), (2, '0_arm_1')],
+            names=['household_id', 'redcap_event_name']
+        )
+        orders = pd.DataFrame({
+            'Street Address 2': ['1 New St', np.nan, np.nan, np.nan],
+            'Apt Number 2': [np.nan, np.nan, 'B', np.nan],
+            'City 2': ['Tacoma', np.nan, np.nan, np.nan],
+            'State 2': ['WA', np.nan, np.nan, np.nan],
+            'Zipcode 2': [98402.0, np.nan, np.nan, np.nan],
+            'First Name': ['Pat', np.nan, 'Sam', np.nan],
+            'Last Name': [np.nan, np.nan, 'Smith', np.nan],
+        }, index=index)
+        enrollments = pd.DataFrame({
+            'Street Address': ['1 Old St', '2 Old St'],
+            'Apt Number': [np.nan, '3'],
+            'City': ['Seattle', 'Seattle'],
+            'State': ['WA', 'WA'],
+            'Zipcode': [98105.0, 98115.0],
+            'First Name': ['Patricia', 'Samuel'],
+            'Last Name': ['Jones', 'Smith'],
+            'Email': ['pat@example.com', np.nan],
+            'Project Name': [1, 2],
+        }, index=pd.MultiIndex.from_tuples([(1, '0_arm_1'), (2, '0_arm_1')]))
+
+        self.assertMatchesRowwise(enrollments, orders)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+from pathlib import Path
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'update_dashboards'))
+
+# pylint: disable=import-error, wrong-import-position
+from cached_worksheet import CachedWorksheet
+
+
+class FakeWorksheet:
+    """A worksheet which only ever grows, counting the reads made of it"""
+
+    title = 'kits'
+
+    def __init__(self, rows):
+        self.rows = [list(r) for r in rows]
+        self.reads = []
+
+    def get_all_records(self, head=1):
+        self.reads.append('get_all_records')
+        header = self.rows[head - 1]
+        return [dict(zip(header, r)) for r in self.rows[head:]]
+
+    def row_values(self, row):
+        self.reads.append('row_values')
+        return self.rows[row - 1]
+
+    def col_values(self, col):
+        self.reads.append('col_values')
+        return [r[col - 1] for r in self.rows]
+
+    def append_rows(self, rows, value_input_option='RAW', insert_data_option=None, table_range=None):
+        self.rows.extend(list(r) for r in rows)
+
+
+class TestCachedWorksheet(unittest.TestCase):
+
+    def setUp(self):
+        self.worksheet = FakeWorksheet([['Date', 'Project', 'count'], ['2022-05-01', 'HCT', 3], ['2022-05-01', 'AIRS', 1]])
+        self.sheet = CachedWorksheet(self.worksheet)
+
+    def test_records_are_read_once_and_kept_current(self):
+        records = self.sheet.get_all_records()
+        self.sheet.append_rows([['2022-05-02', 'HCT', 4], ['2022-05-02', 'AIRS']])
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(self.sheet.get_all_records(), self.worksheet.get_all_records()[:3] + [
+            {'Date': '2022-05-02', 'Project': 'AIRS', 'count': ''}
+        ])
+        self.assertEqual(self.worksheet.reads, ['get_all_records', 'get_all_records'])
+
+    def test_row_count_is_tracked_across_appends(self):
+        self.assertEqual(self.sheet.next_available_row(), 4)
+        self.sheet.append_rows([['2022-05-02', 'HCT', 4]])
+        self.sheet.append_rows([])
+
+        self.assertEqual(self.sheet.next_available_row(), 5)
+        self.assertEqual(self.worksheet.reads, ['col_values'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+import unittest
+import datetime
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+import ordering.utils.cascadia as cascadia
+from ordering.utils.common import USPS_EXPORT_COLS
+from ordering.scripts import usps_cascadia_order as usps
+
+
+def make_order_report(num_households, seed=0):
+    """Build a small randomized Cascadia order report and pause report"""
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    now = datetime.datetime.now()
+    rows, pauses = [], []
+
+    for house_id in range(1, num_households + 1):
+        num_participants = int(rng.integers(1, 11))
+        hh_reporter = int(rng.integers(0, num_participants)) if rng.random() < 0.8 else np.nan
+        rows.append({
+            'household_id': house_id, 'redcap_event_name': 'household_arm_1',
+            'HH Reporter': hh_reporter, 'Project Name': int(rng.integers(1, 3)),
+        })
+
+        for participant in range(num_participants):
+            event = f'{participant}_arm_1'
+            ptid = house_id * 100 + participant
+            rows.append({
+                'household_id': house_id, 'redcap_event_name': event,
+                'manage_archive': 1 if rng.random() < 0.1 else np.nan,
+                'enrollment_survey_complete': 2 if rng.random() < 0.9 else 0,
+                'consent_form_complete': 2 if rng.random() < 0.9 else 0,
+                'es_ptid': ptid,
+                'First Name': f'First{ptid}', 'Last Name': f'Last{ptid}',
+                'Pref First Name': f'Pref{ptid}' if rng.random() < 0.5 else np.nan,
+                'Street Address': f'{ptid} Main St', 'Apt Number': np.nan,
+                'City': 'Seattle', 'State': 'WA', 'Zipcode': 98000.0 + house_id,
+                'Email': f'{ptid}@example.com', 'Phone': '(555) 555-5555',
+                'Delivery Instructions': 'Front porch',
+            })
+
+            for instance in range(1, int(rng.integers(0, 3)) + 1):
+                barcodes = {
+                    col: f'B{ptid}{instance}{i}' for i, col in enumerate(cascadia.BARCODE_COLUMNS)
+                    if rng.random() < 0.2
+                }
+                rows.append({
+                    'household_id': house_id, 'redcap_event_name': event,
+                    'redcap_repeat_instrument': 'swab_barcodes', 'redcap_repeat_instance': instance,
+                    'swab_barcodes_complete': 2 if rng.random() < 0.8 else 0, **barcodes,
+                })
+
+            for instance in range(1, int(rng.integers(0, 5)) + 1):
+                new_address = rng.random() < 0.3
+                survey_date = now - datetime.timedelta(minutes=int(rng.integers(0, 60 * 24 * 60)))
+                rows.append({
+                    'household_id': house_id, 'redcap_event_name': event,
+                    'redcap_repeat_instrument': 'symptom_survey', 'redcap_repeat_instance': instance,
+                    'ss_return_tracking': f'DE{ptid}{instance}' if rng.random() < 0.5 else np.nan,
+                    'ss_date_1': survey_date.strftime('%Y-%m-%d %H:%M'),
+                    'Order Date': survey_date.strftime('%Y-%m-%d'),
+                    'Street Address 2': f'{ptid} New St' if new_address else np.nan,
+                    'Apt Number 2': np.nan,
+                    'City 2': 'Tacoma' if new_address else np.nan,
+                    'State 2': 'WA' if new_address else np.nan,
+                    'Zipcode 2': 98400.0 + house_id if new_address else np.nan,
+                })
+
+            # paused participants show up in both of the study pause reports
+            if rng.random() < 0.15:
+                for offset in (-30, int(rng.integers(-10, 10))):
+                    pauses.append({
+                        'household_id': house_id, 'redcap_event_name': event,
+                        'cl_study_pause_start': (today + datetime.timedelta(days=offset)).strftime('%Y-%m-%d'),
+                        'cl_study_pause_end': (today + datetime.timedelta(days=offset + 7)).strftime('%Y-%m-%d'),
+                    })
+
+    order_report = pd.DataFrame(rows).set_index(['household_id', 'redcap_event_name']).sort_index()
+    pause_report = pd.DataFrame(pauses).set_index(['household_id', 'redcap_event_name']).sort_index()
+    serial_pts = pd.Series(order_report['es_ptid'].dropna().sample(frac=0.1, random_state=seed).values)
+
+    return order_report, pause_report, serial_pts
+
+
+def legacy_generate_orders(order_report, pause_report, serial_pts, max_kits=6):
+    """The original per-household ordering loop, kept as a reference implementation"""
+    orders = pd.DataFrame(columns=USPS_EXPORT_COLS)
+    household_ids = set(i[0] for i in order_report.index)
+
+    for house_id in household_ids:
+        kits_needed = {'resupply': {}, 'welcome': {}, 'serial': {}}
+        participants = set(
+            i[1] for i in order_report.index if i[0] == house_id and i[1] != 'household_arm_1'
+        )
+        needs_resupply = cascadia.household_needs_resupply(house_id, participants, order_report, threshold=3)
+
+        for participant in participants:
+            pt_data = order_report.loc[[(house_id, participant)]]
+
+            if any(pt_data['manage_archive'] == 1):
+                continue
+            if not (any(pt_data['enrollment_survey_complete'] == 2) and any(pt_data['consent_form_complete'] == 2)):
+                continue
+            if cascadia.participant_under_study_pause(pause_report, house_id, participant):
+                continue
+            if not any(pt_data['swab_barcodes_complete'] == 2):
+                kits_needed['welcome'][participant] = 1
+                continue
+            if needs_resupply:
+                num_kits = cascadia.get_participant_kit_count(pt_data)
+                kits_needed['resupply'][participant] = max(max_kits - num_kits, 0)
+            if any(pt_data['es_ptid'].isin(serial_pts)):
+                kits_needed['serial'][participant] = 1
+
+        if kits_needed['welcome'] or kits_needed['resupply'] or kits_needed['serial']:
+            address = cascadia.get_household_address(order_report, house_id)
+        if kits_needed['resupply']:
+            orders = cascadia.append_order(orders, house_id, 1, sum(kits_needed['resupply'].values()), address)
+        if kits_needed['serial']:
+            for _ in kits_needed['serial']:
+                orders = cascadia.append_order(orders, house_id, 2, 1, address)
+        if kits_needed['welcome']:
+            orders = cascadia.append_order(orders, house_id, 3, sum(kits_needed['welcome'].values()), address)
+
+    return orders
+
+
+class TestHouseholdKitPlanning(unittest.TestCase):
+
+    def setUp(self):
+        self.order_report, self.pause_report, self.serial_pts = make_order_report(60)
+
+    def test_kit_inventory_matches_participant_counts(self):
+        kit_counts = cascadia.get_participant_kit_counts(self.order_report)
+
+        for house_id, participant in kit_counts.index:
+            pt_data = self.order_report.loc[[(house_id, participant)]]
+            self.assertEqual(
+                kit_counts[(house_id, participant)], cascadia.get_participant_kit_count(pt_data)
+            )
+
+    def test_study_pause_index_matches_participant_lookup(self):
+        study_pauses = cascadia.StudyPauseIndex(self.pause_report)
+        participants = self.order_report.index.unique()
+        paused = study_pauses.paused_mask(participants)
+
+        self.assertTrue(paused.any())
+        for house_id, participant in participants:
+            expected = cascadia.participant_under_study_pause(self.pause_report, house_id, participant)
+            self.assertEqual(study_pauses.is_paused(house_id, participant), expected)
+            self.assertEqual(paused[(house_id, participant)], expected)
+
+    def test_study_pause_index_handles_single_and_overlapping_pauses(self):
+        pause_report = pd.DataFrame({
+            'household_id': [1, 2, 2],
+            'redcap_event_name': ['0_arm_1', '0_arm_1', '0_arm_1'],
+            'cl_study_pause_start': ['2022-01-01', '2022-02-01', '2022-02-05'],
+            'cl_study_pause_end': ['2022-01-10', '2022-03-01', '2022-02-10'],
+        }).set_index(['household_id', 'redcap_event_name'])
+        study_pauses = cascadia.StudyPauseIndex(pause_report)
+
+        self.assertTrue(study_pauses.is_paused(1, '0_arm_1', datetime.date(2022, 1, 10)))
+        self.assertFalse(study_pauses.is_paused(1, '0_arm_1', datetime.date(2022, 1, 11)))
+        self.assertTrue(study_pauses.is_paused(2, '0_arm_1', datetime.date(2022, 2, 20)))
+        self.assertFalse(study_pauses.is_paused(2, '1_arm_1', datetime.date(2022, 2, 20)))
+        self.assertFalse(cascadia.StudyPauseIndex(pd.DataFrame()).is_paused(1, '0_arm_1'))
+
+    def test_household_addresses_match_per_household_lookup(self):
+        households = self.order_report.index.get_level_values(0).unique()
+        addresses = cascadia.get_household_addresses(self.order_report)
+
+        for house_id in households:
+            expected = cascadia.get_household_address(self.order_report, house_id)
+            actual = addresses.loc[[house_id]].reset_index(drop=True)
+            pd.testing.assert_frame_equal(
+                expected.astype(str), actual[expected.columns].astype(str), check_names=False
+            )
+
+    def test_generated_orders_match_legacy_loop(self):
+        expected = legacy_generate_orders(self.order_report, self.pause_report, self.serial_pts)
+        actual = usps.generate_orders(self.order_report, self.pause_report, self.serial_pts)
+
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(expected.to_csv(index=False), actual.to_csv(index=False))
+
+    def test_order_builder_splits_like_append_order(self):
+        address = cascadia.get_household_addresses(self.order_report).iloc[[0]]
+        orders = pd.DataFrame(columns=USPS_EXPORT_COLS)
+        builder = cascadia.OrderBuilder(USPS_EXPORT_COLS)
+
+        for sku, quantity in [(1, 0), (1, 20), (1, 45), (2, 1), (3, 4), (3, 13), (3, 1)]:
+            orders = cascadia.append_order(orders, 7, sku, quantity, address.copy())
+            builder.add(7, sku, quantity, address.iloc[0])
+
+        self.assertEqual(orders.to_csv(index=False), builder.to_frame().to_csv(index=False))
+        self.assertEqual(cascadia.OrderBuilder().to_frame().columns.tolist(), USPS_EXPORT_COLS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+import threading
+import time
+import pandas as pd
+from pathlib import Path
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'update_dashboards'))
+
+# pylint: disable=import-error, wrong-import-position
+try:
+    import courier
+except ImportError:
+    courier = None
+
+
+def make_kpis(day, num_orders, offset=0):
+    """Build KPI report records for a day, with every third order returned"""
+    return [{
+        'OrderNumber': f'{day}-{offset + i}',
+        'CreateDate': day,
+        'ProjectName': ['HCT', 'AIRS', 'SCAN'][i % 3],
+        'Out/Return': 'Return' if i % 3 == 0 else 'Out',
+        'PUZip': 98100 + i % 5,
+        'DLZip': 98400 + i % 4,
+        'FalseTrip': int(i % 7 == 0),
+        'Late': int(i % 5 == 0),
+    } for i in range(num_orders)]
+
+
+def aggregate_by_day(table):
+    """The courier table of one day's orders, a Python call per order"""
+    table = table.copy()
+    table['ParticipantZip'] = table.apply(lambda x: x['PUZip'] if x['Out/Return'] == 'Return' else x['DLZip'], axis=1)
+    table = table.groupby(['CreateDate', 'ProjectName', 'Out/Return', 'ParticipantZip']).agg({
+        'Out/Return': 'count',
+        'FalseTrip': sum,
+        'Late': sum,
+    })
+    table.columns = ['orders', 'ft', 'late']
+    return table.reset_index().values.tolist()
+
+
+class FakeWorksheet:
+
+    def __init__(self, records):
+        self.records = records
+
+    def get_all_records(self):
+        time.sleep(0.01)
+        return self.records
+
+
+class FakeSpreadsheet:
+
+    def __init__(self, records):
+        self.records = records
+
+    def get_worksheet(self, index):
+        return FakeWorksheet(self.records)
+
+
+class FakeClient:
+    """A Drive of courier reports, counting how often files are listed and opened"""
+
+    def __init__(self, files):
+        self.files = files
+        self.listings = 0
+        self.opened = []
+        self.lock = threading.Lock()
+
+    def list_spreadsheet_files(self):
+        self.listings += 1
+        return [{'id': f'id-{name}', 'name': name} for name in self.files]
+
+    def open_by_key(self, key):
+        with self.lock:
+            self.opened.append(key)
+        return FakeSpreadsheet(self.files[key[len('id-'):]])
+
+
+@unittest.skipIf(courier is None, 'gspread is not installed')
+class TestCourierBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.days = ['5/1/2022', '5/2/2022', '5/3/2022', '5/4/2022']
+        files = {}
+        for n, day in enumerate(self.days[:3]):
+            files[courier.KPI_PREFIX + day.replace('/', '_')] = make_kpis(day, 10 + n)
+            files[courier.EXCEPTIONS_PREFIX + day.replace('/', '_')] = make_kpis(day, 3, offset=8)
+        # an empty exceptions report is skipped, as is a day without reports
+        files[courier.EXCEPTIONS_PREFIX + '5_3_2022'] = []
+        self.client = FakeClient(files)
+
+    def test_backfill_lists_files_once(self):
+        rows = courier.backfill_courier_data(self.client, self.days)
+
+        expected = []
+        for day in self.days[:2]:
+            expected.extend(courier.get_courier_data(
+                self.client, day, 'id-' + courier.KPI_PREFIX + day.replace('/', '_'),
+                'id-' + courier.EXCEPTIONS_PREFIX + day.replace('/', '_')))
+
+        self.assertEqual(rows, expected)
+        self.assertEqual(self.client.listings, 1)
+        self.assertEqual(len(self.client.opened), 6 + 4)
+
+    def test_batch_matches_daily_aggregation(self):
+        frames, expected = [], []
+        for n, day in enumerate(self.days):
+            # orders reported late, created on the day before their report
+            table = pd.DataFrame(make_kpis(day, 40 + n) + make_kpis(self.days[0], 5, offset=100 + n))
+            frames.append((day, table))
+            expected.extend(aggregate_by_day(table))
+
+        self.assertEqual(courier.aggregate_courier_data(frames), expected)
+        self.assertEqual(courier.aggregate_courier_data([]), [])
+
+    def test_blank_counts_are_zero(self):
+        table = pd.DataFrame(make_kpis(self.days[0], 4))
+        table.loc[1, 'FalseTrip'] = ''
+
+        rows = courier.aggregate_courier_data([(self.days[0], table)])
+
+        self.assertEqual([r[-2:] for r in rows], [[0, 0], [1, 1], [0, 0], [0, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
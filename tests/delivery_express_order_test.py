@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.scripts import delivery_express_order as de_order
+from ordering.utils.common import DE_EXPORT_COLS
+from best_address_test import load_mock_report
+
+
+class TestGenerateOrders(unittest.TestCase):
+
+    def setUp(self):
+        self.reports = {
+            'HCT': load_mock_report('HCT', 'record_id'),
+            'AIRS': load_mock_report('AIRS', 'subject_id'),
+        }
+
+    def fetch_project_report(self, project, report_id=None):
+        time.sleep(0.05)
+        if project not in self.reports:
+            raise ConnectionError(f'{project} REDCap is down')
+        return self.reports[project].copy()
+
+    def test_failed_project_does_not_block_others(self):
+        with patch.object(de_order, 'fetch_project_report', side_effect=self.fetch_project_report):
+            orders, failed_projects = de_order.generate_orders(['HCT', 'Cascadia', 'AIRS'])
+
+        self.assertEqual(failed_projects, ['Cascadia'])
+        self.assertEqual(sorted(orders['Project Name'].unique()), ['AIRS', 'HCT'])
+        self.assertEqual(orders.columns.tolist()[:len(DE_EXPORT_COLS)], DE_EXPORT_COLS)
+
+    def test_projects_are_fetched_concurrently(self):
+        fetching, overlapped = set(), []
+
+        def fetch_project_report(project, report_id=None):
+            fetching.add((project, report_id))
+            time.sleep(0.1)
+            overlapped.append(len(fetching))
+            return self.fetch_project_report(project, report_id)
+
+        with patch.object(de_order, 'fetch_project_report', side_effect=fetch_project_report):
+            _, failed_projects = de_order.generate_orders(['HCT', 'Cascadia', 'AIRS'])
+
+        # the Cascadia enrollment report is fetched alongside its order report
+        self.assertEqual(fetching, {('HCT', None), ('Cascadia', None), ('Cascadia', 2401), ('AIRS', None)})
+        self.assertEqual(failed_projects, ['Cascadia'])
+        self.assertEqual(max(overlapped), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+import unittest
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+import requests
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.utils.delivery_express import DeliveryExpressClient, index_de_orders
+
+
+def make_redcap_orders(record_ids):
+    """Build pending REDCap return orders for the given record ids"""
+    return pd.DataFrame({
+        'Record Id': record_ids,
+        'Order Date': pd.Timestamp('2022-05-06'),
+        'redcap_repeat_instance': range(1, len(record_ids) + 1),
+        'redcap_repeat_instrument': 'symptom_survey',
+    }, index=pd.Index([6] * len(record_ids), name='household_id'))
+
+
+def make_de_order(record_id, created_at='2022-05-11T06:54:19.7770043-07:00'):
+    """Build a DE order as returned by the orders search endpoint"""
+    return {
+        'orderId': f'DE{record_id}',
+        'createdAt': created_at,
+        'referenceNumber1': record_id,
+        'referenceNumber3': 'CASCADIA_SEA',
+    }
+
+
+class MockResponse:
+
+    def __init__(self, body, status_code=200):
+        self.text = json.dumps(body)
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f'{self.status_code} Server Error')
+
+
+class FakeDeliveryExpressServer:
+    """
+    A local stand-in for the Delivery Express orders search endpoint, serving a
+    fixed list of `orders` either by record id or page by page. Searches with an
+    empty `query` return page `pageNumber` (from 1) of `pageSize` orders along
+    with the `totalCount` of all orders, ignoring `createdFrom`. With `paging`
+    off, `pageNumber` is ignored and the first page is always served.
+    """
+
+    def __init__(self, orders, paging=True):
+        self.orders = orders
+        self.paging = paging
+        self.requests = []
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                fake.requests.append(payload)
+
+                if payload['query']:
+                    items = [o for o in fake.orders if str(o['referenceNumber1']) == str(payload['query'])]
+                    total = len(items)
+                else:
+                    start = (payload['pageNumber'] - 1) * payload['pageSize'] if fake.paging else 0
+                    items = fake.orders[start:start + payload['pageSize']]
+                    total = len(fake.orders)
+
+                body = json.dumps({'totalCount': total, 'items': items}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestDeliveryExpressClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = DeliveryExpressClient('user:pass', concurrency=8, max_retries=3)
+
+    def test_lookups_keep_input_order(self):
+        def search(url, data):
+            time.sleep(random.random() / 100)
+            record_id = json.loads(data)['query']
+            return MockResponse({'totalCount': 1, 'items': [make_de_order(record_id)]})
+
+        redcap_orders = make_redcap_orders(list(range(100, 140)))
+        with patch.object(self.client.session, 'post', side_effect=search):
+            order_ids = self.client.lookup_orders(redcap_orders)
+
+        self.assertTrue(order_ids.index.equals(redcap_orders.index))
+        self.assertEqual(order_ids.tolist(), [f'DE{i}' for i in range(100, 140)])
+
+    def test_failed_requests_are_retried(self):
+        responses = [
+            MockResponse({}, status_code=503),
+            MockResponse({'totalCount': 1, 'items': [make_de_order(7, '2022-01-01T06:54:19.7770043-07:00')]}),
+        ]
+
+        with patch.object(self.client.session, 'post', side_effect=responses) as post, \
+                patch('ordering.utils.delivery_express.time.sleep') as sleep:
+            order_ids = self.client.lookup_orders(make_redcap_orders([7]))
+
+        self.assertEqual(post.call_count, 2)
+        sleep.assert_called_once_with(0.5)
+        self.assertIsNone(order_ids.iloc[0])
+
+    def test_gives_up_after_max_retries(self):
+        with patch.object(self.client.session, 'post', side_effect=requests.exceptions.ConnectionError), \
+                patch('ordering.utils.delivery_express.time.sleep'):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.lookup_orders(make_redcap_orders([7]))
+
+    def test_authorization_is_encoded_once(self):
+        self.assertEqual(self.client.session.headers['Authorization'], 'Basic dXNlcjpwYXNz')
+
+
+class TestDeliveryExpressBulkLookup(unittest.TestCase):
+
+    def setUp(self):
+        # a mix of matching orders, stale orders, other projects and records not pending
+        self.de_orders = [make_de_order(i) for i in range(100, 400)]
+        self.de_orders += [make_de_order(i, '2022-01-01T06:54:19.7770043-07:00') for i in range(100, 120)]
+        self.de_orders += [dict(make_de_order(i), referenceNumber3='SCAN') for i in range(120, 130)]
+        for n, order in enumerate(self.de_orders):
+            order['orderId'] = f'DE{n}'
+        random.Random(0).shuffle(self.de_orders)
+        self.redcap_orders = make_redcap_orders(list(range(90, 150)))
+
+    def test_bulk_lookup_matches_per_order_lookup(self):
+        with FakeDeliveryExpressServer(self.de_orders) as server:
+            client = DeliveryExpressClient('user:pass', concurrency=4, url=server.url)
+            expected = client.lookup_orders(self.redcap_orders)
+
+            server.requests.clear()
+            actual = client.lookup_orders_bulk(self.redcap_orders)
+
+        pd.testing.assert_series_equal(expected, actual)
+        self.assertEqual(len(server.requests), 4)
+        self.assertTrue(actual.notna().any() and actual.isna().any())
+
+    def test_bulk_lookup_refuses_partial_results_without_paging(self):
+        with FakeDeliveryExpressServer(self.de_orders, paging=False) as server:
+            client = DeliveryExpressClient('user:pass', url=server.url)
+            with self.assertRaises(RuntimeError):
+                client.lookup_orders_bulk(self.redcap_orders)
+
+        self.assertEqual([r['pageNumber'] for r in server.requests], [1, 2])
+
+    def test_overlapping_pages_are_deduplicated(self):
+        with FakeDeliveryExpressServer(self.de_orders) as server:
+            client = DeliveryExpressClient('user:pass', url=server.url)
+            pages = [server.orders[:100], server.orders[50:150], server.orders[150:250], server.orders[250:]]
+            responses = [{'totalCount': len(server.orders), 'items': items} for items in pages]
+            with patch.object(client, 'search_orders', side_effect=responses):
+                orders = client.search_orders_since(pd.Timestamp('2022-05-06'))
+
+        self.assertEqual(len(orders), len(self.de_orders))
+        self.assertEqual(len({o['orderId'] for o in orders}), len(self.de_orders))
+
+    def test_index_de_orders(self):
+        order_index = index_de_orders([make_de_order(1), make_de_order('1'), make_de_order(2)])
+        self.assertEqual(sorted(order_index), ['1', '2'])
+        self.assertEqual(len(order_index['1']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.utils import instrumentation
+from ordering.utils.instrumentation import instrument_run, stage, timed, row_count
+from ordering.scripts import delivery_express_order as de_order
+from best_address_test import load_mock_report
+
+
+def summary_of(logs):
+    return json.loads(logs.records[-1].getMessage())
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_stages_are_recorded_with_row_counts(self):
+        frame = pd.DataFrame({'a': range(10)})
+
+        with self.assertLogs('ordering.utils.instrumentation', 'INFO') as logs:
+            with instrument_run('test_script') as stats:
+                with stage('filter', len(frame), project='HCT') as record:
+                    record.rows_out = len(frame[frame['a'] > 6])
+
+        summary = summary_of(logs)
+        self.assertEqual(summary['script'], 'test_script')
+        self.assertEqual(summary['status'], 'ok')
+        self.assertEqual(summary['stages'], [
+            {'stage': 'filter', 'project': 'HCT', 'seconds': stats.stages[0].to_dict()['seconds'],
+             'rows_in': 10, 'rows_out': 3}
+        ])
+        self.assertNotIn('peak_mb', summary)
+        self.assertIsNone(instrumentation.RUN_STATS)
+
+    def test_timed_counts_argument_and_result_rows(self):
+        @timed('halve')
+        def halve(frame):
+            return frame.iloc[:len(frame) // 2]
+
+        with self.assertLogs('ordering.utils.instrumentation', 'INFO') as logs:
+            with instrument_run('test_script'):
+                halve(pd.DataFrame({'a': range(8)}))
+
+        stage_summary = summary_of(logs)['stages'][0]
+        self.assertEqual((stage_summary['stage'], stage_summary['rows_in'], stage_summary['rows_out']), ('halve', 8, 4))
+
+    def test_stages_outside_a_run_are_not_kept(self):
+        with stage('orphan') as record:
+            pass
+
+        self.assertIsNotNone(record.seconds)
+        self.assertIsNone(instrumentation.RUN_STATS)
+
+    def test_stages_are_recorded_from_threads(self):
+        def work(n):
+            with stage('work', n):
+                pass
+
+        with self.assertLogs('ordering.utils.instrumentation', 'INFO') as logs:
+            with instrument_run('test_script'):
+                threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+        self.assertEqual(sorted(s['rows_in'] for s in summary_of(logs)['stages']), list(range(8)))
+
+    def test_summary_is_logged_when_a_run_fails(self):
+        with self.assertLogs('ordering.utils.instrumentation', 'INFO') as logs:
+            with self.assertRaises(SystemExit):
+                with instrument_run('test_script'):
+                    sys.exit(1)
+        self.assertEqual(summary_of(logs)['status'], 'failed')
+
+        with self.assertLogs('ordering.utils.instrumentation', 'INFO') as logs:
+            with self.assertRaises(KeyError):
+                with instrument_run('test_script'):
+                    with stage('lookup'):
+                        raise KeyError('missing')
+        self.assertEqual(summary_of(logs)['status'], 'error')
+        self.assertEqual(summary_of(logs)['stages'][0]['stage'], 'lookup')
+
+    def test_profile_report_is_written(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertLogs('ordering.utils.instrumentation', 'INFO') as logs:
+                with instrument_run('test_script', profile=True, profile_dir=directory):
+                    with stage('allocate'):
+                        [str(i) for i in range(10000)]
+
+            summary = summary_of(logs)
+            self.assertTrue(summary['profile'].startswith(directory))
+            self.assertGreater(summary['peak_mb'], 0)
+
+            with open(summary['profile']) as f:
+                report = f.read()
+            self.assertIn('"stage": "allocate"', report)
+            self.assertIn('cumulative', report)
+            self.assertIn('tracemalloc', report)
+
+    def test_row_count(self):
+        self.assertEqual(row_count(pd.Series([1, 2])), 2)
+        self.assertEqual(row_count((pd.DataFrame({'a': [1]}), None)), 1)
+        self.assertIsNone(row_count('HCT'))
+        self.assertIsNone(row_count(None))
+
+    def test_project_orders_are_staged(self):
+        report = load_mock_report('HCT', 'record_id')
+
+        with self.assertLogs('ordering.utils.instrumentation', 'INFO') as logs:
+            with instrument_run('delivery_express_order'):
+                orders = de_order.generate_project_orders('HCT', report)
+
+        stages = {s['stage']: s for s in summary_of(logs)['stages']}
+        self.assertEqual(stages['filter_orders']['project'], 'HCT')
+        self.assertEqual(stages['filter_orders']['rows_out'], len(orders))
+        self.assertEqual(stages['format_longitudinal']['rows_out'], stages['filter_orders']['rows_in'])
+
+
+if __name__ == '__main__':
+    unittest.main()
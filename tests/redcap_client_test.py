@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import unittest
+import io
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'update_dashboards'))
+
+# pylint: disable=import-error, wrong-import-position
+from redcap_client import RedcapClient, project_url, read_csv_frame
+
+
+class FakeRedcapServer:
+    """A local REDCap API which fails the first `failures` requests with a 503"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.requests = []
+        self.ports = set()
+        self.csv = ''
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+                fake.requests.append({k: v[0] for k, v in form.items()})
+                fake.ports.add(self.client_address[1])
+
+                if fake.failures:
+                    fake.failures -= 1
+                    status, body = 503, b'{}'
+                elif form.get('format') == ['csv']:
+                    status, body = 200, fake.csv.encode()
+                else:
+                    status, body = 200, json.dumps([{'record_id': form['token'][0]}]).encode()
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/csv' if form.get('format') == ['csv'] else 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestRedcapClient(unittest.TestCase):
+
+    def test_project_urls_and_tokens_are_resolved(self):
+        with FakeRedcapServer() as server, patch.dict(os.environ, {'REDCAP_API_URL': server.url}):
+            os.environ[f'REDCAP_API_TOKEN_{project_url("SCAN English").netloc}_22461'] = 'scan-token'
+            client = RedcapClient()
+            records = client.export('SCAN English', '22461', {'content': 'record'})
+
+        self.assertEqual(records, [{'record_id': 'scan-token'}])
+        self.assertEqual(server.requests[0]['content'], 'record')
+
+    def test_server_errors_are_retried(self):
+        with FakeRedcapServer(failures=2) as server, \
+                patch('redcap_client.time.sleep') as sleep:
+            client = RedcapClient(max_retries=3)
+            r = client.post(server.url, {'token': 'abc', 'content': 'record'})
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.5, 1.0])
+        self.assertEqual(client.metrics[0].attempts, 3)
+        self.assertEqual(client.metrics[0].bytes, len(r.content))
+
+    def test_requests_to_a_host_share_connections(self):
+        with FakeRedcapServer() as server:
+            client = RedcapClient(pool_size=2)
+            results = client.map(
+                lambda token: client.post(server.url, {'token': token}).json()[0]['record_id'],
+                [str(i) for i in range(20)]
+            )
+
+        self.assertEqual(results, [str(i) for i in range(20)])
+        self.assertLessEqual(len(server.ports), 2)
+        self.assertEqual(len(client.metrics), 20)
+
+    def test_csv_exports_are_streamed_into_frames(self):
+        with FakeRedcapServer() as server, patch.dict(os.environ, {'REDCAP_API_URL': server.url}):
+            server.csv = 'record_id,redcap_event_name,age\n1,Enrollment,30\n2,Enrollment,\n'
+            client = RedcapClient()
+            records = client.export_frame('PC', '23594', {'content': 'record', 'format': 'json'},
+                                          dtype={'record_id': int},
+                                          categories=['redcap_event_name'])
+
+        self.assertEqual(server.requests[0]['format'], 'csv')
+        self.assertEqual(records.values.tolist(), [[1, 'Enrollment', '30'], [2, 'Enrollment', '']])
+        self.assertEqual(records['redcap_event_name'].dtype, 'category')
+        self.assertEqual(client.metrics[0].bytes, len(server.csv))
+
+
+class TestReadCsvFrame(unittest.TestCase):
+
+    def test_categories_span_chunks(self):
+        rows = ''.join(f'{i},{["Enrollment", "Week 1", "Week 2"][i // 4]},{"" if i % 3 else "A"}\n' for i in range(12))
+        stream = io.BytesIO(('record_id,redcap_event_name,priority_code\n' + rows).encode())
+
+        records = read_csv_frame(stream, categories=['redcap_event_name', 'priority_code'], na_values=[''], chunksize=4)
+
+        self.assertEqual(records['redcap_event_name'].dtype, 'category')
+        self.assertEqual(list(records['redcap_event_name'].cat.categories), ['Enrollment', 'Week 1', 'Week 2'])
+        self.assertEqual(records['redcap_event_name'].tolist(), ['Enrollment'] * 4 + ['Week 1'] * 4 + ['Week 2'] * 4)
+        self.assertEqual(records['priority_code'].isna().sum(), 8)
+        self.assertEqual(records['record_id'].tolist(), [str(i) for i in range(12)])
+
+    def test_empty_exports(self):
+        self.assertTrue(read_csv_frame(io.BytesIO(b'')).empty)
+        self.assertEqual(list(read_csv_frame(io.BytesIO(b'record_id,age\n')).columns), ['record_id', 'age'])
+
+
+if __name__ == '__main__':
+    unittest.main()
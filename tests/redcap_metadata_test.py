@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import unittest
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from redcap import Project
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.utils.redcap_metadata import MetadataCache, configure_project
+
+
+METADATA = [
+    {'field_name': 'record_id', 'field_label': 'Record ID', 'form_name': 'enrollment'},
+    {'field_name': 'core_zipcode', 'field_label': 'Zipcode', 'form_name': 'enrollment'},
+    {'field_name': 'ss_date_1', 'field_label': 'Survey date', 'form_name': 'symptom_survey'},
+]
+EVENTS = [{'unique_event_name': 'enrollment_arm_1'}, {'unique_event_name': 'encounter_arm_1'}]
+ARMS = [{'arm_num': 1, 'name': 'Arm 1'}]
+
+
+class FakeResponse:
+
+    def __init__(self, body, status_code=200):
+        self.text = body if isinstance(body, str) else json.dumps(body)
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError(self.status_code)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeRedcap:
+
+    def __init__(self, longitudinal=True, failure=None):
+        self.longitudinal = longitudinal
+        self.failure = failure
+        self.requests = []
+
+    def post(self, url, data):
+        self.requests.append(data['content'])
+        if self.failure:
+            return FakeResponse(*self.failure)
+        if data['content'] in ('event', 'arm') and not self.longitudinal:
+            return FakeResponse({'error': f'You cannot export {data["content"]}s for classic projects'}, 400)
+        return FakeResponse({'metadata': METADATA, 'event': EVENTS, 'arm': ARMS, 'version': '12.0.1'}[data['content']])
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.redcap = FakeRedcap()
+        self.cache = MetadataCache(self.directory.name, post=self.redcap.post)
+        self.url = 'https://redcap.example.org/api/'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_metadata_is_fetched_once_per_project(self):
+        for project_id in ('148', '148', '1372'):
+            self.assertEqual(self.cache.get(self.url, project_id, 'token', 'event'), EVENTS)
+
+        self.assertEqual(self.redcap.requests, ['event', 'event'])
+
+    def test_stale_and_refreshed_metadata_is_fetched_again(self):
+        self.cache.get(self.url, '148', 'token', 'event')
+        self.cache.get(self.url, '148', 'token', 'event', refresh=True)
+
+        path = self.cache.path(self.url, '148', 'event')
+        os.utime(path, (time.time() - self.cache.ttl - 1, ) * 2)
+        self.cache.get(self.url, '148', 'token', 'event')
+
+        self.cache.invalidate(self.url, '148')
+        self.cache.get(self.url, '148', 'token', 'event')
+
+        self.assertEqual(self.redcap.requests, ['event'] * 4)
+
+    def test_configures_lazy_project_like_pycap(self):
+        project = configure_project(Project(self.url, 'token', lazy=True), '148', self.cache)
+        configure_project(Project(self.url, 'token', lazy=True), '148', self.cache)
+
+        self.assertEqual(project.def_field, 'record_id')
+        self.assertTrue(project.is_longitudinal())
+        self.assertEqual(set(project.forms), {'enrollment', 'symptom_survey'})
+        self.assertEqual(project.arm_nums, (1, ))
+        self.assertEqual(sorted(self.redcap.requests), ['arm', 'event', 'metadata', 'version'])
+
+    def test_configures_classic_project(self):
+        cache = MetadataCache(self.directory.name, post=FakeRedcap(longitudinal=False).post)
+        project = configure_project(Project(self.url, 'token', lazy=True), '23594', cache)
+
+        self.assertFalse(project.is_longitudinal())
+        self.assertEqual(project.events, ())
+
+    def test_other_errors_are_raised_and_not_cached(self):
+        failures = [
+            ({'error': 'You do not have permissions to use the API'}, 403),
+            ({'error': 'The value of the parameter "content" is not valid'}, 400),
+            ('<html>Service Unavailable</html>', 503),
+        ]
+        for failure in failures:
+            with self.subTest(status=failure[1]):
+                self.redcap.failure = failure
+                with self.assertRaises(RuntimeError):
+                    self.cache.get(self.url, '148', 'token', 'event')
+
+        self.redcap.failure = None
+        self.assertEqual(self.cache.get(self.url, '148', 'token', 'event'), EVENTS)
+        self.assertEqual(self.redcap.requests, ['event'] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
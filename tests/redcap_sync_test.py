@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import unittest
+import datetime
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'update_dashboards'))
+
+# pylint: disable=import-error, wrong-import-position
+from redcap_sync import RecordSnapshot, merge_records, REDCAP_DATE_FORMAT
+
+
+class FakeResponse:
+
+    def __init__(self, records):
+        self.records = records
+        frame = pd.DataFrame(records, columns=['record_id', 'redcap_event_name', 'age'])
+        self.raw = io.BytesIO(frame.to_csv(index=False).encode())
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(json.dumps(self.records))
+
+
+class FakeRedcap:
+    """Serves flat record exports, honoring `dateRangeBegin` against each row's last modification"""
+
+    def __init__(self):
+        self.rows = []
+        self.requests = []
+
+    def set_record(self, record_id, modified, events):
+        self.rows = [r for r in self.rows if r['row']['record_id'] != record_id]
+        self.rows += [
+            {'modified': modified, 'row': {'record_id': record_id, 'redcap_event_name': event, 'age': age}}
+            for event, age in events
+        ]
+
+    def post(self, url, data, stream=False):
+        self.requests.append(data)
+        since = data.get('dateRangeBegin')
+        if since:
+            since = datetime.datetime.strptime(since, REDCAP_DATE_FORMAT)
+            return FakeResponse([r['row'] for r in self.rows if r['modified'] >= since])
+        return FakeResponse([r['row'] for r in self.rows])
+
+
+def sort_rows(rows):
+    return sorted(rows, key=lambda r: (r['record_id'], r['redcap_event_name']))
+
+
+class TestRecordSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.redcap = FakeRedcap()
+        self.snapshots = RecordSnapshot(self.directory.name, post=self.redcap.post)
+        self.form_data = {'token': 'secret', 'content': 'record', 'fields': 'age', 'format': 'json'}
+        self.start = datetime.datetime(2022, 5, 1, 12)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def export(self, days):
+        return self.snapshots.export_records(
+            'https://redcap.example.org/api/', '22461', self.form_data, now=self.start + datetime.timedelta(days=days)
+        )
+
+    def test_syncs_only_modified_records(self):
+        for record_id in range(1, 6):
+            self.redcap.set_record(str(record_id), self.start - datetime.timedelta(days=30), [('a', 30), ('b', 31)])
+        self.export(0)
+
+        self.redcap.set_record('2', self.start + datetime.timedelta(days=2), [('a', 32)])
+        self.redcap.set_record('6', self.start + datetime.timedelta(days=2), [('a', 40), ('b', 41)])
+        records = self.export(3)
+
+        self.assertNotIn('dateRangeBegin', self.redcap.requests[0])
+        self.assertEqual(self.redcap.requests[1]['dateRangeBegin'], '2022-04-30 12:00:00')
+        self.assertEqual(self.redcap.requests[1]['fields'], 'record_id,age')
+        self.assertEqual(sort_rows(records), sort_rows(self.redcap.post(None, {}).json()))
+
+    def test_periodically_resyncs_everything(self):
+        self.redcap.set_record('1', self.start, [('a', 30)])
+        self.redcap.set_record('2', self.start, [('a', 30)])
+        self.export(0)
+
+        # deleted records only drop out of the snapshot on a full sync
+        self.redcap.rows = self.redcap.rows[:1]
+        self.assertEqual(len(self.export(3)), 2)
+        self.assertEqual(len(self.export(8)), 1)
+        self.assertNotIn('dateRangeBegin', self.redcap.requests[-1])
+
+    def test_frame_exports_sync_only_modified_records(self):
+        for record_id in range(1, 6):
+            self.redcap.set_record(str(record_id), self.start - datetime.timedelta(days=30), [('a', 30), ('b', 31)])
+        export = lambda days: self.snapshots.export_frame(
+            'https://redcap.example.org/api/', '22461', self.form_data, now=self.start + datetime.timedelta(days=days),
+            dtype={'age': int}, categories=['redcap_event_name'])
+        export(0)
+
+        self.redcap.set_record('2', self.start + datetime.timedelta(days=2), [('c', 32)])
+        records = export(3)
+
+        self.assertEqual(self.redcap.requests[1]['format'], 'csv')
+        self.assertEqual(self.redcap.requests[1]['dateRangeBegin'], '2022-04-30 12:00:00')
+        self.assertEqual(sort_rows(records.to_dict('records')), sort_rows(self.redcap.post(None, {}).json()))
+        self.assertEqual(list(records['redcap_event_name'].cat.categories), ['a', 'b', 'c'])
+        self.assertEqual(records['age'].dtype, 'int64')
+
+    def test_exports_are_keyed_without_token(self):
+        url = 'https://redcap.example.org/api/'
+        path = self.snapshots.path(url, '22461', self.form_data)
+
+        self.assertEqual(path, self.snapshots.path(url, '22461', dict(self.form_data, token='rotated')))
+        self.assertNotEqual(path, self.snapshots.path(url, '22461', dict(self.form_data, fields='zipcode')))
+        self.assertNotEqual(path, self.snapshots.path(url, '22475', self.form_data))
+
+    def test_merge_replaces_every_row_of_modified_records(self):
+        records = [{'record_id': 1, 'age': 1}, {'record_id': 1, 'age': 2}, {'record_id': 2, 'age': 3}]
+        merged = merge_records(records, [{'record_id': '1', 'age': 4}])
+
+        self.assertEqual(merged, [{'record_id': 2, 'age': 3}, {'record_id': '1', 'age': 4}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+import ordering.utils.redcap as redcap_utils
+
+
+class TestBroadcastFirstEvent(unittest.TestCase):
+
+    def test_matches_per_row_filter(self):
+        enrollments = pd.DataFrame({
+            'Project Name': [1, np.nan, np.nan, 2, np.nan, np.nan],
+            'Study Arm': ['a', np.nan, np.nan, 'b', np.nan, np.nan],
+        }, index=pd.MultiIndex.from_tuples([
+            (6, '0_arm_1'), (6, '1_arm_1'), (6, '2_arm_1'),
+            (234, '0_arm_1'), (234, '1_arm_1'), (234, '2_arm_1'),
+        ]))
+
+        expected = enrollments.apply(
+            lambda x: enrollments.filter(items=[(x.name[0], '0_arm_1')], axis=0)['Project Name'].values[0], axis=1
+        )
+        actual = redcap_utils.broadcast_first_event(enrollments.copy(), ['Project Name', 'Study Arm'])
+
+        pd.testing.assert_series_equal(expected, actual['Project Name'], check_names=False)
+        self.assertEqual(actual['Study Arm'].tolist(), ['a', 'a', 'a', 'b', 'b', 'b'])
+
+    def test_records_without_first_event(self):
+        records = pd.DataFrame(
+            {'Project Name': [np.nan, 1]},
+            index=pd.MultiIndex.from_tuples([(1, '1_arm_1'), (2, '0_arm_1')])
+        )
+        actual = redcap_utils.broadcast_first_event(records, 'Project Name')
+
+        self.assertTrue(np.isnan(actual.loc[(1, '1_arm_1'), 'Project Name']))
+        self.assertEqual(actual.loc[(2, '0_arm_1'), 'Project Name'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
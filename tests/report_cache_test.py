@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import unittest
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+import ordering.utils.redcap as redcap_utils
+from ordering.utils.report_cache import ReportCache
+
+
+class CountingProject:
+    """Stands in for a PyCap project, counting the reports exported from it"""
+
+    def __init__(self, url = 'https://redcap.example.org/api/'):
+        self.url = url
+        self.exports = []
+        self.imports = []
+
+    def export_reports(self, report_id, format):
+        self.exports.append(report_id)
+        return pd.DataFrame(
+            {'core_home_address': ['1 Main St', '2 Main St'], 'core_zipcode': [98105.0, None]},
+            index=pd.MultiIndex.from_tuples([(2, '0_arm_1'), (1, '0_arm_1')], names=['household_id', 'redcap_event_name'])
+        )
+
+    def import_records(self, records, overwrite):
+        self.imports.append(len(records))
+
+
+class TestReportCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ReportCache(self.directory.name, ttl=60)
+        redcap_utils.set_report_cache(self.cache)
+
+    def tearDown(self):
+        redcap_utils.set_report_cache(None)
+        self.directory.cleanup()
+
+    def test_repeated_reports_are_exported_once(self):
+        project = CountingProject()
+        first = redcap_utils.get_redcap_report(project, 'Cascadia', 2401)
+        second = redcap_utils.get_redcap_report(project, 'Cascadia', 2401)
+        redcap_utils.get_redcap_report(project, 'Cascadia', 1144)
+        redcap_utils.get_redcap_report(CountingProject('https://other.example.org/api/'), 'Cascadia', 2401)
+
+        self.assertEqual(project.exports, [2401, 1144])
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_stale_and_refreshed_reports_are_exported_again(self):
+        project = CountingProject()
+        redcap_utils.get_redcap_report(project, 'Cascadia', 2401)
+
+        path = self.cache.path(project.url, '109', 2401)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        redcap_utils.get_redcap_report(project, 'Cascadia', 2401)
+
+        self.cache.refresh = True
+        redcap_utils.get_redcap_report(project, 'Cascadia', 2401)
+
+        self.assertEqual(project.exports, [2401, 2401, 2401])
+
+    def test_imported_records_invalidate_reports_of_their_server(self):
+        project = CountingProject()
+        other = CountingProject('https://other.example.org/api/')
+        redcap_utils.get_redcap_report(project, 'Cascadia', 2401)
+        redcap_utils.get_redcap_report(project, 'Cascadia', 1144)
+        redcap_utils.get_redcap_report(other, 'Cascadia', 2401)
+
+        redcap_utils.import_records_batched(project, pd.DataFrame({'record_id': [1, 2, 3]}), batch_size=2)
+        redcap_utils.get_redcap_report(project, 'Cascadia', 2401)
+        redcap_utils.get_redcap_report(other, 'Cascadia', 2401)
+
+        self.assertEqual(project.imports, [2, 1])
+        self.assertEqual(project.exports, [2401, 1144, 2401])
+        self.assertEqual(other.exports, [2401])
+
+    def test_oldest_reports_are_evicted_past_size_limit(self):
+        project = CountingProject()
+        for age, report_id in enumerate([3, 2, 1]):
+            self.cache.put(project.url, '109', report_id, project.export_reports(report_id, 'df'))
+            os.utime(self.cache.path(project.url, '109', report_id), (time.time() - age, time.time() - age))
+
+        self.cache.max_bytes = os.path.getsize(self.cache.path(project.url, '109', 3)) * 2
+        self.cache.evict()
+
+        self.assertTrue(os.path.exists(self.cache.path(project.url, '109', 3)))
+        self.assertTrue(os.path.exists(self.cache.path(project.url, '109', 2)))
+        self.assertFalse(os.path.exists(self.cache.path(project.url, '109', 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.utils.schema import apply_schema, report_schema
+from ordering.scripts import delivery_express_order as de_order
+from ordering.scripts import usps_cascadia_order as usps
+from best_address_test import load_mock_report
+from cascadia_planning_test import make_order_report
+
+
+class TestReportSchema(unittest.TestCase):
+
+    def test_schema_follows_project_columns(self):
+        schema = report_schema('AIRS')
+
+        self.assertEqual(schema['redcap_repeat_instrument'], 'category')
+        self.assertEqual(schema['Street Address 3'], 'string')
+        self.assertEqual(schema['Order Date 2'], 'datetime64[ns]')
+        self.assertNotIn('Zipcode', schema)
+        self.assertNotIn('Street Address 3', report_schema('HCT'))
+
+    def test_columns_are_cast_once_by_position(self):
+        report = pd.DataFrame([
+            ['swab_barcodes', 2, np.nan, '1 Main St', 'A', '2022-05-01 10:30:00'],
+            [np.nan, np.nan, 1, np.nan, 'B', ''],
+        ], columns=['redcap_repeat_instrument', 'swab_barcodes_complete', 'consent_form_complete',
+                    'Street Address', 'First Name', 'Order Date'])
+        report.insert(5, 'First Name', ['C', 'D'], allow_duplicates=True)
+
+        typed = apply_schema(report, 'HCT')
+
+        self.assertEqual(typed['redcap_repeat_instrument'].dtype, 'category')
+        self.assertEqual(typed['swab_barcodes_complete'].tolist(), [2, pd.NA])
+        self.assertEqual(str(typed['consent_form_complete'].dtype), 'Int8')
+        self.assertEqual(str(typed['Street Address'].dtype), 'string')
+        self.assertEqual(typed['First Name'].values.tolist(), [['A', 'C'], ['B', 'D']])
+        self.assertEqual(typed['Order Date'].tolist()[0], pd.Timestamp('2022-05-01 10:30'))
+        self.assertTrue(pd.isna(typed['Order Date'][1]))
+
+    def test_dates_not_matching_the_project_format_are_inferred(self):
+        report = pd.DataFrame({'Order Date': ['3/16/2022', np.nan]})
+
+        self.assertEqual(apply_schema(report, 'AIRS')['Order Date'].tolist()[0], pd.Timestamp('2022-03-16'))
+
+    def test_typed_reports_are_smaller(self):
+        order_report, _, _ = make_order_report(60)
+        typed = apply_schema(order_report, 'Cascadia')
+
+        self.assertLess(typed.memory_usage(deep=True).sum(), order_report.memory_usage(deep=True).sum())
+
+
+class TestTypedOrders(unittest.TestCase):
+
+    def test_delivery_express_orders_are_unchanged(self):
+        report = load_mock_report('HCT', 'record_id').sort_index()
+
+        expected = de_order.generate_project_orders('HCT', report.copy())
+        actual = de_order.generate_project_orders('HCT', apply_schema(report.copy(), 'HCT'))
+
+        self.assertEqual(expected.to_csv(), actual.to_csv())
+
+    def test_airs_orders_share_one_date_type(self):
+        orders = de_order.generate_project_orders(
+            'AIRS', apply_schema(load_mock_report('AIRS', 'subject_id').sort_index(), 'AIRS'))
+
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(orders['Order Date']))
+
+    def test_cascadia_orders_are_unchanged(self):
+        order_report, pause_report, serial_pts = make_order_report(60)
+
+        # the USPS order report is loaded without parsing its order dates, as `usps_cascadia_order` does
+        expected = usps.generate_orders(order_report, pause_report, serial_pts)
+        actual = usps.generate_orders(apply_schema(order_report, 'Cascadia', parse_order_dates=False), pause_report, serial_pts)
+
+        self.assertTrue(expected['Order Date'].notna().any())
+        self.assertEqual(expected.to_csv(), actual.to_csv())
+
+    def test_order_dates_are_kept_as_exported(self):
+        order_report, _, _ = make_order_report(10)
+
+        self.assertNotIn('Order Date', report_schema('Cascadia', parse_order_dates=False))
+        self.assertEqual(
+            apply_schema(order_report, 'Cascadia', parse_order_dates=False)['Order Date'].tolist(),
+            order_report['Order Date'].tolist()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
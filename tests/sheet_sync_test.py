@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+import unittest
+import datetime
+import re
+import sys
+from pathlib import Path
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'update_dashboards'))
+
+# pylint: disable=import-error, wrong-import-position
+from sheet_sync import SheetSync, cell_a1
+
+
+def column_number(label):
+    number = 0
+    for c in label:
+        number = number * 26 + ord(c) - ord('A') + 1
+    return number
+
+
+class Date(int):
+    """A date cell, stored by Sheets as its serial number"""
+
+    EPOCH = datetime.date(1899, 12, 30)
+
+    def date(self):
+        return self.EPOCH + datetime.timedelta(days=int(self))
+
+
+def user_entered(text):
+    """The cell Sheets stores for `text` written as USER_ENTERED"""
+    text = str(text)
+    if text in ('TRUE', 'FALSE'):
+        return text == 'TRUE'
+    if re.fullmatch(r'-?\d+(\.\d+)?', text):
+        number = float(text)
+        return int(number) if number.is_integer() else number
+    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', text):
+        return Date((datetime.date.fromisoformat(text) - Date.EPOCH).days)
+    return text
+
+
+def render(cell, value_render_option):
+    """A stored cell as the API returns it for `value_render_option`"""
+    if value_render_option == 'UNFORMATTED_VALUE':
+        return int(cell) if isinstance(cell, Date) else cell
+    # formatted dates follow the spreadsheet locale, not the text they were entered as
+    if isinstance(cell, Date):
+        d = cell.date()
+        return f'{d.month}/{d.day}/{d.year}'
+    if isinstance(cell, bool):
+        return str(cell).upper()
+    return str(cell)
+
+
+class FakeWorksheet:
+    """A worksheet grid of cells stored the way Sheets stores them"""
+
+    def __init__(self, sheet_id, title, rows, row_count=None, col_count=5):
+        self.id = sheet_id
+        self.title = title
+        self.rows = [[user_entered(v) if v != '' else '' for v in r] for r in rows]
+        self.row_count = row_count or len(rows)
+        self.col_count = col_count
+
+    def cells(self, value_render_option='UNFORMATTED_VALUE', render=render):
+        """Each row without trailing blanks, with cells as the API renders them"""
+        return [
+            [render(v, value_render_option) if v != '' else '' for v in r[:max([i + 1 for i, v in enumerate(r) if v != ''] + [0])]]
+            for r in self.rows[:self.row_count]
+        ]
+
+    def values(self):
+        """Each cell as the text it was entered as"""
+        return self.cells(render=lambda v, _: v.date().isoformat() if isinstance(v, Date) else render(v, 'FORMATTED_VALUE'))
+
+
+class FakeSpreadsheet:
+    """Applies the values and batch requests SheetSync makes to a set of FakeWorksheets"""
+
+    def __init__(self, worksheets):
+        self.title = 'Dashboard'
+        self.worksheets = {ws.title: ws for ws in worksheets}
+        self.calls = []
+        self.written_rows = 0
+
+    def worksheet_of(self, a1_range):
+        title, cells = a1_range.rsplit('!', 1)
+        return self.worksheets[title.strip("'").replace("''", "'")], cells
+
+    def values_batch_get(self, ranges, params=None):
+        self.calls.append('values_batch_get')
+        value_ranges = []
+        for a1_range in ranges:
+            ws, cells = self.worksheet_of(a1_range)
+            first, last = (int(i) for i in cells.split(':'))
+            values = ws.cells((params or {}).get('valueRenderOption', 'FORMATTED_VALUE'))[first - 1:last]
+            while values and not values[-1]:
+                values.pop()
+            value_ranges.append({'range': a1_range, 'values': values} if values else {'range': a1_range})
+        return {'valueRanges': value_ranges}
+
+    def batch_update(self, body):
+        self.calls.append('batch_update')
+        for request in body['requests']:
+            if 'appendDimension' in request:
+                append = request['appendDimension']
+                ws = next(w for w in self.worksheets.values() if w.id == append['sheetId'])
+                if append['dimension'] == 'ROWS':
+                    ws.row_count += append['length']
+                else:
+                    ws.col_count += append['length']
+            else:
+                delete = request['deleteDimension']['range']
+                ws = next(w for w in self.worksheets.values() if w.id == delete['sheetId'])
+                del ws.rows[delete['startIndex']:delete['endIndex']]
+                ws.row_count -= delete['endIndex'] - delete['startIndex']
+
+    def values_batch_update(self, params=None, body=None):
+        self.calls.append('values_batch_update')
+        if body is None:
+            raise ValueError('Invalid values[0]: no data sent')
+        for data in body['data']:
+            ws, cells = self.worksheet_of(data['range'])
+            col, row = re.match(r'([A-Z]+)(\d+)', cells.split(':')[0]).groups()
+            row, col = int(row), column_number(col)
+            assert row - 1 + len(data['values']) <= ws.row_count
+            assert col - 1 + len(data['values'][0]) <= ws.col_count
+            for i, values in enumerate(data['values']):
+                while len(ws.rows) < row + i:
+                    ws.rows.append([])
+                current = ws.rows[row - 1 + i]
+                current.extend([''] * (col - 1 + len(values) - len(current)))
+                current[col - 1:col - 1 + len(values)] = [user_entered(v) if v != '' else '' for v in values]
+            self.written_rows += len(data['values'])
+
+
+class TestSheetSync(unittest.TestCase):
+
+    def setUp(self):
+        self.header = ['date', 'code', 'count']
+        self.old = [['2022-05-01', 'A', '3'], ['2022-05-01', 'B', '1'], ['2022-05-02', 'A', '2'], ['2022-05-03', 'A', '7']]
+
+    def test_only_changed_rows_are_written(self):
+        ws = FakeWorksheet(1, 'Priority Code', [self.header] + self.old)
+        spreadsheet = FakeSpreadsheet([ws])
+        new = [['2022-05-01', 'A', 3], ['2022-05-01', 'B', 1.0], ['2022-05-02', 'A', 4], ['2022-05-03', 'A', 7]]
+
+        sync = SheetSync(spreadsheet)
+        sync.stage(ws, new)
+        sync.commit()
+
+        self.assertEqual(ws.values(), [self.header] + [[str(v) for v in r] for r in [new[0], ['2022-05-01', 'B', 1]] + new[2:]])
+        self.assertEqual(spreadsheet.written_rows, 1)
+        self.assertEqual(spreadsheet.calls, ['values_batch_get', 'values_batch_update'])
+
+    def test_tabs_are_resized_to_their_tables_in_one_request(self):
+        shrinking = FakeWorksheet(1, 'Zipcode', [self.header] + self.old)
+        growing = FakeWorksheet(2, "Age's", [self.header] + self.old[:1])
+        emptied = FakeWorksheet(3, 'Positive', [self.header])
+        spreadsheet = FakeSpreadsheet([shrinking, growing, emptied])
+
+        sync = SheetSync(spreadsheet)
+        sync.stage(shrinking, self.old[:2])
+        sync.stage(growing, [r + ['x', 'y', 'z'] for r in self.old])
+        sync.stage(emptied, [])
+        sync.commit()
+
+        self.assertEqual(shrinking.values(), [self.header] + self.old[:2])
+        self.assertEqual(shrinking.row_count, 3)
+        self.assertEqual(growing.values(), [self.header] + [r + ['x', 'y', 'z'] for r in self.old])
+        self.assertEqual(emptied.values(), [self.header])
+        self.assertEqual(spreadsheet.calls, ['values_batch_get', 'batch_update', 'values_batch_update', 'batch_update'])
+
+    def test_rows_are_only_removed_once_values_are_written(self):
+        ws = FakeWorksheet(1, 'Zipcode', [self.header] + self.old)
+        spreadsheet = FakeSpreadsheet([ws])
+
+        def fail(params=None, body=None):
+            raise ConnectionError('Sheets is down')
+        spreadsheet.values_batch_update = fail
+
+        sync = SheetSync(spreadsheet)
+        sync.stage(ws, [['2022-05-09', 'C', 1]])
+        with self.assertRaises(ConnectionError):
+            sync.commit()
+
+        self.assertEqual(ws.values(), [self.header] + self.old)
+
+    def test_unchanged_dates_and_numbers_are_not_rewritten(self):
+        ws = FakeWorksheet(1, 'Priority Code', [self.header] + self.old)
+        spreadsheet = FakeSpreadsheet([ws])
+        self.assertEqual(ws.cells('FORMATTED_VALUE')[1], ['5/1/2022', 'A', '3'])
+
+        sync = SheetSync(spreadsheet)
+        sync.stage(ws, [[d, code, int(count)] for d, code, count in self.old])
+        sync.commit()
+
+        self.assertEqual(spreadsheet.written_rows, 0)
+        self.assertEqual(ws.values(), [self.header] + self.old)
+
+    def test_large_tables_are_chunked(self):
+        ws = FakeWorksheet(1, 'pc', [self.header])
+        spreadsheet = FakeSpreadsheet([ws])
+        new = [[f'2022-05-{i % 28 + 1:02}', str(i), i] for i in range(1000)]
+
+        sync = SheetSync(spreadsheet, max_cells=300)
+        sync.stage(ws, new)
+        sent = sync.commit()
+
+        self.assertEqual(ws.values(), [self.header] + [[str(v) for v in r] for r in new])
+        self.assertEqual(sent, 3000)
+        self.assertEqual(spreadsheet.calls.count('values_batch_update'), 10)
+
+    def test_cell_a1(self):
+        self.assertEqual([cell_a1(2, 1), cell_a1(3, 26), cell_a1(4, 27), cell_a1(5, 703)], ['A2', 'Z3', 'AA4', 'AAA5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import re
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+ENTRY_POINTS = [
+    'ordering/scripts/delivery_express_order.py',
+    'ordering/scripts/usps_cascadia_order.py',
+    'ordering/scripts/cascadia_return.py',
+]
+
+# Modules only needed once a run gets going, which `--help` should not pay for
+HEAVY_MODULES = {'pandas', 'numpy', 'redcap', 'requests', 'more_itertools', 'envdir', 'pkg_resources', 'cProfile'}
+
+# Budget for the cumulative time of the top level imports, less the interpreter's
+# own `site` setup. Importing pandas alone takes well over this.
+IMPORT_BUDGET_US = 200000
+
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def import_times(script):
+    '''The modules imported by `script --help`, mapped to their cumulative import time in us'''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', script, '--help'],
+        cwd=path_root, capture_output=True, text=True, check=True
+    )
+
+    modules, top_level = {}, {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, module = match.groups()
+        modules[module] = int(cumulative)
+        if len(indent) == 1:
+            top_level[module] = int(cumulative)
+    return modules, top_level
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_help_skips_heavy_imports(self):
+        for script in ENTRY_POINTS:
+            with self.subTest(script=script):
+                modules, _ = import_times(script)
+                self.assertIn('ordering.utils.instrumentation', modules)
+                self.assertEqual(HEAVY_MODULES & {m.split('.')[0] for m in modules}, set())
+
+    def test_help_import_time_budget(self):
+        for script in ENTRY_POINTS:
+            with self.subTest(script=script):
+                # the fastest of a few runs, so a busy machine does not fail the budget
+                total = min(
+                    sum(t for m, t in import_times(script)[1].items() if m != 'site')
+                    for _ in range(3)
+                )
+                self.assertLess(total, IMPORT_BUDGET_US)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic REDCap order reports for the ordering pipelines.
+
+Reports are shaped like those returned by `get_redcap_report`: indexed by record
+and `redcap_event_name`, with columns renamed through `PROJECT_DICT` and repeat
+instruments as extra rows of an event. Generation is vectorized so reports of
+100k participants can be built in seconds.
+"""
+import datetime
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+CascadiaReports = namedtuple('CascadiaReports', ['order_report', 'pause_report', 'serial_pts', 'enrollments'])
+
+BARCODE_COLUMNS = [f'assign_barcode_{i}' for i in range(1, 10)]
+CITIES = np.array(['Seattle', 'Tacoma', 'Portland'], dtype=object)
+STATES = np.array(['WA', 'WA', 'OR'], dtype=object)
+ZIPCODES = np.array([98100, 98400, 97200], dtype=float)
+
+
+def counts(rng, size, bounds):
+    '''A count in the inclusive `bounds` for each of `size` items'''
+    low, high = bounds
+    return rng.integers(low, high + 1, size=size)
+
+
+def maybe(rng, values, rate):
+    '''`values` with each kept at `rate`, NaN otherwise'''
+    values = pd.Series(values)
+    return values.where(rng.random(len(values)) < rate)
+
+
+def address_columns(rng, ids, suffix='', rate=1.0):
+    '''Address fields of the records `ids`, each address present at `rate`'''
+    ids = pd.Series(ids).astype(str)
+    city = rng.integers(0, len(CITIES), size=len(ids))
+    present = rng.random(len(ids)) < rate
+    columns = {
+        'Street Address': ids + ' Main St',
+        'Apt Number': pd.Series(rng.integers(1, 500, size=len(ids)), dtype=float).where(rng.random(len(ids)) < 0.3),
+        'City': pd.Series(CITIES[city]),
+        'State': pd.Series(STATES[city]),
+        'Zipcode': pd.Series(ZIPCODES[city] + rng.integers(0, 99, size=len(ids))),
+    }
+    return {f'{name}{suffix}': column.where(present).to_numpy() for name, column in columns.items()}
+
+
+def recent_dates(rng, size, days, date_format='%Y-%m-%d %H:%M'):
+    '''`size` formatted timestamps from within the last `days` days'''
+    now = pd.Timestamp(datetime.datetime.now()).floor('min')
+    minutes = pd.to_timedelta(rng.integers(0, 60 * 24 * days, size=size), unit='m')
+    return (now - minutes).strftime(date_format)
+
+
+def make_cascadia_reports(num_households, participants=(1, 10), seed=0, barcodes=(0, 2), surveys=(0, 4),
+                          pause_rate=0.15, serial_rate=0.1):
+    '''
+    A Cascadia order report of `num_households` households holding a number of
+    participants within `participants`, each with a number of swab barcode and
+    symptom survey repeat instruments within `barcodes` and `surveys`. Also
+    returns a study pause report pausing participants at `pause_rate`, the
+    serial swab participant ids, and the enrollment report used when filtering
+    return orders.
+    '''
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+
+    households = np.arange(1, num_households + 1)
+    household_size = counts(rng, num_households, participants)
+    household_rows = pd.DataFrame({
+        'household_id': households,
+        'redcap_event_name': 'household_arm_1',
+        'HH Reporter': maybe(rng, (rng.random(num_households) * household_size).astype(int), 0.8).to_numpy(),
+        'Project Name': rng.integers(1, 3, size=num_households),
+    })
+
+    # one enrollment row per participant
+    house_of = np.repeat(households, household_size)
+    participant = np.arange(len(house_of)) - np.repeat(np.cumsum(household_size) - household_size, household_size)
+    events = pd.Series(participant).astype(str) + '_arm_1'
+    ptids = house_of * 100 + participant
+    num_participants = len(ptids)
+    names = pd.Series(ptids).astype(str)
+    participant_rows = pd.DataFrame({
+        'household_id': house_of,
+        'redcap_event_name': events,
+        'manage_archive': maybe(rng, np.ones(num_participants), 0.1).to_numpy(),
+        'enrollment_survey_complete': np.where(rng.random(num_participants) < 0.9, 2, 0),
+        'consent_form_complete': np.where(rng.random(num_participants) < 0.9, 2, 0),
+        'es_ptid': ptids,
+        'First Name': ('First' + names).to_numpy(),
+        'Last Name': ('Last' + names).to_numpy(),
+        'Pref First Name': maybe(rng, 'Pref' + names, 0.5).to_numpy(),
+        **address_columns(rng, ptids),
+        'Email': (names + '@example.com').to_numpy(),
+        'Phone': '(555) 555-5555',
+        'Delivery Instructions': 'Front porch',
+    })
+
+    # swab barcode instruments
+    num_barcodes = counts(rng, num_participants, barcodes)
+    owner = np.repeat(np.arange(num_participants), num_barcodes)
+    barcode_rows = pd.DataFrame({
+        'household_id': house_of[owner],
+        'redcap_event_name': events.to_numpy()[owner],
+        'redcap_repeat_instrument': 'swab_barcodes',
+        'redcap_repeat_instance': instances(num_barcodes),
+        'swab_barcodes_complete': np.where(rng.random(len(owner)) < 0.8, 2, 0),
+        **{
+            column: maybe(rng, 'B' + pd.Series(ptids[owner]).astype(str) + str(i), 0.2).to_numpy()
+            for i, column in enumerate(BARCODE_COLUMNS)
+        },
+    })
+
+    # symptom survey instruments, some holding a new address and a pickup order
+    num_surveys = counts(rng, num_participants, surveys)
+    owner = np.repeat(np.arange(num_participants), num_surveys)
+    survey_dates = recent_dates(rng, len(owner), 60)
+    survey_rows = pd.DataFrame({
+        'household_id': house_of[owner],
+        'redcap_event_name': events.to_numpy()[owner],
+        'redcap_repeat_instrument': 'symptom_survey',
+        'redcap_repeat_instance': instances(num_surveys),
+        'symptom_survey_complete': np.where(rng.random(len(owner)) < 0.8, 2, 0),
+        'ss_return_tracking': maybe(rng, 'DE' + pd.Series(ptids[owner]).astype(str), 0.5).to_numpy(),
+        'ss_date_1': survey_dates,
+        'Order Date': survey_dates.str[:10],
+        'Pickup 1': maybe(rng, rng.integers(1, 3, size=len(owner)), 0.7).to_numpy(),
+        'Pickup 2': maybe(rng, rng.integers(1, 3, size=len(owner)), 0.3).to_numpy(),
+        'Record Id': ptids[owner],
+        **address_columns(rng, ptids[owner], ' 2', rate=0.3),
+    })
+
+    order_report = pd.concat([household_rows, participant_rows, barcode_rows, survey_rows], ignore_index=True)
+    order_report = order_report.set_index(['household_id', 'redcap_event_name']).sort_index(kind='mergesort')
+
+    # paused participants show up in both of the study pause reports
+    paused = np.flatnonzero(rng.random(num_participants) < pause_rate)
+    offsets = np.stack([np.full(len(paused), -30), rng.integers(-10, 10, size=len(paused))], axis=1).ravel()
+    starts = today + pd.to_timedelta(offsets, unit='D')
+    pause_report = pd.DataFrame({
+        'household_id': np.repeat(house_of[paused], 2),
+        'redcap_event_name': np.repeat(events.to_numpy()[paused], 2),
+        'cl_study_pause_start': starts.strftime('%Y-%m-%d'),
+        'cl_study_pause_end': (starts + pd.Timedelta(days=7)).strftime('%Y-%m-%d'),
+    }).set_index(['household_id', 'redcap_event_name']).sort_index(kind='mergesort')
+
+    serial_pts = pd.Series(ptids[rng.random(num_participants) < serial_rate])
+
+    # the enrollment report carries the household's project on its first participant
+    enrollments = participant_rows.drop(columns=['manage_archive']).set_index(['household_id', 'redcap_event_name'])
+    project = household_rows.set_index('household_id')['Project Name']
+    enrollments['Project Name'] = np.where(events == '0_arm_1', project.reindex(house_of).to_numpy(), np.nan)
+
+    return CascadiaReports(order_report, pause_report, serial_pts, enrollments.sort_index(kind='mergesort'))
+
+
+def make_hct_report(num_participants, encounters=(0, 3), seed=0, replacement_rate=0.2):
+    '''
+    An HCT order report of `num_participants` enrollments, each with a number of
+    encounters within `encounters`. Encounters order a kit on most of them and
+    supply a replacement address at `replacement_rate`.
+    '''
+    rng = np.random.default_rng(seed)
+    record_ids = np.arange(1, num_participants + 1)
+    names = pd.Series(record_ids).astype(str)
+
+    enrollment_rows = pd.DataFrame({
+        'record_id': record_ids,
+        'redcap_event_name': 'enrollment_arm_1',
+        'Phone': '(555) 555-5555',
+        'Email': (names + '@example.com').to_numpy(),
+        'Notification Pref': np.where(rng.random(num_participants) < 0.5, 'text', 'email'),
+        'First Name': ('First' + names).to_numpy(),
+        'Last Name': ('Last' + names).to_numpy(),
+        **address_columns(rng, record_ids),
+    })
+
+    num_encounters = counts(rng, num_participants, encounters)
+    owner = np.repeat(record_ids, num_encounters)
+    encounter_rows = pd.DataFrame({
+        'record_id': owner,
+        'redcap_event_name': 'encounter_arm_1',
+        'redcap_repeat_instrument': 'test_order_survey',
+        'redcap_repeat_instance': instances(num_encounters),
+        'Today Tomorrow': rng.integers(0, 2, size=len(owner)).astype(float),
+        'Order Date': maybe(rng, recent_dates(rng, len(owner), 14, '%Y-%m-%d %H:%M:%S'), 0.8).to_numpy(),
+        **address_columns(rng, owner, ' 2', rate=replacement_rate),
+        'Delivery Instructions': 'Front porch',
+        'Pickup Location': 'Porch',
+    })
+
+    report = pd.concat([enrollment_rows, encounter_rows], ignore_index=True)
+    return report.set_index(['record_id', 'redcap_event_name']).sort_index(kind='mergesort')
+
+
+def make_airs_report(num_participants, weeks=(0, 4), seed=0, alternate_rate=0.2, replacement_rate=0.2):
+    '''
+    An AIRS order report of `num_participants` screenings, each followed by a
+    number of weekly events within `weeks`. Weekly events order a kit on most of
+    them, using the alternate order fields at `alternate_rate`.
+    '''
+    rng = np.random.default_rng(seed)
+    subject_ids = np.arange(1, num_participants + 1)
+    names = pd.Series(subject_ids).astype(str)
+
+    screening_rows = pd.DataFrame({
+        'subject_id': subject_ids,
+        'redcap_event_name': 'screening_and_enro_arm_1',
+        'First Name': ('First' + names).to_numpy(),
+        'Last Name': ('Last' + names).to_numpy(),
+        'Phone': '(555) 555-5555',
+        'Email': (names + '@example.com').to_numpy(),
+        **address_columns(rng, subject_ids),
+    })
+
+    num_weeks = counts(rng, num_participants, weeks)
+    owner = np.repeat(subject_ids, num_weeks)
+    week = instances(num_weeks)
+    alternate = rng.random(len(owner)) < alternate_rate
+    ordered = rng.random(len(owner)) < 0.8
+    order_dates = recent_dates(rng, len(owner), 14, '%Y-%m-%d')
+
+    week_rows = pd.DataFrame({
+        'subject_id': owner,
+        'redcap_event_name': 'week_' + pd.Series(week).map('{:02}'.format) + '_arm_2',
+        'Order Date': pd.Series(order_dates).where(ordered & ~alternate).to_numpy(),
+        'Today Tomorrow': pd.Series(rng.integers(0, 2, size=len(owner)), dtype=float).where(ordered & ~alternate).to_numpy(),
+        **address_columns(rng, owner, ' 2', rate=replacement_rate),
+        'Delivery Instructions': 'Front porch',
+        'Pickup Location': 'Porch',
+        'Order Date 2': pd.Series(order_dates).where(ordered & alternate).to_numpy(),
+        'Today Tomorrow 2': pd.Series(rng.integers(0, 2, size=len(owner)), dtype=float).where(ordered & alternate).to_numpy(),
+        **address_columns(rng, owner, ' 3', rate=replacement_rate),
+        'Delivery Instructions 2': pd.Series('Side door', index=range(len(owner))).where(alternate).to_numpy(),
+        'Pickup Location 2': pd.Series('Porch', index=range(len(owner))).where(alternate).to_numpy(),
+    })
+
+    report = pd.concat([screening_rows, week_rows], ignore_index=True)
+    return report.set_index(['subject_id', 'redcap_event_name']).sort_index(kind='mergesort')
+
+
+def instances(num_instances):
+    '''Repeat instance numbers, 1 up to each of `num_instances`'''
+    num_instances = np.asarray(num_instances)
+    starts = np.repeat(np.cumsum(num_instances) - num_instances, num_instances)
+    return np.arange(num_instances.sum()) - starts + 1
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+from pathlib import Path
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+# pylint: disable=import-error, wrong-import-position
+from synthetic_reports import make_cascadia_reports, make_hct_report, make_airs_report
+from cascadia_planning_test import legacy_generate_orders
+from ordering.scripts import usps_cascadia_order as usps
+from ordering.utils.hct import filter_hct_orders
+from ordering.utils.airs import filter_airs_orders
+import benchmark_ordering
+
+
+class TestSyntheticReports(unittest.TestCase):
+
+    def test_reports_are_seeded(self):
+        first, second = make_cascadia_reports(20, seed=3), make_cascadia_reports(20, seed=3)
+
+        for expected, actual in zip(first, second):
+            self.assertEqual(expected.to_csv(), actual.to_csv())
+        self.assertNotEqual(first.order_report.to_csv(), make_cascadia_reports(20, seed=4).order_report.to_csv())
+
+    def test_cascadia_report_shape(self):
+        reports = make_cascadia_reports(50, participants=(2, 3), barcodes=(1, 1))
+        events = reports.order_report.index.get_level_values('redcap_event_name')
+        instruments = reports.order_report['redcap_repeat_instrument']
+
+        self.assertEqual((events == 'household_arm_1').sum(), 50)
+        self.assertTrue(100 <= (instruments.isna() & (events != 'household_arm_1')).sum() <= 150)
+        self.assertEqual((instruments == 'swab_barcodes').sum(), len(reports.enrollments))
+        self.assertTrue(reports.pause_report.index.isin(reports.order_report.index).all())
+        self.assertTrue(reports.serial_pts.isin(reports.order_report['es_ptid']).all())
+
+    def test_cascadia_orders_match_legacy_loop(self):
+        reports = make_cascadia_reports(40, seed=1)
+
+        expected = legacy_generate_orders(reports.order_report, reports.pause_report, reports.serial_pts)
+        actual = usps.generate_orders(reports.order_report, reports.pause_report, reports.serial_pts)
+
+        self.assertGreater(len(actual), 0)
+        self.assertEqual(expected.sort_values('OrderID').to_csv(index=False),
+                         actual.sort_values('OrderID').to_csv(index=False))
+
+    def test_hct_and_airs_orders_are_one_per_participant(self):
+        hct = filter_hct_orders(make_hct_report(200))
+        airs = filter_airs_orders(make_airs_report(200))
+
+        for orders in (hct, airs):
+            self.assertGreater(len(orders), 0)
+            self.assertFalse(orders.index.get_level_values(0).duplicated().any())
+
+    def test_benchmarks_run(self):
+        results = benchmark_ordering.run_benchmarks([100], repeat=1)
+
+        self.assertEqual(len(results), len(benchmark_ordering.STAGES))
+        self.assertTrue(all(r.seconds >= 0 and r.peak_mb >= 0 for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+import pandas as pd
+from pathlib import Path
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'update_dashboards'))
+
+# pylint: disable=import-error, wrong-import-position
+try:
+    import tpchd
+except ImportError:
+    tpchd = None
+
+
+class FakeSync:
+
+    def __init__(self):
+        self.staged = []
+
+    def stage(self, worksheet, rows):
+        self.staged.append((worksheet, rows))
+
+
+@unittest.skipIf(tpchd is None, 'gspread or xlsxwriter is not installed')
+class TestPierceZipcodes(unittest.TestCase):
+
+    def setUp(self):
+        self.data = pd.DataFrame({
+            'record_id': ['1', '2', '3', '4', '5'],
+            'home_zipcode_2': ['98402', "<span lang='es'> 98402 </span>", "<span lang='ru'>98092</span>", '98101', '98092'],
+            'illness_q_date': ['2022-01-05', '2022-01-05', '2022-01-05', '2022-01-05', '2021-01-01'],
+        })
+
+    def test_span_wrapped_zipcodes_are_cleaned(self):
+        pierce = tpchd.filter_pierce(self.data)
+
+        self.assertEqual(pierce['record_id'].tolist(), ['1', '2', '3'])
+        self.assertEqual(pierce['home_zipcode_2'].tolist(), ['98402', '98402', '98092'])
+        self.assertEqual(self.data['home_zipcode_2'][1], "<span lang='es'> 98402 </span>")
+
+    def test_zipcode_tab_groups_span_wrapped_zipcodes(self):
+        sync = FakeSync()
+
+        tpchd.import_zipcode(tpchd.filter_pierce(self.data), 'Zipcode', sync)
+
+        self.assertEqual(sync.staged, [('Zipcode', [['2022-01-05', '98092', 1], ['2022-01-05', '98402', 2]])])
+
+
+if __name__ == '__main__':
+    unittest.main()
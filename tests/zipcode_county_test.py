@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import unittest
+import sys
+import pandas as pd
+from pathlib import Path
+
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'update_dashboards'))
+
+# pylint: disable=import-error, wrong-import-position
+from zipcode_county import ZipcodeClassifier, load_classifier, ZIPCODE_COUNTY_MAP
+
+
+class TestZipcodeClassifier(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = ZipcodeClassifier({'SCAN KING': ['98101', '98092'], 'SCAN PIERCE': ['98402', '98092']})
+
+    def test_span_wrapped_zipcodes_are_cleaned(self):
+        zipcodes = pd.Series(["<span lang='es'> 98115 </span>", '98101', '', None, '<b>n/a</b>'], index=[3, 1, 4, 0, 2])
+
+        cleaned = self.classifier.clean(zipcodes)
+
+        self.assertEqual(cleaned.tolist()[:3], ['98115', '98101', ''])
+        self.assertTrue(pd.isna(cleaned[0]))
+        self.assertEqual(cleaned[2], '<b>n/a</b>')
+        self.assertEqual(cleaned.index.tolist(), [3, 1, 4, 0, 2])
+
+    def test_labels(self):
+        zipcodes = ['98101', "<span lang='ru'>98402</span>", '98115', '', pd.NA, '98092']
+
+        self.assertEqual(self.classifier.label(zipcodes).tolist(),
+                         ['SCAN King', 'SCAN Pierce', 'SCAN Other', 'SCAN Other', 'SCAN Other', 'SCAN King'])
+
+    def test_98092_moves_to_pierce_after_the_cutoff(self):
+        data = pd.DataFrame({
+            'home_zipcode_2': ['98092', '98092', '98092', '98092', '98402', '98101'],
+            'illness_q_date': ['2021-09-16', '2021-09-17', '2022-01-05 10:30', pd.NA, '2021-01-01', '2022-01-01'],
+        }, index=[10, 11, 12, 13, 14, 15])
+
+        labels = self.classifier.label(data['home_zipcode_2'], data['illness_q_date'])
+        pierce = data[self.classifier.is_pierce(data['home_zipcode_2'], data['illness_q_date'])]
+
+        self.assertEqual(labels.tolist(), ['SCAN King', 'SCAN Pierce', 'SCAN Pierce', 'SCAN King', 'SCAN Pierce', 'SCAN King'])
+        self.assertEqual(pierce.index.tolist(), [11, 12, 14])
+
+    def test_map_is_loaded_once(self):
+        classifier = load_classifier()
+
+        self.assertIs(load_classifier(), classifier)
+        self.assertIn('98092', classifier.pierce)
+        self.assertEqual(load_classifier(ZIPCODE_COUNTY_MAP).label(['98402']).tolist(), ['SCAN Pierce'])
+
+
+if __name__ == '__main__':
+    unittest.main()
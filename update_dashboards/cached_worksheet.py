@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+A worksheet handle which remembers what a script has already read from or
+written to a Google Sheets tab, so tabs which only ever grow (`kits`,
+`courier`, `forecast_db`) are read at most once per run.
+"""
+
+
+class CachedWorksheet:
+    def __init__(self, worksheet, head=1):
+        self.worksheet = worksheet
+        self.head = head
+        self._header = None
+        self._records = None
+        self._row_count = None
+
+    @property
+    def title(self):
+        return self.worksheet.title
+
+    def header(self):
+        if self._header is None:
+            self._header = self.worksheet.row_values(self.head)
+        return self._header
+
+    def get_all_records(self):
+        '''All records of the tab, read from the sheet on first use only'''
+        if self._records is None:
+            self._records = self.worksheet.get_all_records(head=self.head)
+            self._row_count = self.head + len(self._records)
+            if self._records:
+                self._header = list(self._records[0])
+        return [dict(r) for r in self._records]
+
+    def next_available_row(self):
+        '''The first empty row of the tab, counting non-empty cells of the first column on first use only'''
+        if self._row_count is None:
+            self._row_count = len(list(filter(None, self.worksheet.col_values(1))))
+        return self._row_count + 1
+
+    def append_rows(self, rows, value_input_option='RAW'):
+        '''Append `rows` after the last row of the tab's table, keeping the cached records current'''
+        if not rows:
+            return
+
+        self.worksheet.append_rows(rows,
+                                   value_input_option=value_input_option,
+                                   insert_data_option='INSERT_ROWS',
+                                   table_range=f'A{self.head}')
+
+        if self._row_count is not None:
+            self._row_count += len(rows)
+        if self._records is not None:
+            header = self.header()
+            self._records.extend(
+                dict(zip(header, list(row) + [''] * (len(header) - len(row))))
+                for row in rows)
@@ -4,10 +4,22 @@ import gspread
 import datetime
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from oauth2client.service_account import ServiceAccountCredentials
+from cached_worksheet import CachedWorksheet
 
 base_dir = Path(__file__).resolve().parent.parent.resolve()
 
+KPI_PREFIX = 'UW Brotman KPIs Excel'
+EXCEPTIONS_PREFIX = 'UW Brotman Exceptions Excel'
+# days fetched at once, kept low to stay within the Sheets API read quota
+MAX_WORKERS = 4
+# KPI and exceptions report columns kept for the courier table
+COLUMNS = [
+    'OrderNumber', 'CreateDate', 'ProjectName', 'Out/Return', 'PUZip',
+    'DLZip', 'FalseTrip', 'Late'
+]
+
 
 def main():
     print("Connecting to Google Sheets")
@@ -15,7 +27,8 @@ def main():
     client = get_gspread_client(
         base_dir / '.config/logistics-db-1615935272839-a608db2dc31d')
     # links variables to courier sheet
-    db = client.open('Logistics Data').worksheet("courier")
+    logistics = client.open('Logistics Data')
+    db = CachedWorksheet(logistics.worksheet("courier"))
 
     print("Calculating missing dates")
     # find what dates in the google sheets are missing
@@ -24,21 +37,14 @@ def main():
     print(missing_dates)
 
     print('Getting KPI and exceptions data')
+    data = backfill_courier_data(client, missing_dates)
 
-    for day in missing_dates:
-        try:
-            data = get_courier_data(client, day)
-            db.insert_rows(data, next_available_row(db))
-            client.open('Logistics Data').worksheet('update').update(
-                'B2',
-                datetime.datetime.strftime(datetime.datetime.now(),
-                                           '%Y-%m-%d %H:%M'))
-
-        except gspread.exceptions.SpreadsheetNotFound:
-            print('No sheet found for {}'.format(day))
-
-        except TypeError as e:
-            print(f'KPI or exceptions returned length 0 for {day} {e}')
+    if data:
+        db.append_rows(data)
+        logistics.worksheet('update').update(
+            'B2',
+            datetime.datetime.strftime(datetime.datetime.now(),
+                                       '%Y-%m-%d %H:%M'))
 
 
 # takes a string for a location of a json file containing the google api credentials
@@ -58,30 +64,74 @@ def get_missing_dates(db):
     today = datetime.datetime.today()
     courier = pd.DataFrame(db.get_all_records())
     try:
-        courierDates = pd.unique(courier['date'])
+        courierDates = set(courier['date'])
     except KeyError:
-        courierDates = []
-    realDates = pd.Series(pd.date_range(datetime.datetime(2021, 3, 21), today))
-    realDates = realDates.apply(
-        lambda x: x.strftime("%m/%d/%y").lstrip("0").replace("/0", "/"))
-    diffDates = list(set(realDates) - set(courierDates))
-    diffDates = [
-        datetime.datetime.strptime(
-            date,
-            "%m/%d/%y").strftime("%m/%d/%Y").lstrip("0").replace("/0", "/")
-        for date in diffDates
-    ]
+        courierDates = set()
+    realDates = pd.date_range(datetime.datetime(2021, 3, 21), today)
+    # the sheet keeps dates as m/d/yy and spreadsheet titles use m_d_yyyy, without leading zeros
+    days = realDates.month.astype(str) + '/' + realDates.day.astype(str) + '/'
+    sheetDates = days + realDates.strftime('%y')
+    diffDates = list((days + realDates.year.astype(str))[~sheetDates.isin(courierDates)])
     return (diffDates)
 
 
-# takes a gspread authentication variable and string of a date
+# takes a gspread authentication variable
+# returns the ids of the KPI and exceptions spreadsheets by their date (m/d/yyyy)
+def find_courier_files(client):
+    kpis, exceptions = {}, {}
+    for f in client.list_spreadsheet_files():
+        for prefix, files in ((KPI_PREFIX, kpis),
+                              (EXCEPTIONS_PREFIX, exceptions)):
+            if f['name'].startswith(prefix):
+                # like client.open, the first file found with a title is used
+                files.setdefault(f['name'][len(prefix):].replace('_', '/'),
+                                 f['id'])
+    return kpis, exceptions
+
+
+# takes a gspread authentication variable and a list of date strings
+# returns the courier table rows of every date which has both a KPI and exceptions file
+def backfill_courier_data(client, dates, max_workers=MAX_WORKERS):
+    kpis, exceptions = find_courier_files(client)
+
+    available = []
+    for day in dates:
+        if day in kpis and day in exceptions:
+            available.append(day)
+        else:
+            print('No sheet found for {}'.format(day))
+
+    def fetch(day):
+        try:
+            return get_courier_frame(client, day, kpis[day], exceptions[day])
+        except gspread.exceptions.APIError as e:
+            print(f'Failed to fetch KPI or exceptions for {day} {e}')
+
+    frames = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for day, table in zip(available, executor.map(fetch, available)):
+            if table is None:
+                print(f'KPI or exceptions returned length 0 for {day}')
+            else:
+                frames.append((day, table))
+    return aggregate_courier_data(frames)
+
+
+# takes a gspread authentication variable, string of a date and the ids of its spreadsheets
 # returns a table containing the number of orders, false trips, lates, by study for the given date
-def get_courier_data(client, date):
+def get_courier_data(client, date, kpi_id, exceptions_id):
+    table = get_courier_frame(client, date, kpi_id, exceptions_id)
+    if table is None:
+        return
+    return aggregate_courier_data([(date, table)])
+
+
+# takes a gspread authentication variable, string of a date and the ids of its spreadsheets
+# returns the KPI and exceptions orders of the given date, without duplicate orders
+def get_courier_frame(client, date, kpi_id, exceptions_id):
     # connects to the kpi and exceptions in google sheets
-    kpi = client.open(
-        f'UW Brotman KPIs Excel{date.replace("/","_")}').get_worksheet(0)
-    exceptions = client.open(
-        f'UW Brotman Exceptions Excel{date.replace("/","_")}').get_worksheet(0)
+    kpi = client.open_by_key(kpi_id).get_worksheet(0)
+    exceptions = client.open_by_key(exceptions_id).get_worksheet(0)
 
     # create dataframes for both sheets
     kpiDF = pd.DataFrame(kpi.get_all_records())
@@ -91,12 +141,6 @@ def get_courier_data(client, date):
     if len(kpiDF.index) == 0 or len(exceptionsDF.index) == 0:
         return
 
-    # column names
-    columns = [
-        'OrderNumber', 'CreateDate', 'ProjectName', 'Out/Return', 'PUZip',
-        'DLZip', 'FalseTrip', 'Late'
-    ]
-
     # The exceptions table does not have PUZip or DLZip but it may be added in the future.
     # Setting to empty values since columns are needed for the concat
     try:
@@ -105,37 +149,39 @@ def get_courier_data(client, date):
         exceptionsDF[['PUZip', 'DLZip']] = ['', '']
 
     # combine the kpi and exceptions data and drop duplicate orders
-    table = pd.concat(
-        [kpiDF[columns], exceptionsDF[columns]],
+    return pd.concat(
+        [kpiDF[COLUMNS], exceptionsDF[COLUMNS]],
         ignore_index=True).drop_duplicates(subset=['OrderNumber'])
 
-    table['ParticipantZip'] = table.apply(participant_zip, axis=1)
+
+# takes a list of (date, orders) pairs as returned by get_courier_frame
+# returns the number of orders, false trips, lates, by study of every date, in one groupby
+def aggregate_courier_data(frames):
+    if not frames:
+        return []
+
+    # orders are counted under the report they came from, even when created on another day
+    table = pd.concat([t.assign(report=n) for n, (_, t) in enumerate(frames)],
+                      ignore_index=True)
+
+    # the participant's zipcode is the pickup for returns and the drop off otherwise
+    table['ParticipantZip'] = table['PUZip'].where(
+        table['Out/Return'] == 'Return', table['DLZip'])
+    # blank cells count as neither a false trip nor late
+    for column in ['FalseTrip', 'Late']:
+        table[column] = pd.to_numeric(table[column],
+                                      errors='coerce').fillna(0).astype(int)
 
     table = table.groupby(
-        ['CreateDate', 'ProjectName', 'Out/Return', 'ParticipantZip'], ).agg({
-            'Out/Return':
-            'count',
-            'FalseTrip':
-            sum,
-            'Late':
-            sum,
-        })
-    # reset index does not work with two Out/Return columns so renaming to orders
-    table.columns = ['orders', 'ft', 'late']
-    table.reset_index(inplace=True)
-    print('{: <30}{}'.format(date + ' Orders:', str(sum(table['orders']))))
-    return (table.values.tolist())
-
-
-# finds the participant's zipcode based on an order's Out/Return value
-def participant_zip(x):
-    return x['PUZip'] if x['Out/Return'] == 'Return' else x['DLZip']
-
-
-# returns the next empty row in a sheet
-def next_available_row(worksheet):
-    str_list = list(filter(None, worksheet.col_values(1)))
-    return len(str_list) + 1
+        ['report', 'CreateDate', 'ProjectName', 'Out/Return',
+         'ParticipantZip']).agg(orders=('OrderNumber', 'size'),
+                                ft=('FalseTrip', 'sum'),
+                                late=('Late', 'sum')).reset_index()
+
+    orders = table.groupby('report')['orders'].sum()
+    for n, (date, _) in enumerate(frames):
+        print('{: <30}{}'.format(date + ' Orders:', str(orders.get(n, 0))))
+    return table.drop(columns='report').values.tolist()
 
 
 if __name__ == "__main__":
@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 
 import re
-import os
-import json
+import sys
 import envdir
 import gspread
 import requests
 import datetime
 from pathlib import Path
-from urllib.parse import urlparse
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
+from redcap_client import RedcapClient, project_url, project_token
+from cached_worksheet import CachedWorksheet
+from zipcode_county import load_classifier
 
 #variable mapping for each REDCap project
 projectDict = {
@@ -69,35 +70,45 @@ projectDict = {
 
 base_dir = Path(__file__).resolve().parent.parent.resolve()
 envdir.open(base_dir / f'.env/redcap')
+sys.path.append(str(base_dir))
+
+# pylint: disable=import-error, wrong-import-position
+from ordering.utils.redcap_metadata import MetadataCache
+
+redcap = RedcapClient()
+metadata = MetadataCache(base_dir / 'data/cache/metadata', post=redcap.post)
+zipcodes = load_classifier()
 
 exportFields = ['Record Id', 'Collection', 'BEMS', 'Zipcode']
 columns = ['Project', 'Record Id', 'Collection', 'BEMS', 'Zipcode']
 
 
 def main():
-    with open(base_dir / f'etc/zipcode_county_map.json', 'r') as f:
-        zipcode_county_map = json.load(f)
     print("Connecting to Google Sheets")
     #creates conneciton to google sheets
     client = get_gspread_client(
         base_dir / f'.config/logistics-db-1615935272839-a608db2dc31d')
 
     #links variables to ship_out_db sheets
-    db = client.open('Logistics Data').worksheet('kits')
+    db = CachedWorksheet(client.open('Logistics Data').worksheet('kits'))
     doc = client.open('Logistics Data').worksheet('kits_update')
 
     lastImport = doc.acell('A2').value
     print('{: <30}{}'.format('Getting kits shipped after:', str(lastImport)))
 
+    # each project is exported concurrently, their records are kept in projectDict order
     shipOutData = []
-    for p in projectDict:  # (p for p in projectDict if p == 'AIRS'):
-        shipOutData.extend(getRecords(p, lastImport, zipcode_county_map))
+    for records in redcap.map(
+            lambda p: getRecords(p, lastImport),
+            projectDict):
+        shipOutData.extend(records)
 
     print('{: <30}{}'.format('S&S kits shipped:', str(len(shipOutData))))
-    db.insert_rows(shipOutData, next_available_row(db))
+    db.append_rows(shipOutData)
     doc.update(
         'A2',
         datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M'))
+    redcap.print_metrics()
 
 
 def get_gspread_client(auth_file):
@@ -109,64 +120,29 @@ def get_gspread_client(auth_file):
     return gspread.authorize(creds)
 
 
-def next_available_row(worksheet):
-    str_list = list(filter(None, worksheet.col_values(1)))
-    return len(str_list) + 1
-
-
-def getEvents(project):
-    if project == 'HCT':
-        url = urlparse(os.environ.get("HCT_REDCAP_API_URL"))
-    elif project == "AIRS":
-        url = urlparse(os.environ.get("AIRS_REDCAP_API_URL"))
-    else:
-        url = urlparse(os.environ.get("REDCAP_API_URL"))
-
-    data = {
-        'token':
-        os.environ.get(
-            f"REDCAP_API_TOKEN_{url.netloc}_{projectDict[project]['project_id']}"
-        ),
-        'content':
-        'event',
-        'format':
-        'json',
-    }
-    events = requests.post(url.geturl(), data=data)
-    events = events.json()
+def getEvents(project, refresh=False):
+    url = project_url(project)
+    project_id = projectDict[project]['project_id']
+    events = metadata.get(url.geturl(),
+                          project_id,
+                          project_token(url, project_id),
+                          'event',
+                          refresh=refresh)
     projectEvents = []
     for e in events:
         projectEvents.append(e['unique_event_name'])
     return projectEvents
 
 
-def getScanProject(zipcode, zipcode_county_map):
-    if zipcode in zipcode_county_map['SCAN KING']:
-        return ('SCAN King')
-    elif zipcode in zipcode_county_map['SCAN PIERCE']:
-        return ('SCAN Pierce')
-    else:
-        return ('SCAN Other')
-
-
 def getZipcodes(needZip, project):
-    if project == 'HCT':
+    if project in ('HCT', 'AIRS'):
         zipcodeID = projectDict[project]['Zipcode2']
-        url = urlparse(os.environ.get("HCT_REDCAP_API_URL"))
-    elif project == "AIRS":
-        zipcodeID = projectDict[project]['Zipcode2']
-        url = urlparse(os.environ.get("AIRS_REDCAP_API_URL"))
     else:
         zipcodeID = projectDict[project]['Zipcode']
-        url = urlparse(os.environ.get("REDCAP_API_URL"))
 
     zipFields = [zipcodeID, projectDict[project]['Record Id']]
 
     data = {
-        'token':
-        os.environ.get(
-            f"REDCAP_API_TOKEN_{url.netloc}_{projectDict[project]['project_id']}"
-        ),
         'content':
         'record',
         'format':
@@ -184,8 +160,7 @@ def getZipcodes(needZip, project):
         'records':
         ",".join(map(str, needZip))
     }
-    r = requests.post(url.geturl(), data=data)
-    results = r.json()
+    results = redcap.export(project, projectDict[project]['project_id'], data)
     otherZips = pd.DataFrame(results)
     otherZips = otherZips[[projectDict[project]['Record Id'], zipcodeID
                            ]].set_index(projectDict[project]['Record Id'])
@@ -193,7 +168,7 @@ def getZipcodes(needZip, project):
     return otherZips
 
 
-def getRecords(project, date, zipcode_county_map):
+def getRecords(project, date):
     #get events
     projectEvents = getEvents(project)
     #format fields for records export
@@ -201,23 +176,12 @@ def getRecords(project, date, zipcode_county_map):
     for f in exportFields:
         formattedFields.append(projectDict[project][f])
 
-    if project == 'HCT':
-        url = urlparse(os.environ.get("HCT_REDCAP_API_URL"))
-    elif project == "AIRS":
-        url = urlparse(os.environ.get("AIRS_REDCAP_API_URL"))
-    else:
-        url = urlparse(os.environ.get("REDCAP_API_URL"))
-
     #export records
     data = {
-        'token':
-        os.environ.get(
-            f"REDCAP_API_TOKEN_{url.netloc}_{projectDict[project]['project_id']}"
-        ),
         'content':
         'record',
         'format':
-        'json',
+        'csv',
         'type':
         'flat',
         'events':
@@ -232,13 +196,18 @@ def getRecords(project, date, zipcode_county_map):
         '[event-name][' + str(projectDict[project]['BEMS']) + '] >= "' +
         str(date) + '"'
     }
-    r = requests.post(url.geturl(), data=data)
-    results = r.json()
+    try:
+        records = redcap.export_frame(project,
+                                      projectDict[project]['project_id'], data)
+    except requests.exceptions.HTTPError:
+        #cached events may be out of date with the project, refetch them and retry
+        data['events'] = ",".join(map(str, getEvents(project, refresh=True)))
+        records = redcap.export_frame(project,
+                                      projectDict[project]['project_id'], data)
     print('{: <30}{: <30}'.format(
-        str(project) + ' shipped:', str(len(results))))
-    if len(results) == 0:
-        return (results)
-    records = pd.DataFrame(results)
+        str(project) + ' shipped:', str(len(records.index))))
+    if len(records.index) == 0:
+        return []
     records = records[formattedFields]
     records.set_index(projectDict[project]['Record Id'])
 
@@ -248,13 +217,12 @@ def getRecords(project, date, zipcode_county_map):
                                                          '']
 
     #corrects known language zipcode formatting
-    records[zipcode] = records[zipcode].apply(lambda x: re.findall(
-        '[0-9][0-9][0-9][0-9][0-9]', x)[0] if re.search('^<', x) else x)
+    records[zipcode] = zipcodes.clean(records[zipcode])
 
     #assign project name to records
     if re.search('SCAN+', project):
-        records['project'] = records[zipcode].apply(
-            lambda x: getScanProject(x, zipcode_county_map))
+        records['project'] = zipcodes.label(
+            records[zipcode], records[projectDict[project]['BEMS']])
     else:
         records['project'] = project
 
@@ -1,16 +1,16 @@
 #!/usr/bin/env python3
 
-import os
 import json
 import envdir
 import gspread
-import requests
 import datetime
 import pandas as pd
 from pathlib import Path
 from functools import reduce
-from urllib.parse import urlparse
 from oauth2client.service_account import ServiceAccountCredentials
+from redcap_sync import RecordSnapshot
+from redcap_client import RedcapClient, project_url, project_token
+from sheet_sync import SheetSync
 
 base_dir = Path(__file__).resolve().parent.parent.resolve()
 envdir.open(base_dir / f'.env/redcap')
@@ -18,6 +18,8 @@ envdir.open(base_dir / f'.env/redcap')
 base_dir = Path(__file__).resolve().parent.parent.resolve()
 envdir.open(base_dir / f'.env/redcap')
 
+redcap = RedcapClient()
+
 
 def main():
 
@@ -30,13 +32,18 @@ def main():
 
     # Export all records from SCAN redcap
     print('Getting PC REDCap data')
-    pc_data = pd.DataFrame(get_pc_redcap_data())
+    pc_data = get_pc_redcap_data()
 
     print('Importing PC data')
-    import_pc(pc_data.replace('', pd.NA), sheet.worksheet('pc'))
+    sync = SheetSync(sheet)
+    import_pc(pc_data, sheet.worksheet('pc'), sync)
+    try:
+        sync.commit()
+    except Exception as e:
+        print(f'Error inserting data {e}')
 
     # print('Getting Group Enrollment REDCap data')
-    # ge_data = pd.DataFrame(get_ge_redcap_data()).apply(
+    # ge_data = get_ge_redcap_data().apply(
     #     lambda x: pd.to_datetime(x).dt.strftime('%Y-%m-%d'))
 
     # print('Importing Group Enrollment data')
@@ -45,6 +52,7 @@ def main():
     sheet.worksheet('update').update(
         'A2',
         datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M'))
+    redcap.print_metrics()
 
 
 def get_gspread_client(auth_file):
@@ -62,22 +70,23 @@ def get_pc_redcap_data():
         'shipping_sub', 'testing_sub', 'results_sub', 'feedback_sub',
         'time_fu', 'cascadia_ptid'
     ]
-    url = urlparse(os.environ.get("REDCAP_API_URL"))
+    url = project_url('PC')
 
     formData = {
-        'token': os.environ.get(f"REDCAP_API_TOKEN_{url.netloc}_23594"),
+        'token': project_token(url, '23594'),
         'content': 'record',
-        'format': 'json',
+        'format': 'csv',
         'type': 'flat',
         'fields': ",".join(map(str, export_feilds)),
         'rawOrLabel': 'label',
         'returnFormat': 'json',
     }
-    r = requests.post(url.geturl(), data=formData)
-    return (r.json())
+    snapshots = RecordSnapshot(base_dir / 'data/cache/redcap', post=redcap.post)
+    # blank cells are read as missing values
+    return (snapshots.export_frame(url.geturl(), '23594', formData, na_values=['']))
 
 
-def import_pc(data, sheet):
+def import_pc(data, sheet, sync):
     # data = data.apply(lambda x: data.drop())
     data = data.apply(cascadia_regions, axis=1)
     null_issues = data.loc[(data['highlevel_sub'].isnull()) &
@@ -108,13 +117,7 @@ def import_pc(data, sheet):
 
     data = data.drop('time_fu', axis=1).append(follow_up_data).fillna('')
 
-    sheet.delete_rows(2, sheet.row_count)
-    try:
-        sheet.append_rows(data.values.tolist(),
-                          value_input_option='USER_ENTERED')
-    except Exception as e:
-        print(f'Error inserting data {e}')
-        sheet.append_rows([['']])
+    sync.stage(sheet, data.values.tolist())
 
 
 def cascadia_regions(row):
@@ -134,19 +137,16 @@ def get_ge_redcap_data():
     export_feilds = [
         'consent_date', 'attempt_1', 'attempt_2', 'attempt_3', 'referral_date'
     ]
-    url = urlparse(os.environ.get("REDCAP_API_URL"))
-
     formData = {
-        'token': os.environ.get(f"REDCAP_API_TOKEN_{url.netloc}_21991"),
         'content': 'record',
-        'format': 'json',
+        'format': 'csv',
         'type': 'flat',
         'fields': ",".join(map(str, export_feilds)),
         'rawOrLabel': 'label',
         'returnFormat': 'json',
     }
-    r = requests.post(url.geturl(), data=formData)
-    return (r.json())
+    # blank cells are read as missing values
+    return (redcap.export_frame('GE', '21991', formData, na_values=['']))
 
 
 def import_ge(data, sheet):
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Shared REDCap API client for the dashboard scripts.
+
+Requests to each REDCap host go through one pooled session, failed requests
+are retried with backoff, and every call's latency and payload size is kept
+so a script can print a summary of the API calls it made. Large record exports
+can be streamed as CSV and parsed a chunk at a time into typed columns.
+"""
+
+import os
+import time
+import threading
+import requests
+import pandas as pd
+from contextlib import closing
+from collections import namedtuple
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Projects hosted somewhere other than the default REDCAP_API_URL server
+PROJECT_URL_ENV = {
+    'HCT': 'HCT_REDCAP_API_URL',
+    'Cascadia': 'HCT_REDCAP_API_URL',
+    'AIRS': 'AIRS_REDCAP_API_URL',
+}
+
+# Rows of a streamed CSV export parsed at a time
+CSV_CHUNK_SIZE = 10000
+
+CallMetric = namedtuple('CallMetric',
+                        ['host', 'content', 'status', 'seconds', 'bytes', 'attempts'])
+
+
+def project_url(project):
+    return urlparse(os.environ.get(PROJECT_URL_ENV.get(project, 'REDCAP_API_URL')))
+
+
+def project_token(url, project_id):
+    return os.environ.get(f"REDCAP_API_TOKEN_{url.netloc}_{project_id}")
+
+
+class RedcapClient:
+    def __init__(self, max_retries=3, backoff=0.5, gzip=True, pool_size=8):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.gzip = gzip
+        self.pool_size = pool_size
+        self.metrics = []
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        '''The pooled session for the host of `url`, created on first use'''
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                session.headers['Accept-Encoding'] = 'gzip' if self.gzip else 'identity'
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def post(self, url, data, stream=False):
+        '''POST `data` to a REDCap API `url`, retrying connection errors and server errors'''
+        session = self.session(url)
+        start = time.perf_counter()
+
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                r = session.post(url, data=data, stream=stream)
+                if r.status_code < 500 or attempt == self.max_retries:
+                    break
+                r.close()
+                print(f'REDCap returned {r.status_code}, retrying request')
+            except requests.exceptions.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                print('Failed to connect to REDCap, retrying request')
+            time.sleep(self.backoff * 2**(attempt - 1))
+
+        # a streamed body has not been read yet, so only its transferred size is known
+        size = int(r.headers.get('Content-Length', 0)) if stream else len(r.content)
+        metric = CallMetric(urlparse(url).netloc, data.get('content'), r.status_code,
+                            time.perf_counter() - start, size, attempt)
+        with self._lock:
+            self.metrics.append(metric)
+        return r
+
+    def export(self, project, project_id, data):
+        '''
+        Make a request of `project`, resolving its API url and token, and return
+        the decoded JSON response.
+        '''
+        url = project_url(project)
+        data = dict(data, token=project_token(url, project_id))
+        r = self.post(url.geturl(), data)
+        r.raise_for_status()
+        return r.json()
+
+    def export_frame(self, project, project_id, data, **read_options):
+        '''
+        Make a request of `project` for a CSV export, parsing the streamed
+        response into a DataFrame as it arrives. `read_options` are passed to
+        `read_csv_frame`.
+        '''
+        url = project_url(project)
+        data = dict(data, token=project_token(url, project_id), format='csv')
+        with closing(self.post(url.geturl(), data, stream=True)) as r:
+            r.raise_for_status()
+            return read_response(r, **read_options)
+
+    def map(self, fn, items, max_workers=None):
+        '''Call `fn` on each of `items` concurrently, returning results in the order of `items`'''
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=max_workers or min(len(items), self.pool_size)) as executor:
+            return list(executor.map(fn, items))
+
+    def print_metrics(self):
+        if not self.metrics:
+            return
+        total_seconds = sum(m.seconds for m in self.metrics)
+        total_bytes = sum(m.bytes for m in self.metrics)
+        print('{: <30}{} calls, {:.2f}s, {:.1f} KB'.format(
+            'REDCap API:', len(self.metrics), total_seconds, total_bytes / 1024))
+        for m in sorted(self.metrics, key=lambda m: -m.seconds):
+            print('{: <30}{: <10}{: <6}{:>8.2f}s{:>10.1f} KB  attempts {}'.format(
+                m.host, str(m.content), m.status, m.seconds, m.bytes / 1024, m.attempts))
+
+
+def read_response(r, **read_options):
+    '''Parse the body of a streamed CSV export response with `read_csv_frame`'''
+    r.raw.decode_content = True
+    return read_csv_frame(r.raw, **read_options)
+
+
+def read_csv_frame(stream, dtype=None, categories=(), na_values=None, chunksize=CSV_CHUNK_SIZE):
+    '''
+    Parse a REDCap CSV export from the file-like `stream` a chunk at a time.
+
+    Every column is read as text, as in JSON exports, unless given another type
+    in `dtype`. Columns in `categories` are stored as categoricals. Blank cells
+    are kept as empty strings unless `na_values` includes `''`.
+    '''
+    chunks = []
+    try:
+        reader = pd.read_csv(stream,
+                             dtype=str,
+                             keep_default_na=False,
+                             na_values=na_values or [],
+                             chunksize=chunksize)
+        for chunk in reader:
+            chunks.append(typed_columns(chunk, dtype, categories))
+    except pd.errors.EmptyDataError:
+        # an export of no records and no fields has an empty body
+        pass
+    return concat_frames(chunks, categories)
+
+
+def typed_columns(frame, dtype=None, categories=()):
+    for column, column_type in (dtype or {}).items():
+        if column in frame:
+            frame[column] = frame[column].astype(column_type)
+    for column in categories:
+        if column in frame:
+            frame[column] = frame[column].astype('category')
+    return frame
+
+
+def concat_frames(frames, categories=()):
+    '''Concatenate `frames`, keeping each of `categories` a categorical over every frame's categories'''
+    frames = [f for f in frames if len(f.columns)]
+    if not frames:
+        return pd.DataFrame()
+
+    frames = [f.copy(deep=False) for f in frames]
+    for column in categories:
+        if not all(column in f and f[column].dtype == 'category' for f in frames):
+            continue
+        union = pd.api.types.union_categoricals([f[column] for f in frames]).categories
+        for f in frames:
+            f[column] = f[column].cat.set_categories(union)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Incremental REDCap record exports for the dashboard scripts.
+
+Records exported from a project are kept in a local snapshot together with a
+watermark of when they were last synced. Later syncs only ask REDCap for
+records modified since the watermark (via `dateRangeBegin`) and merge them
+into the snapshot, falling back to a full export every `full_sync_interval`
+so records which were deleted or no longer match the export's filter logic
+eventually drop out. Deleting a snapshot file forces a full export.
+
+Exports are kept either as JSON lists of records (`export_records`) or, for
+large projects, as DataFrames streamed from CSV exports and pickled
+(`export_frame`).
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import datetime
+import requests
+from contextlib import closing
+from redcap_client import read_response, concat_frames
+
+# REDCap compares `dateRangeBegin` against its own server time, so each sync
+# reaches back this far past the watermark to tolerate clock and timezone skew.
+SYNC_OVERLAP = datetime.timedelta(days=1)
+FULL_SYNC_INTERVAL = datetime.timedelta(days=7)
+REDCAP_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class RecordSnapshot:
+    def __init__(self,
+                 directory,
+                 full_sync_interval=FULL_SYNC_INTERVAL,
+                 overlap=SYNC_OVERLAP,
+                 post=requests.post):
+        self.directory = directory
+        self.full_sync_interval = full_sync_interval
+        self.overlap = overlap
+        self.post = post
+
+    def path(self, url, project_id, form_data, extension='json'):
+        '''Snapshot file for one export of a project, keyed by everything but its token'''
+        query = json.dumps({k: v for k, v in form_data.items() if k != 'token'}, sort_keys=True)
+        key = hashlib.sha256(f'{url}|{project_id}|{query}'.encode()).hexdigest()[:24]
+        netloc = url.split('://')[-1].split('/')[0]
+        return os.path.join(self.directory, f'records_{netloc}_{project_id}_{key}.{extension}')
+
+    def export_records(self, url, project_id, form_data, record_id_field='record_id', now=None):
+        '''
+        Return every record of the export described by `form_data`, fetching only
+        the records modified since the last sync when a recent snapshot exists.
+        '''
+        return self.sync(self.path(url, project_id, form_data), project_id, form_data,
+                         lambda data: self.fetch(url, data),
+                         lambda records, delta: merge_records(records, delta, record_id_field),
+                         record_id_field, now)
+
+    def export_frame(self, url, project_id, form_data, record_id_field='record_id', now=None, **read_options):
+        '''
+        Like `export_records`, but the records are streamed as CSV and returned
+        as a DataFrame. `read_options` are passed to `read_csv_frame`.
+        '''
+        form_data = dict(form_data, format='csv')
+        categories = read_options.get('categories', ())
+        # snapshots read with other column types are kept apart
+        key = dict(form_data, read_options=json.dumps(read_options, sort_keys=True, default=str))
+        return self.sync(self.path(url, project_id, key, 'pkl'), project_id, form_data,
+                         lambda data: self.fetch_frame(url, data, **read_options),
+                         lambda records, delta: merge_frames(records, delta, record_id_field, categories),
+                         record_id_field, now)
+
+    def sync(self, path, project_id, form_data, fetch, merge, record_id_field, now=None):
+        now = now or datetime.datetime.now()
+        snapshot = self.load(path)
+
+        form_data = dict(form_data)
+        if 'fields' in form_data and record_id_field not in form_data['fields'].split(','):
+            form_data['fields'] = f"{record_id_field},{form_data['fields']}"
+
+        if snapshot and now - snapshot['full_sync'] < self.full_sync_interval:
+            since = snapshot['watermark'] - self.overlap
+            print(f'Fetching records of project {project_id} modified since {since:{REDCAP_DATE_FORMAT}}')
+
+            form_data['dateRangeBegin'] = since.strftime(REDCAP_DATE_FORMAT)
+            delta = fetch(form_data)
+            records = merge(snapshot['records'], delta)
+            full_sync = snapshot['full_sync']
+        else:
+            print(f'Fetching all records of project {project_id}')
+            records = fetch(form_data)
+            full_sync = now
+
+        self.save(path, {'watermark': now, 'full_sync': full_sync, 'records': records})
+        return records
+
+    def fetch(self, url, form_data):
+        r = self.post(url, data=form_data)
+        r.raise_for_status()
+        return r.json()
+
+    def fetch_frame(self, url, form_data, **read_options):
+        with closing(self.post(url, data=form_data, stream=True)) as r:
+            r.raise_for_status()
+            return read_response(r, **read_options)
+
+    def load(self, path):
+        try:
+            if path.endswith('.pkl'):
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+            with open(path, 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            return None
+
+        for key in ('watermark', 'full_sync'):
+            snapshot[key] = datetime.datetime.fromisoformat(snapshot[key])
+        return snapshot
+
+    def save(self, path, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+
+        # write to a temporary file first so an interrupted sync keeps the old snapshot
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        if path.endswith('.pkl'):
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            snapshot = dict(snapshot,
+                            watermark=snapshot['watermark'].isoformat(),
+                            full_sync=snapshot['full_sync'].isoformat())
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+
+def merge_records(records, delta, record_id_field='record_id'):
+    '''
+    Replace every row of a record in `records` with the rows REDCap returned for
+    it in `delta`. REDCap exports all matching rows of a modified record, so
+    rows of records absent from `delta` are kept as they are.
+    '''
+    updated = set(str(row[record_id_field]) for row in delta)
+    return [row for row in records if str(row[record_id_field]) not in updated] + delta
+
+
+def merge_frames(records, delta, record_id_field='record_id', categories=()):
+    '''`merge_records` for DataFrames of records'''
+    if record_id_field not in records:
+        return delta
+    if record_id_field not in delta:
+        return records
+    updated = records[record_id_field].astype(str).isin(delta[record_id_field].astype(str))
+    return concat_frames([records[~updated], delta], categories)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Batched Google Sheets writes for the dashboard scripts.
+
+Instead of deleting every row of a tab and appending the whole dataset again,
+tables are staged for each worksheet of a spreadsheet and written together:
+the current contents of every staged tab are read in one request, tabs are
+grown to fit their new tables, only the rows which differ are written back in
+a single `values_batch_update`, and only then are leftover rows removed.
+"""
+
+import math
+import datetime
+
+# Largest number of cells sent in one values update, well under the API's request size limit
+MAX_CELLS_PER_REQUEST = 50000
+
+# Sheets stores dates as the number of days since this one
+SERIAL_EPOCH = datetime.datetime(1899, 12, 30)
+
+# Text Sheets turns into dates when written as USER_ENTERED
+ENTERED_DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y']
+
+
+class SheetSync:
+    def __init__(self, spreadsheet, max_cells=MAX_CELLS_PER_REQUEST):
+        self.spreadsheet = spreadsheet
+        self.max_cells = max_cells
+        self.tables = []
+
+    def stage(self, worksheet, rows, start_row=2):
+        '''Replace everything from `start_row` down in `worksheet` with `rows` on the next commit'''
+        self.tables.append((worksheet, start_row, [normalize_row(r) for r in rows]))
+
+    def commit(self):
+        '''Write every staged table, returning the number of cells sent'''
+        if not self.tables:
+            return 0
+
+        # tabs which were shrunk down to their header have nothing to read
+        read = [(ws, start) for ws, start, _ in self.tables if ws.row_count >= start]
+        current = {}
+        if read:
+            value_ranges = self.spreadsheet.values_batch_get(
+                [f'{sheet_range(ws)}!{start}:{ws.row_count}' for ws, start in read],
+                params={'valueRenderOption': 'UNFORMATTED_VALUE',
+                        'dateTimeRenderOption': 'SERIAL_NUMBER'})['valueRanges']
+            for (ws, start), old in zip(read, value_ranges):
+                current[(ws.id, start)] = old.get('values', [])
+
+        resizes, updates = [], []
+        for ws, start, rows in self.tables:
+            old_rows = [normalize_row(r) for r in current.get((ws.id, start), [])]
+            resizes.extend(resize_requests(ws, start, rows))
+            updates.extend(changed_ranges(ws, start, rows, old_rows))
+
+        # grow tabs before writing to them, but only drop rows once the new values are in
+        grows = [r for r in resizes if 'deleteDimension' not in r]
+        shrinks = [r for r in resizes if 'deleteDimension' in r]
+
+        if grows:
+            self.spreadsheet.batch_update({'requests': grows})
+
+        sent = 0
+        for data in chunk_ranges(updates, self.max_cells):
+            self.spreadsheet.values_batch_update(body={
+                'valueInputOption': 'USER_ENTERED',
+                'data': data
+            })
+            sent += sum(len(d['values']) * len(d['values'][0]) for d in data)
+
+        if shrinks:
+            self.spreadsheet.batch_update({'requests': shrinks})
+
+        print('{: <30}{} of {} rows changed'.format(
+            self.spreadsheet.title + ':',
+            sum(len(d['values']) for d in updates),
+            sum(len(rows) for _, _, rows in self.tables)))
+
+        self.tables = []
+        return sent
+
+
+def cell_a1(row, col):
+    '''A1 notation of the cell at 1-indexed `row` and `col`'''
+    label = ''
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        label = chr(ord('A') + remainder) + label
+    return f'{label}{row}'
+
+
+def normalize_row(row):
+    '''Render a row as the strings Sheets displays, without trailing blanks'''
+    row = [normalize_value(v) for v in row]
+    while row and row[-1] == '':
+        row.pop()
+    return row
+
+
+def normalize_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    if value is True or value is False:
+        return str(value).upper()
+    return str(value)
+
+
+def entered_value(value):
+    '''
+    The value Sheets stores for a normalized cell written as USER_ENTERED, as
+    read back unformatted: booleans, numbers, and dates as serial numbers.
+    '''
+    if value in ('TRUE', 'FALSE'):
+        return value == 'TRUE'
+    try:
+        number = float(value)
+        if math.isfinite(number):
+            return number
+    except ValueError:
+        pass
+    for date_format in ENTERED_DATE_FORMATS:
+        try:
+            date = datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        return (date - SERIAL_EPOCH) / datetime.timedelta(days=1)
+    return value
+
+
+def row_key(row):
+    '''A normalized row as Sheets stores it, so staged and unformatted rows compare equal'''
+    return [entered_value(v) for v in row]
+
+
+def sheet_range(worksheet):
+    return "'{}'".format(worksheet.title.replace("'", "''"))
+
+
+def resize_requests(worksheet, start, rows):
+    '''Requests fitting `worksheet` to exactly the rows of its new table'''
+    requests = []
+    last_row = start - 1 + len(rows)
+    width = max([len(r) for r in rows] + [1])
+
+    if last_row > worksheet.row_count:
+        requests.append({
+            'appendDimension': {
+                'sheetId': worksheet.id,
+                'dimension': 'ROWS',
+                'length': last_row - worksheet.row_count
+            }
+        })
+    elif last_row < worksheet.row_count:
+        requests.append({
+            'deleteDimension': {
+                'range': {
+                    'sheetId': worksheet.id,
+                    'dimension': 'ROWS',
+                    'startIndex': max(last_row, start - 1),
+                    'endIndex': worksheet.row_count
+                }
+            }
+        })
+
+    if width > worksheet.col_count:
+        requests.append({
+            'appendDimension': {
+                'sheetId': worksheet.id,
+                'dimension': 'COLUMNS',
+                'length': width - worksheet.col_count
+            }
+        })
+
+    return requests
+
+
+def changed_ranges(worksheet, start, rows, old_rows):
+    '''Value ranges covering each run of consecutive rows which differ from `old_rows`'''
+    ranges, run = [], []
+
+    def flush():
+        if not run:
+            return
+        first = run[0]
+        width = max(max(len(rows[i]), len(old_rows[i]) if i < len(old_rows) else 0) for i in run)
+        width = max(width, 1)
+        ranges.append({
+            'range': '{}!{}:{}'.format(sheet_range(worksheet),
+                                       cell_a1(start + first, 1),
+                                       cell_a1(start + run[-1], width)),
+            'values': [rows[i] + [''] * (width - len(rows[i])) for i in run]
+        })
+        run.clear()
+
+    for i, row in enumerate(rows):
+        old_row = old_rows[i] if i < len(old_rows) else []
+        if row_key(row) != row_key(old_row):
+            run.append(i)
+        else:
+            flush()
+    flush()
+
+    return ranges
+
+
+def chunk_ranges(ranges, max_cells):
+    '''Group value ranges into requests of at most `max_cells`, splitting ranges by row if needed'''
+    chunk, cells = [], 0
+
+    for r in ranges:
+        width = len(r['values'][0])
+        rows_per_part = max(max_cells // width, 1)
+        sheet, cells_range = r['range'].rsplit('!', 1)
+        first_row = int(''.join(c for c in cells_range.split(':')[0] if c.isdigit()))
+
+        for offset in range(0, len(r['values']), rows_per_part):
+            values = r['values'][offset:offset + rows_per_part]
+            if chunk and cells + len(values) * width > max_cells:
+                yield chunk
+                chunk, cells = [], 0
+            chunk.append({
+                'range': '{}!{}:{}'.format(sheet,
+                                           cell_a1(first_row + offset, 1),
+                                           cell_a1(first_row + offset + len(values) - 1, width)),
+                'values': values
+            })
+            cells += len(values) * width
+
+    if chunk:
+        yield chunk
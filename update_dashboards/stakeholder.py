@@ -5,6 +5,7 @@ import pandas as pd
 from pathlib import Path
 from datetime import datetime
 from oauth2client.service_account import ServiceAccountCredentials
+from sheet_sync import SheetSync
 
 base_dir = Path(__file__).resolve().parent.parent.resolve()
 
@@ -22,7 +23,7 @@ def main():
 	data.fillna('', inplace=True)
 	print(data.shape)
 
-	import_data(data.values.tolist(), sheet.worksheet('data'))
+	import_data(data.values.tolist(), sheet, sheet.worksheet('data'))
 
 	sheet.worksheet('update').update('A2', datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M'))
 
@@ -31,14 +32,14 @@ def get_gspread_client(auth_file):
 	creds = ServiceAccountCredentials.from_json_keyfile_name(auth_file, scope)
 	return(gspread.authorize(creds))
 
-def import_data(data, sheet):
+def import_data(data, spreadsheet, sheet):
 	print('Importing Data')
-	sheet.delete_rows(2, sheet.row_count)
+	sync = SheetSync(spreadsheet)
+	sync.stage(sheet, data)
 	try:
-		sheet.append_rows(data, value_input_option='USER_ENTERED')
-	except:
-		print('Error inserting data')
-		sheet.append_rows([['']])
+		sync.commit()
+	except Exception as e:
+		print(f'Error inserting data {e}')
 
 if __name__ == "__main__":
     main()
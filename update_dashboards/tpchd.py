@@ -2,15 +2,11 @@
 
 import os
 import sys
-import json
 import envdir
 import gspread
-import requests
 import xlsxwriter
 from datetime import datetime as dt
-import pandas as pd
 from pathlib import Path
-from urllib.parse import urlparse
 from oauth2client.service_account import ServiceAccountCredentials
 
 base_dir = os.path.abspath(__file__ + "/../../")
@@ -19,13 +15,16 @@ sys.path.append(base_dir)
 
 # pylint: disable=import-error, wrong-import-position
 from etc.scan_tphcd_dashboard_config import project_dict
+from redcap_sync import RecordSnapshot
+from redcap_client import RedcapClient, project_url, project_token, concat_frames
+from sheet_sync import SheetSync
+from zipcode_county import load_classifier
 
+redcap = RedcapClient()
+zipcodes = load_classifier()
 
-def main():
-    # config files for variable and zipcode mapping
-    with open(os.path.join(base_dir, 'etc/zipcode_county_map.json'), 'r') as f:
-        zipcode_county_map = json.load(f)
 
+def main():
     print("Connecting to Google Sheets")
     # creates conneciton to google sheets
     client = get_gspread_client(
@@ -37,21 +36,23 @@ def main():
 
     # Export all records from SCAN redcap
     print('Getting REDCap data')
-    data = pd.DataFrame(get_redcap_data())
-    data = data.replace('', pd.NA)
+    data = get_redcap_data()
 
     # Filter to pierce county by zipcode
-    data = filter_pierce(data, zipcode_county_map)
+    data = filter_pierce(data)
 
     # Import to SHARED_TPCHD_SCAN_Metrics Google Sheets
     print('Importing data')
-    import_prio_code(data, sheet.worksheet('Priority Code'))
+    sync = SheetSync(sheet)
+    import_prio_code(data, sheet.worksheet('Priority Code'), sync)
     import_enrollment(data, sheet.worksheet('Enrollment'))
-    import_zipcode(data, sheet.worksheet('Zipcode'))
-    import_age(data, sheet.worksheet('Age'))
-    import_positive(data, sheet.worksheet('Positive'))
+    import_zipcode(data, sheet.worksheet('Zipcode'), sync)
+    import_age(data, sheet.worksheet('Age'), sync)
+    import_positive(data, sheet.worksheet('Positive'), sync)
+    sync.commit()
 
     download_data(sheet)
+    redcap.print_metrics()
 
 
 def get_gspread_client(auth_file):
@@ -68,20 +69,20 @@ def get_redcap_data():
         'record_id', 'redcap_event_name', 'home_zipcode_2', 'priority_code',
         'age', 'date_tested', 'test_result', 'illness_q_date'
     ]
+    categories = ['redcap_event_name', 'priority_code', 'test_result']
     projects = ['SCAN English', 'SCAN Spanish', 'SCAN Vietnamese']
-    url = urlparse(os.environ.get("REDCAP_API_URL"))
-    data = []
+    snapshots = RecordSnapshot(os.path.join(base_dir, 'data/cache/redcap'),
+                               post=redcap.post)
 
-    for p in projects:
+    def get_project_data(p):
+        url = project_url(p)
         formData = {
             'token':
-            os.environ.get(
-                f"REDCAP_API_TOKEN_{url.netloc}_{project_dict[p]['project_id']}"
-            ),
+            project_token(url, project_dict[p]['project_id']),
             'content':
             'record',
             'format':
-            'json',
+            'csv',
             'type':
             'flat',
             'fields':
@@ -93,29 +94,33 @@ def get_redcap_data():
             'filterLogic':
             '[event-name][illness_q_date] <> ""'
         }
-        r = requests.post(url.geturl(), data=formData)
-        data.extend(r.json())
-    return (data)
+        # blank cells are read as missing values
+        return snapshots.export_frame(url.geturl(),
+                                      project_dict[p]['project_id'],
+                                      formData,
+                                      categories=categories,
+                                      na_values=[''])
+
+    return concat_frames(redcap.map(get_project_data, projects), categories)
 
 
-def filter_pierce(data, zipcode_county_map):
-    data = data.loc[data['home_zipcode_2'].isin(
-        zipcode_county_map['SCAN PIERCE'])]
+def filter_pierce(data):
     '''Due to the inclusion of zipcode 98092 in Pierce county, a date cutoff is needed in order to
 	remove past enrollments to this zipcode when it was defined as being part of King County'''
-    data = data[((data['home_zipcode_2'] == '98092') &
-                 (data['illness_q_date'] > '2021-09-16')) |
-                (data['home_zipcode_2'] != '98092')]
-    return (data)
+    data = data[zipcodes.is_pierce(data['home_zipcode_2'],
+                                   data['illness_q_date'])].copy()
+    # keep the zipcode out of span wrapped values, so they are grouped with the plain ones
+    data['home_zipcode_2'] = zipcodes.clean(data['home_zipcode_2'])
+    return data
 
 
-def import_prio_code(data, sheet):
+def import_prio_code(data, sheet, sync):
     print('Importing Priority Code Data')
     data = data.dropna(subset=['priority_code']).groupby(
         ['illness_q_date', 'priority_code'],
-        as_index=False).agg({'record_id': 'count'})
-    sheet.delete_rows(2, sheet.row_count)
-    sheet.append_rows(data.values.tolist(), value_input_option='USER_ENTERED')
+        as_index=False,
+        observed=True).agg({'record_id': 'count'})
+    sync.stage(sheet, data.values.tolist())
 
 
 def import_enrollment(data, sheet):
@@ -127,33 +132,31 @@ def import_enrollment(data, sheet):
                  value_input_option='USER_ENTERED')
 
 
-def import_zipcode(data, sheet):
+def import_zipcode(data, sheet, sync):
     print('Importing Zipcode Data')
     data = data.dropna(subset=['illness_q_date']).groupby(
         ['illness_q_date', 'home_zipcode_2'],
         as_index=False).agg({'record_id': 'count'})
-    sheet.delete_rows(2, sheet.row_count)
-    sheet.append_rows(data.values.tolist(), value_input_option='USER_ENTERED')
+    sync.stage(sheet, data.values.tolist())
 
 
-def import_age(data, sheet):
+def import_age(data, sheet, sync):
     print('Importing Age Data')
     data['age bucket'] = data['age'].apply(
         lambda row: get_age_bucket(int(row)))
     data = data.dropna(subset=['illness_q_date']).groupby(
         ['illness_q_date', 'age bucket'],
         as_index=False).agg({'record_id': 'count'})
-    sheet.delete_rows(2, sheet.row_count)
-    sheet.append_rows(data.values.tolist(), value_input_option='USER_ENTERED')
+    sync.stage(sheet, data.values.tolist())
 
 
-def import_positive(data, sheet):
+def import_positive(data, sheet, sync):
     print('Importing Positive Data')
     data = data.dropna(subset=['test_result']).groupby(
         ['illness_q_date', 'test_result'],
-        as_index=False).agg({'record_id': 'count'})
-    sheet.delete_rows(2, sheet.row_count)
-    sheet.append_rows(data.values.tolist(), value_input_option='USER_ENTERED')
+        as_index=False,
+        observed=True).agg({'record_id': 'count'})
+    sync.stage(sheet, data.values.tolist())
 
 
 def get_age_bucket(age):
@@ -177,12 +180,6 @@ def get_age_bucket(age):
         return ('unknown')
 
 
-#find next available row in a given sheet
-def next_available_row(worksheet):
-    str_list = list(filter(None, worksheet.col_values(1)))
-    return len(str_list) + 1
-
-
 #download the data in .xlsx format to be sent as attachment in weekly email
 def download_data(google_workbook):
     print('Exporting to .xlsx')
@@ -5,6 +5,7 @@ import gspread
 import csv
 
 from oauth2client.service_account import ServiceAccountCredentials
+from sheet_sync import SheetSync
 
 base_dir = Path(__file__).resolve().parent.parent.resolve()
 
@@ -20,9 +21,16 @@ def main():
         'Screening Method', 'VE Variant'
     ]
 
+    sync = SheetSync(sheet)
     for s in sheets:
         data = get_data(base_dir / f'data/{s.replace(" ","_").lower()}.csv')
-        import_data(data, sheet.worksheet(s))
+        import_data(data, sheet.worksheet(s), sync)
+
+    print('Importing Data')
+    try:
+        sync.commit()
+    except Exception as e:
+        print(f'Error inserting data {e}')
 
 
 def get_gspread_client(auth_file):
@@ -41,14 +49,8 @@ def get_data(file):
         return list(data)
 
 
-def import_data(data, sheet):
-    print('Importing Data')
-    sheet.delete_rows(2, sheet.row_count)
-    try:
-        sheet.append_rows(data, value_input_option='USER_ENTERED')
-    except:
-        print('Error inserting data')
-        sheet.append_rows([['']])
+def import_data(data, sheet, sync):
+    sync.stage(sheet, data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Classifies SCAN participants as King, Pierce or other county by zipcode.
+
+The zipcodes of each county are read once from `etc/zipcode_county_map.json`
+and whole Series of zipcodes are cleaned and labelled at a time.
+"""
+
+import re
+import json
+import pandas as pd
+from pathlib import Path
+from functools import lru_cache
+
+base_dir = Path(__file__).resolve().parent.parent.resolve()
+
+ZIPCODE_COUNTY_MAP = base_dir / 'etc/zipcode_county_map.json'
+
+KING = 'SCAN King'
+PIERCE = 'SCAN Pierce'
+OTHER = 'SCAN Other'
+
+# 98092 was counted as part of King County until this date, and as Pierce after it
+ZIPCODE_98092_CUTOFF = pd.Timestamp('2021-09-16')
+
+# SCAN language projects have dirty zipcode fields: <span lang='es'> 98115 </span>
+SPAN_ZIPCODE = re.compile(r'^<.*?([0-9]{5})')
+
+
+class ZipcodeClassifier:
+    def __init__(self, zipcode_county_map):
+        self.king = frozenset(zipcode_county_map['SCAN KING'])
+        self.pierce = frozenset(zipcode_county_map['SCAN PIERCE'])
+        # King is checked before Pierce, should a zipcode be listed under both
+        self.counties = pd.Series({
+            **{z: PIERCE for z in self.pierce},
+            **{z: KING for z in self.king}
+        }, dtype='object')
+
+    def clean(self, zipcodes):
+        '''`zipcodes` with the zipcode taken out of any span wrapped values'''
+        zipcodes = pd.Series(zipcodes, dtype='object')
+        extracted = zipcodes.str.extract(SPAN_ZIPCODE, expand=False)
+        return extracted.where(extracted.notna(), zipcodes)
+
+    def label(self, zipcodes, dates=None):
+        '''The SCAN project of each of `zipcodes`, placing 98092 by `dates` when given'''
+        zipcodes = self.clean(zipcodes)
+        labels = zipcodes.map(self.counties).fillna(OTHER)
+        if dates is not None:
+            after_cutoff = pd.to_datetime(pd.Series(dates, index=zipcodes.index),
+                                          errors='coerce') > ZIPCODE_98092_CUTOFF
+            is_98092 = zipcodes == '98092'
+            labels[is_98092] = PIERCE
+            labels[is_98092 & ~after_cutoff] = KING
+        return labels
+
+    def is_pierce(self, zipcodes, dates=None):
+        '''Mask of `zipcodes` in Pierce County, as of `dates` when given'''
+        return self.label(zipcodes, dates) == PIERCE
+
+
+@lru_cache(maxsize=None)
+def load_classifier(path=ZIPCODE_COUNTY_MAP):
+    '''The classifier for the zipcode county map at `path`, read once per run'''
+    with open(path, 'r') as f:
+        return ZipcodeClassifier(json.load(f))